@@ -1,28 +1,121 @@
 """
 DuckDB database manager module providing connection handling and query 
 execution. Implements singleton pattern and async operations for database 
-interactions.
+interactions. Additional workbooks are sharded into their own database files
+behind a registry of lazily opened handles.
 """
 
-try:
-    import pyarrow
-except ImportError as exc:
-    raise ImportError("Please install pyarrow: poetry add pyarrow") from exc
-
 import asyncio
+import contextlib
+import functools
+import os
+import re
 import threading
+import time
+from collections import OrderedDict
+
+import settings
+from backends import (
+    QueryHandle,
+    QueryTimeoutError,
+    backend_for_connection,
+    database_config,
+    execute_governed,
+    get_backend,
+)
+from formulas import FormulaEngine
+from hierarchy import HierarchyEngine
+from history import EditHistory
+from migrations import migrate
+from profiler import get_profiler
+from schema import (
+    KEY_COLUMNS,
+    MEASURE_COLUMNS,
+    ROLLUP_TIERS,
+    SUMMARY_SELECT,
+    SUMMARY_TABLE,
+    tier_select_sql,
+)
+
+# Workbook IDs become file names, so only a safe character set is accepted
+WORKBOOK_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def is_default_workbook(workbook_id):
+    """
+    Whether a workbook ID refers to the default sales_metrics database.
+    """
+    return workbook_id is None or workbook_id == settings.DEFAULT_WORKBOOK
+
 
-from adbc_driver_manager import dbapi
+def workbook_path(workbook_id):
+    """
+    Database file backing a workbook.
+    Raises:
+        ValueError: If the workbook ID contains unsupported characters
+    """
+    if is_default_workbook(workbook_id):
+        return settings.DATABASE_PATH
+    if not WORKBOOK_ID_PATTERN.match(workbook_id):
+        raise ValueError(f"Invalid workbook id: {workbook_id!r}")
+    return os.path.join(settings.WORKBOOK_DIR, f"{workbook_id}.duckdb")
+
+
+def query_class_limits(query_class):
+    """
+    Timeout and resource limits of a query class.
+    Interactive queries serve cell edits and must fail fast, bulk queries
+    rebuild summaries and export snapshots.
+
+    Args:
+        query_class: "interactive" or "bulk"
+    Returns:
+        Dict with the timeout in seconds and the threads / memory_limit to
+        run with (None keeps the database-wide setting)
+    """
+    if query_class == "interactive":
+        return {
+            "timeout": settings.INTERACTIVE_QUERY_TIMEOUT_SECONDS,
+            "threads": settings.INTERACTIVE_THREADS,
+            "memory_limit": settings.INTERACTIVE_MEMORY_LIMIT,
+        }
+    if query_class == "bulk":
+        return {
+            "timeout": settings.BULK_QUERY_TIMEOUT_SECONDS,
+            "threads": settings.BULK_THREADS,
+            "memory_limit": settings.BULK_MEMORY_LIMIT,
+        }
+    raise ValueError(f"Unknown query class: {query_class!r}")
 
 
 class DuckDBManager:
     """
     Singleton class managing DuckDB database connections and operations.
     Provides synchronous and asynchronous query execution capabilities.
+
+    `DuckDBManager()` returns the handle of the default workbook, while
+    `DuckDBManager.for_workbook(workbook_id)` returns the handle of another
+    workbook's database file. Those handles are kept in an LRU registry with
+    a cap on open files and idle eviction, so independent workbooks each get
+    their own writer and can be updated in parallel.
+
+    Statements on one handle run one at a time, each under the timeout and
+    thread / memory limits of its query class, and can be interrupted.
     """
     _instance = None
     _lock = threading.Lock()
+    _workbooks = OrderedDict()  # workbook_id -> handle, least recent first
+    _opening = {}  # workbook_id -> lock held while its file is opened
     conn = None  # Initialize conn attribute
+    backend = None  # Driver backend the connection was opened with
+    workbook_id = None
+    last_used = 0.0
+    in_flight = 0
+    pinned = 0  # Requests holding the handle, see `acquire`
+    _execution_lock = None
+    _applied_limits = None
+    _transaction_cursor = None
+    _transaction_handle = None
 
     def __new__(cls):
         """
@@ -31,18 +124,204 @@ class DuckDBManager:
         if not cls._instance:
             with cls._lock:
                 if not cls._instance:
-                    # Modify the path and entrypoint for ADBC connection
-                    cls._instance = super(DuckDBManager, cls).__new__(cls)
-                    cls._instance.conn = dbapi.connect(
-                        driver=(
-                            "C:/Users/svatt/libduckdb-windows-amd64/"
-                            "duckdb.dll"
-                        ),
-                        entrypoint="duckdb_adbc_init",
-                        db_kwargs={"path": "sales_metrics.duckdb"}
-                    )
+                    cls._instance = cls._open(settings.DEFAULT_WORKBOOK)
         return cls._instance
 
+    @classmethod
+    def _connect(cls, path):
+        """
+        Open a connection to the DuckDB database file at `path` through the
+        configured driver backend (ADBC or native duckdb).
+        """
+        return get_backend().connect(path)
+
+    @classmethod
+    def _open(cls, workbook_id):
+        """
+        Create a handle with an open connection for a workbook.
+        """
+        path = workbook_path(workbook_id)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        instance = super(DuckDBManager, cls).__new__(cls)
+        instance._bind(cls._connect(path), workbook_id)
+        # Bring files written by older versions up to the current schema
+        migrate(instance)
+        return instance
+
+    def _bind(self, conn, workbook_id):
+        """
+        Attach an open connection and reset the per-handle state.
+        """
+        self.conn = conn
+        self.backend = backend_for_connection(conn)
+        self.workbook_id = workbook_id
+        self.last_used = time.monotonic()
+        self.in_flight = 0
+        self.pinned = 0
+        self._execution_lock = threading.RLock()
+        self._transaction_cursor = None
+        self._transaction_handle = None
+        self._applied_limits = {
+            setting: value for setting, value in database_config().items()
+            if setting in ("threads", "memory_limit")
+        }
+
+    @classmethod
+    def for_workbook(cls, workbook_id=None, pin=False):
+        """
+        Return the handle of a workbook, opening its database file lazily.
+        Evicts idle handles, and the least recently used handle when the
+        number of open files would exceed the configured cap.
+
+        Args:
+            workbook_id: Workbook to route to, None for the default workbook
+            pin: Pin the handle against eviction until `release` is called
+        Returns:
+            DuckDBManager instance bound to the workbook's database file
+        """
+        if is_default_workbook(workbook_id):
+            handle = cls()
+            if pin:
+                with cls._lock:
+                    handle.pinned += 1
+            return handle
+        workbook_path(workbook_id)  # Validate before touching the registry
+
+        handle = cls._checkout(workbook_id, pin)
+        if handle is not None:
+            return handle
+        # Files are opened and migrated outside the registry lock, so a slow
+        # shard does not hold up the others; concurrent requests for the same
+        # shard wait for the one opening it
+        with cls._lock:
+            opening = cls._opening.setdefault(workbook_id, threading.Lock())
+        try:
+            with opening:
+                handle = cls._checkout(workbook_id, pin)
+                if handle is None:
+                    handle = cls._open(workbook_id)
+                    with cls._lock:
+                        cls._evict_to_capacity_locked(
+                            settings.MAX_OPEN_WORKBOOKS - 1
+                        )
+                        cls._workbooks[workbook_id] = handle
+                        if pin:
+                            handle.pinned += 1
+                    print(f"Opened workbook database: {workbook_id}")
+        finally:
+            with cls._lock:
+                if cls._opening.get(workbook_id) is opening:
+                    del cls._opening[workbook_id]
+        return handle
+
+    @classmethod
+    def _checkout(cls, workbook_id, pin):
+        """
+        Open handle of a workbook marked as used, and pinned if requested.
+        Returns:
+            The handle, or None if the workbook is not open
+        """
+        with cls._lock:
+            cls._evict_idle_locked()
+            handle = cls._workbooks.get(workbook_id)
+            if handle is not None:
+                cls._workbooks.move_to_end(workbook_id)
+                handle.last_used = time.monotonic()
+                if pin:
+                    handle.pinned += 1
+            return handle
+
+    @classmethod
+    def release(cls, handle):
+        """
+        Unpin a handle returned by `for_workbook(..., pin=True)`.
+        """
+        with cls._lock:
+            handle.pinned -= 1
+            handle.last_used = time.monotonic()
+
+    @classmethod
+    @contextlib.contextmanager
+    def acquire(cls, workbook_id=None):
+        """
+        Hold a workbook handle for a whole request. The handle is not closed
+        by eviction between the statements of the request, only once every
+        request holding it is done.
+        """
+        handle = cls.for_workbook(workbook_id, pin=True)
+        try:
+            yield handle
+        finally:
+            cls.release(handle)
+
+    @property
+    def busy(self):
+        """
+        Whether a request holds the handle or a query runs on it.
+        """
+        return bool(self.pinned or self.in_flight)
+
+    @classmethod
+    def _evict_locked(cls, workbook_id):
+        """
+        Close and forget a workbook handle. Caller holds `_lock`.
+        """
+        handle = cls._workbooks.pop(workbook_id)
+        try:
+            handle.conn.close()
+        except Exception as e:
+            print(f"Error closing workbook {workbook_id}: {e}")
+        print(f"Closed workbook database: {workbook_id}")
+
+    @classmethod
+    def _evict_idle_locked(cls):
+        """
+        Close handles unused for longer than the idle timeout.
+        """
+        cutoff = time.monotonic() - settings.WORKBOOK_IDLE_SECONDS
+        for workbook_id, handle in list(cls._workbooks.items()):
+            if handle.last_used < cutoff and not handle.busy:
+                cls._evict_locked(workbook_id)
+
+    @classmethod
+    def _evict_to_capacity_locked(cls, capacity):
+        """
+        Close least recently used idle handles until at most `capacity`
+        remain open. Handles pinned by a request or with queries in flight
+        are never closed.
+        """
+        for workbook_id, handle in list(cls._workbooks.items()):
+            if len(cls._workbooks) <= capacity:
+                break
+            if not handle.busy:
+                cls._evict_locked(workbook_id)
+
+    @classmethod
+    def evict_idle(cls):
+        """
+        Close workbook handles that exceeded the idle timeout.
+        """
+        with cls._lock:
+            cls._evict_idle_locked()
+
+    @classmethod
+    def open_workbooks(cls):
+        """
+        IDs of the workbook handles currently open, least recent first.
+        """
+        with cls._lock:
+            return list(cls._workbooks)
+
+    @classmethod
+    def close_all(cls):
+        """
+        Close every open workbook handle (the default handle is kept).
+        """
+        with cls._lock:
+            cls._evict_to_capacity_locked(0)
+
     @classmethod
     def set_instance_for_testing(cls, conn):
         """
@@ -50,48 +329,229 @@ class DuckDBManager:
         """
         with cls._lock:
             cls._instance = super(DuckDBManager, cls).__new__(cls)
-            cls._instance.conn = conn
+            cls._instance._bind(conn, settings.DEFAULT_WORKBOOK)
+
+    def _apply_query_class(self, limits):
+        """
+        Switch the database's thread and memory limits to those of a query
+        class. DuckDB applies these settings database-wide, which is safe
+        because statements on a handle are serialized.
+        """
+        base = database_config()
+        for setting in ("threads", "memory_limit"):
+            value = limits[setting] or base.get(setting)
+            if self._applied_limits.get(setting) == value:
+                continue
+            statement = (
+                f"RESET {setting};" if value is None
+                else f"SET {setting} = '{value}';"
+            )
+            self.backend.execute(self.conn, statement,
+                                 cursor=self._transaction_cursor)
+            self._applied_limits[setting] = value
 
-    def execute_query(self, query, params=None):
+    def execute_query(self, query, params=None, timeout=None,
+                      query_class="interactive", handle=None):
         """
         Synchronous query execution returning PyArrow table.
+        Args:
+            query: SQL query string to execute
+            params: Optional query parameters
+            timeout: Seconds before the query is interrupted, defaults to
+                the timeout of its query class (0 disables it)
+            query_class: "interactive" or "bulk" resource limits
+            handle: Optional QueryHandle used to cancel the query, defaults
+                to the handle of the transaction in progress
+        Raises:
+            QueryTimeoutError: If the query ran out of time
+            QueryCancelledError: If the query was cancelled
         """
+        limits = query_class_limits(query_class)
+        timeout = limits["timeout"] if timeout is None else timeout
+        deadline = time.monotonic() + timeout if timeout else None
+
+        # Waiting for a long-running statement counts against the budget
+        if not self._execution_lock.acquire(timeout=timeout or -1):
+            raise QueryTimeoutError(
+                f"Timed out after {timeout}s waiting for the connection."
+            )
+        self.in_flight += 1
+        self.last_used = time.monotonic()
+        handle = handle or self._transaction_handle or QueryHandle()
         try:
-            with self.conn.cursor() as cursor:
-                print(f"Executing query: {query}")
-                cursor.execute(query, params or [])
-                self.conn.commit()
-                print("Query executed successfully.")
-                return cursor.fetch_arrow_table()  # Return PyArrow table
+            self._apply_query_class(limits)
+            remaining = (
+                max(0.001, deadline - time.monotonic()) if deadline else None
+            )
+            print(f"Executing query: {query}")
+            profiler = get_profiler()
+            # Slow statements are only known once they ran, so every
+            # statement is profiled while plans are captured
+            profile = {} if profiler.captures_plans() else None
+            started = time.perf_counter()
+            result = execute_governed(self.backend, self.conn, query, params,
+                                      remaining, handle,
+                                      self._transaction_cursor, profile)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            print("Query executed successfully.")
+            if profiler.is_slow(elapsed_ms):
+                self._profile_query(profiler, query, elapsed_ms, query_class,
+                                    (profile or {}).get("plan"))
+            return result  # Return PyArrow table
         except Exception as e:
             print(f"Error during query execution: {e}")
             raise
+        finally:
+            self.in_flight -= 1
+            self._execution_lock.release()
+
+    def _profile_query(self, profiler, query, elapsed_ms, query_class,
+                       plan):
+        """
+        Record a slow statement with the DuckDB profile of its run, which
+        the profiler keeps when it is the slowest run of its shape.
+        """
+        if plan is not None and not profiler.has_plan(query):
+            plan = None
+        profiler.record(query, elapsed_ms, query_class=query_class,
+                        workbook_id=self.workbook_id, plan=plan,
+                        plan_kind="profile" if plan is not None else None)
 
-    async def execute_query_async(self, query, params=None):
+    async def execute_query_async(self, query, params=None, timeout=None,
+                                  query_class="interactive"):
         """
         Asynchronously executes a database query using an event loop.
+        Cancelling the awaiting task interrupts the query in DuckDB instead
+        of leaving the executor thread running.
+
         Args:
             query: SQL query string to execute
             params: Optional query parameters
+            timeout: Seconds before the query is interrupted
+            query_class: "interactive" or "bulk" resource limits
         Returns:
             PyArrow table with query results
         """
+        handle = QueryHandle()
         try:
             loop = asyncio.get_event_loop()
-            return await loop.run_in_executor(None, self.execute_query,
-                                              query, params)
+            return await loop.run_in_executor(
+                None,
+                functools.partial(
+                    self.execute_query, query, params, timeout=timeout,
+                    query_class=query_class, handle=handle
+                )
+            )
+        except asyncio.CancelledError:
+            handle.cancel()
+            print("Async query cancelled, interrupted DuckDB statement.")
+            raise
         except Exception as e:
             print(f"Error during async query execution: {e}")
             raise
 
+    async def _run_cancellable(self, method, *args):
+        """
+        Run a transactional method in an executor with one QueryHandle
+        passed through all of its statements. Cancelling the awaiting task
+        interrupts the DuckDB statement running at the time and rolls the
+        transaction back, like `execute_query_async`.
+        """
+        handle = QueryHandle()
+        try:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                None, functools.partial(method, *args, handle=handle)
+            )
+        except asyncio.CancelledError:
+            handle.cancel()
+            print("Async transaction cancelled, interrupted DuckDB statement.")
+            raise
+
+    @contextlib.contextmanager
+    def transaction(self, handle=None):
+        """
+        Run the statements issued in the block as one transaction.
+        Holds the handle for the whole block, so statements from other
+        threads wait until it commits or rolls back. Nested blocks join the
+        outer transaction. Must be used from a single thread, e.g. inside a
+        method run in an executor.
+
+        Args:
+            handle: Optional QueryHandle shared by every statement of the
+                transaction; cancelling it interrupts the running statement
+                and refuses the next ones, rolling the transaction back
+        """
+        with self._execution_lock:
+            if self._transaction_cursor is not None:
+                yield self
+                return
+            self.in_flight += 1
+            cursor = self.backend.begin(self.conn)
+            self._transaction_cursor = cursor
+            self._transaction_handle = handle
+            try:
+                yield self
+            except BaseException:
+                self._transaction_cursor = None
+                self.backend.rollback(self.conn, cursor)
+                print("Transaction rolled back.")
+                raise
+            else:
+                self._transaction_cursor = None
+                self.backend.commit(self.conn, cursor)
+            finally:
+                self._transaction_cursor = None
+                self._transaction_handle = None
+                cursor.close()
+                self.in_flight -= 1
+
+    @contextlib.contextmanager
+    def read_snapshot(self, query_class="bulk"):
+        """
+        Run the reads issued in the block in one transaction, so all of them
+        see the same MVCC snapshot of the database. With independent
+        cursors (native) the reads run on a cursor of their own without
+        holding the handle, so edits carry on meanwhile; otherwise (ADBC)
+        the handle is held for the block like in `transaction`.
+
+        Yields:
+            Function running a query and its optional parameters in the
+            snapshot and returning a PyArrow table
+        """
+        if not self.backend.independent_cursors:
+            with self.transaction():
+                yield functools.partial(self.execute_query,
+                                        query_class=query_class)
+            return
+
+        timeout = query_class_limits(query_class)["timeout"] or None
+        with self._execution_lock:
+            cursor = self.backend.begin(self.conn)
+            self.in_flight += 1
+
+        def execute(query, params=None):
+            print(f"Executing snapshot query: {query}")
+            return execute_governed(self.backend, self.conn, query, params,
+                                    timeout, cursor=cursor)
+
+        try:
+            yield execute
+        finally:
+            # Nothing was written, so the snapshot is simply discarded
+            self.backend.rollback(self.conn, cursor)
+            cursor.close()
+            with self._execution_lock:
+                self.in_flight -= 1
+
     def adbc_ingest(self, table_name, arrow_table):
         """
-        Ingest data into a DuckDB table using ADBC.
+        Ingest data into a new DuckDB table from a PyArrow table, using
+        ADBC bulk ingestion or the native Arrow scan depending on backend.
         """
-        with self.conn.cursor() as cursor:
-            print(f"Ingesting data into table: {table_name}")  # Debug
-            cursor.adbc_ingest(table_name, arrow_table)
-            print(f"Data ingested into {table_name}.")  # Debug
+        print(f"Ingesting data into table: {table_name}")  # Debug
+        self.backend.ingest(self.conn, table_name, arrow_table)
+        print(f"Data ingested into {table_name}.")  # Debug
 
     def update_dependencies(self, table, column, value, condition):
         """
@@ -107,194 +567,348 @@ class DuckDBManager:
             )
             self.recalculate_summary()
 
-    def recalculate_summary(self):
+    def _merge_rows(self, table, key_columns, source, where="", params=None,
+                    query_class="interactive"):
         """
-        Recalculate the sales_summary_by_product_family table.
+        Make the rows of `table` matching `where` equal to the rows of the
+        `source` SELECT: update the measures of existing keys, delete stale
+        keys and insert missing ones. DuckDB rejects deleting and inserting
+        the same key of a unique index within one transaction, so rows are
+        never replaced by DELETE + INSERT.
+
+        Args:
+            table: Summary or rollup tier table
+            key_columns: Columns identifying a row; NULLs match NULLs
+            source: SELECT producing the fresh rows of the restricted scope
+            where: Optional WHERE clause restricting the target rows
+            params: Numbered parameters shared by `source` and `where`
+            query_class: Query class of the statements
         """
+        match = " AND ".join(
+            f"{table}.{column} IS NOT DISTINCT FROM fresh.{column}"
+            for column in key_columns
+        )
+        measures = ", ".join(
+            f"{column} = fresh.{column}" for column in MEASURE_COLUMNS
+        )
+        changed = " OR ".join(
+            f"{table}.{column} IS DISTINCT FROM fresh.{column}"
+            for column in MEASURE_COLUMNS
+        )
         self.execute_query(
-            """
-            DELETE FROM sales_summary_by_product_family;
-            INSERT INTO sales_summary_by_product_family
-            SELECT
-                p.supplier,
-                p.brand,
-                p.family,
-                STRFTIME(CAST(s.invoice_date AS DATE), '%Y-%m') AS
-                invoice_date_month,
-                SUM(s.quantity) AS quantity,
-                SUM(s.net_price) AS net_amount,
-                GROUPING_ID(p.supplier, p.brand, p.family) AS grouping_set_id
-            FROM sales s
-            JOIN product p ON s.product_id = p.product_id
-            GROUP BY GROUPING SETS (
-                (p.supplier, p.brand, p.family, STRFTIME(CAST(s.invoice_date
-                AS DATE), '%Y-%m')),
-                (p.supplier, p.brand, STRFTIME(CAST(s.invoice_date AS DATE),
-                '%Y-%m')),
-                (p.supplier, STRFTIME(CAST(s.invoice_date AS DATE), '%Y-%m'))
+            f"""
+            UPDATE {table} SET {measures}
+            FROM ({source}) AS fresh
+            WHERE {match} AND ({changed});
+            """,
+            params,
+            query_class=query_class
+        )
+        stale = f"{where} AND" if where else "WHERE"
+        self.execute_query(
+            f"""
+            DELETE FROM {table} {stale} NOT EXISTS (
+                SELECT 1 FROM ({source}) AS fresh WHERE {match}
             );
-        """
+            """,
+            params,
+            query_class=query_class
+        )
+        self.execute_query(
+            f"""
+            INSERT INTO {table}
+            SELECT * FROM ({source}) AS fresh
+            WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {match});
+            """,
+            params,
+            query_class=query_class
         )
 
-    def proportional_rebalance(self, level, supplier, brand, family,
-                               new_value):
+    def recalculate_summary(self):
         """
-        Rebalance child values proportionally based on a new parent value.
+        Recalculate the sales_summary_by_product_family table, its
+        quarter / year rollup tiers and its formula cells. The undo history
+        is cleared because its deltas refer to the replaced rows.
         """
-        # Fetch current child values
-        children = self.execute_query(
-            f"""
-            SELECT grouping_set_id, quantity
-            FROM sales_summary_by_product_family
-            WHERE grouping_set_id > {level} -- Only fetch child levels
-            AND supplier = '{supplier}'
-            AND brand = '{brand}'
-            AND family = '{family}';
-            """
+        with self.transaction():
+            self._merge_rows(SUMMARY_TABLE, KEY_COLUMNS[SUMMARY_TABLE],
+                             SUMMARY_SELECT, query_class="bulk")
+            EditHistory(self).clear()
+            self.refresh_rollup_tiers()
+            self.recalculate_formulas()
+
+    def refresh_rollup_tiers(self, supplier=None, month=None, handle=None):
+        """
+        Rebuild the quarter and year rollup tiers from the monthly summary.
+        Restricting to a supplier and / or month only rewrites the tier
+        rows that cover them instead of the whole tier.
+
+        Args:
+            supplier: Optional supplier whose rows changed
+            month: Optional date (or ISO date string) of the changed month
+            handle: Optional QueryHandle cancelling the refresh
+        """
+        # A full rebuild is bulk work, a targeted one serves an edit
+        query_class = (
+            "bulk" if supplier is None and month is None else "interactive"
         )
+        with self.transaction(handle):
+            for tier, spec in ROLLUP_TIERS.items():
+                self._refresh_tier(tier, spec, supplier, month, query_class)
 
-        total_quantity = sum(child[1] for child in children)
-        for child_level, child_quantity in children:
-            proportion = (
-                child_quantity / total_quantity
-                if total_quantity
-                else 1 / len(children)
+    def _refresh_tier(self, tier, spec, supplier, month, query_class):
+        """
+        Merge the fresh rows of one rollup tier, restricted to a supplier
+        and / or month.
+        """
+        column = spec["column"]
+        filters, tier_filters, params = [], [], []
+        if supplier is not None:
+            params.append(supplier)
+            filters.append(f"supplier = ${len(params)}")
+            tier_filters.append(f"supplier = ${len(params)}")
+        if month is not None:
+            params.append(month)
+            filters.append(
+                f"DATE_TRUNC('{tier}', invoice_date_month) = "
+                f"DATE_TRUNC('{tier}', CAST(${len(params)} AS DATE))"
             )
-            new_child_value = new_value * proportion
-
-            # Update child quantities
-            self.execute_query(
-                f"""
-                UPDATE sales_summary_by_product_family
-                SET quantity = {new_child_value}
-                WHERE grouping_set_id = {child_level}
-                AND supplier = '{supplier}'
-                AND brand = '{brand}'
-                AND family = '{family}';
-                """
+            tier_filters.append(
+                f"{column} = "
+                f"DATE_TRUNC('{tier}', CAST(${len(params)} AS DATE))"
             )
 
-    async def proportional_rebalance_async(self, level, new_value):
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        tier_where = (
+            f"WHERE {' AND '.join(tier_filters)}" if tier_filters else ""
+        )
+        self._merge_rows(
+            spec["table"],
+            ["supplier", "brand", "family", column, "grouping_set_id"],
+            tier_select_sql(tier, where),
+            tier_where,
+            params,
+            query_class=query_class
+        )
+
+    async def refresh_rollup_tiers_async(self, supplier=None, month=None):
         """
-        Asynchronously rebalance children proportionally on new parent value.
+        Asynchronously rebuild the rollup tiers using an event loop.
         """
-        try:
-            loop = asyncio.get_event_loop()
-          
-            # Fetch current child values
-            children = await loop.run_in_executor(
-                None,
-                self.execute_query,
-                f"""
-                SELECT grouping_set_id, quantity
-                FROM sales_summary_by_product_family
-                WHERE grouping_set_id > {level};
-                """
-            )
+        return await self._run_cancellable(self.refresh_rollup_tiers,
+                                           supplier, month)
 
-            # Convert PyArrow scalars to native Python types
-            children = [
-                (
-                    child[0].as_py() if hasattr(child[0], "as_py")
-                    else child[0],
-                    child[1].as_py() if hasattr(child[1], "as_py")
-                    else child[1]
-                )
-                for child in children
-            ]
-
-            total_quantity = sum(child[1] for child in children)
-            tasks = []
-            for child_level, child_quantity in children:
-                proportion = (
-                    child_quantity / total_quantity
-                    if total_quantity
-                    else 1 / len(children)
-                )
-                new_child_value = new_value * proportion
-
-                # Update child quantities asynchronously
-                tasks.append(
-                    loop.run_in_executor(
-                        None,
-                        self.execute_query,
-                        f"""
-                        UPDATE sales_summary_by_product_family
-                        SET quantity = {new_child_value}
-                        WHERE grouping_set_id = {child_level};
-                        """
-                    )
-                )
-             
-            # Wait for all updates to complete
-            await asyncio.gather(*tasks)
-        except Exception as e:
-            print(f"Error during proportional rebalance: {e}")
-            raise
+    def refresh_rollup_tiers_for_keys(self, keys, handle=None):
+        """
+        Refresh only the rollup tier buckets covering the given summary keys.
+        Args:
+            keys: Dicts with at least `supplier` and `invoice_date_month`
+            handle: Optional QueryHandle cancelling the refresh
+        """
+        buckets = {
+            (key.get("supplier"), key.get("invoice_date_month"))
+            for key in keys
+        }
+        with self.transaction(handle):
+            for supplier, month in sorted(buckets, key=str):
+                self.refresh_rollup_tiers(supplier, month)
+
+    async def refresh_rollup_tiers_for_keys_async(self, keys):
+        """
+        Asynchronously refresh the rollup tier buckets of the given keys.
+        """
+        return await self._run_cancellable(
+            self.refresh_rollup_tiers_for_keys, keys
+        )
 
-    def rollup_to_parents(self, level):
+    def edit_nodes(self, column, keys, value, mode="proportional",
+                   handle=None):
         """
-        Rollup changes from a given level to higher levels.
-        Aggregates quantity and net_amount to the next higher level.
-      
+        Set summary nodes to a new value, split it down each node's subtree
+        and recompute each node's ancestors, then refresh the rollup tier
+        buckets they fall into and the formulas depending on the changed
+        cells. Everything commits as one transaction and only the edited
+        subtrees, their ancestors, their tier buckets and their dependent
+        formula cells are touched.
+
         Args:
-            level: The hierarchical level to rollup from
+            column: Measure column edited (quantity or net_amount)
+            keys: Summary keys (supplier, brand, family, invoice_date_month,
+                grouping_set_id) of the edited nodes
+            value: New numeric value of the nodes
+            mode: "proportional" (equal when the children sum to zero) or
+                "equal" split to the children
+            handle: Optional QueryHandle cancelling the edit
+        Returns:
+            Dict with the `edit_id` in the undo history and the recomputed
+            `formulas` and their `formula_keys`, None if no keys were given
         """
-        self.execute_query(
-            f"""
-            UPDATE sales_summary_by_product_family
-            SET quantity = (
-                SELECT SUM(quantity)
-                FROM sales_summary_by_product_family AS child
-                WHERE child.grouping_set_id < {level} -- Rollup
-                from lower levels
-                AND child.supplier = sales_summary_by_product_family.supplier
-                AND child.brand = sales_summary_by_product_family.brand
-                AND child.family = sales_summary_by_product_family.family
-            ),
-            net_amount = (
-                SELECT SUM(net_amount)
-                FROM sales_summary_by_product_family AS child
-                WHERE child.grouping_set_id < {level}
-                AND child.supplier = sales_summary_by_product_family.supplier
-                AND child.brand = sales_summary_by_product_family.brand
-                AND child.family = sales_summary_by_product_family.family
-            )
-            WHERE grouping_set_id = {level};
-            """
+        if not keys:
+            return None
+        with self.transaction(handle):
+            history = EditHistory(self)
+            edit_id = history.begin_edit(column, keys)
+            HierarchyEngine(self).edit(column, keys, value, mode)
+            history.end_edit(edit_id, column)
+            self.refresh_rollup_tiers_for_keys(keys)
+            recalculated = FormulaEngine(self).recalculate_edit(edit_id)
+        return {"edit_id": edit_id, **recalculated}
+
+    async def edit_nodes_async(self, column, keys, value,
+                               mode="proportional"):
+        """
+        Asynchronously edit summary nodes using an event loop.
+        """
+        return await self._run_cancellable(
+            self.edit_nodes, column, keys, value, mode
         )
 
-    def equal_rebalance(self, level, supplier, brand, family, new_value):
+    def edit_nodes_where(self, column, condition, value,
+                         mode="proportional", handle=None):
         """
-        Rebalance children equally if all child values are zero.
+        Edit the summary nodes matching a free-form SQL condition.
+        Returns:
+            Dict like `edit_nodes` with the summary `keys` of the edited
+            nodes, only the (empty) `keys` if no node matched
         """
-        children = self.execute_query(
-            f"""
-            SELECT grouping_set_id
-            FROM sales_summary_by_product_family
-            WHERE grouping_set_id > {level}
-            AND supplier = '{supplier}'
-            AND brand = '{brand}'
-            AND family = '{family}';
-            """
+        columns = ", ".join(KEY_COLUMNS[SUMMARY_TABLE])
+        with self.transaction(handle):
+            keys = self.execute_query(
+                f"SELECT DISTINCT {columns} FROM {SUMMARY_TABLE} "
+                f"WHERE {condition};"
+            ).to_pylist()
+            edited = self.edit_nodes(column, keys, value, mode)
+        return {"keys": keys, **(edited or {})}
+
+    async def edit_nodes_where_async(self, column, condition, value,
+                                     mode="proportional"):
+        """
+        Asynchronously edit the summary nodes matching a SQL condition.
+        """
+        return await self._run_cancellable(
+            self.edit_nodes_where, column, condition, value, mode
         )
 
-        equal_value = new_value / len(children)
-        for child_level in children:
-            self.execute_query(
-                f"""
-                UPDATE sales_summary_by_product_family
-                SET quantity = {equal_value}
-                WHERE grouping_set_id = {child_level}
-                AND supplier = '{supplier}'
-                AND brand = '{brand}'
-                AND family = '{family}';
-                """
-            )
+    def update_where(self, column, lookup, update, value=None,
+                     mode="proportional", handle=None):
+        """
+        Resolve the keys of the rows a structured condition selects and
+        change exactly those rows in one transaction, so no other write
+        lands between the lookup and the change.
+        Args:
+            column: Column to change
+            lookup: (query, params) returning the keys of the rows
+            update: (query, params) setting the column on those rows
+            value: New summary measure value; given, the rows are edited
+                through the hierarchy by `edit_nodes` instead of `update`
+            mode: Split of hierarchy edits, see `edit_nodes`
+            handle: Optional QueryHandle cancelling the update
+        Returns:
+            Dict like `edit_nodes` with the `keys` of the selected rows,
+            only the `keys` for plain updates or if no row matched
+        """
+        with self.transaction(handle):
+            keys = self.execute_query(*lookup).to_pylist()
+            if value is None:
+                self.execute_query(*update)
+                return {"keys": keys}
+            edited = self.edit_nodes(column, keys, value, mode)
+        return {"keys": keys, **(edited or {})}
+
+    async def update_where_async(self, column, lookup, update, value=None,
+                                 mode="proportional"):
+        """
+        Asynchronously update the rows selected by a structured condition.
+        """
+        return await self._run_cancellable(
+            self.update_where, column, lookup, update, value, mode
+        )
+
+    def undo_edit(self, handle=None):
+        """
+        Revert the latest summary edit, including the cells it cascaded to,
+        and refresh the rollup tier buckets and formula cells it touched in
+        one transaction.
+        Returns:
+            Dict with the `edit_id`, `affected_keys`, recomputed `formulas`
+            and `formula_keys`, None if there is nothing to undo
+        """
+        with self.transaction(handle):
+            undone = EditHistory(self).undo()
+            if undone is not None:
+                self.refresh_rollup_tiers_for_keys(undone["affected_keys"])
+                undone.update(
+                    FormulaEngine(self).recalculate_edit(undone["edit_id"])
+                )
+        return undone
+
+    async def undo_edit_async(self):
+        """
+        Asynchronously undo the latest summary edit.
+        """
+        return await self._run_cancellable(self.undo_edit)
+
+    def redo_edit(self, handle=None):
+        """
+        Re-apply the earliest undone summary edit in one transaction.
+        Returns:
+            Dict like `undo_edit`, None if there is nothing to redo
+        """
+        with self.transaction(handle):
+            redone = EditHistory(self).redo()
+            if redone is not None:
+                self.refresh_rollup_tiers_for_keys(redone["affected_keys"])
+                redone.update(
+                    FormulaEngine(self).recalculate_edit(redone["edit_id"])
+                )
+        return redone
+
+    async def redo_edit_async(self):
+        """
+        Asynchronously redo the earliest undone summary edit.
+        """
+        return await self._run_cancellable(self.redo_edit)
+
+    def recalculate_formulas(self, handle=None):
+        """
+        Recompute every formula cell, e.g. after summary keys were edited.
+        """
+        formulas = FormulaEngine(self)
+        with self.transaction(handle):
+            if not formulas.ensure_table():
+                formulas.recalculate_all()
+
+    async def recalculate_formulas_async(self):
+        """
+        Asynchronously recompute every formula cell.
+        """
+        return await self._run_cancellable(self.recalculate_formulas)
+
+    def clear_edit_history(self):
+        """
+        Forget the undo history, e.g. after summary keys were edited.
+        """
+        EditHistory(self).clear()
+
+    async def clear_edit_history_async(self):
+        """
+        Asynchronously forget the undo history.
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.clear_edit_history)
 
 
 # Example
 if __name__ == "__main__":
+    # Query results are Arrow tables, but pyarrow is only imported by the
+    # drivers when a connection is opened; the example builds one itself
+    try:
+        import pyarrow
+    except ImportError as exc:
+        raise ImportError(
+            "Please install pyarrow: poetry add pyarrow"
+        ) from exc
+
     db_manager = DuckDBManager()
 
     # Example: Ingest Data
@@ -308,7 +922,4 @@ if __name__ == "__main__":
 
     # Example: Query Data
     result = db_manager.execute_query("SELECT * FROM Bands;")
-    print(result.to_pandas())  # Convert PyArrow table to Pandas DataFrame
-
-    # Example: Rollup
-    db_manager.rollup_to_parents(1)
\ No newline at end of file
+    print(result.to_pandas())  # Convert PyArrow table to Pandas DataFrame
\ No newline at end of file
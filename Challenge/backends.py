@@ -0,0 +1,471 @@
+"""
+Pluggable DuckDB driver backends used by DuckDBManager.
+Connections are opened either through ADBC or through the native duckdb
+Python API. Both return query results as Arrow tables without row-wise
+conversion and apply the same tuned database settings.
+"""
+
+import contextlib
+import heapq
+import importlib.util
+import itertools
+import os
+import tempfile
+import threading
+import time
+
+import settings
+
+
+class QueryCancelledError(RuntimeError):
+    """
+    Raised when a query is cancelled, e.g. because its client disconnected.
+    """
+
+
+class QueryTimeoutError(TimeoutError):
+    """
+    Raised when a query exceeds its time budget and is interrupted.
+    """
+
+
+class QueryHandle:
+    """
+    Cancellation handle for a query running in an executor thread.
+    The backend attaches a driver-level interrupt once the query starts, so
+    cancelling from another thread or the event loop stops DuckDB itself
+    rather than only abandoning the awaiting task.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self.timed_out = False
+        self._interrupt = None
+        self._lock = threading.Lock()
+
+    def attach(self, interrupt):
+        """
+        Register the interrupt of the statement about to run.
+        Raises:
+            QueryCancelledError: If the query was cancelled before it started
+        """
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelledError("Query cancelled before it started.")
+            self._interrupt = interrupt
+
+    def detach(self):
+        """
+        Forget the interrupt once the statement has finished.
+        """
+        with self._lock:
+            self._interrupt = None
+
+    def cancel(self):
+        """
+        Interrupt the running statement and refuse any further ones.
+        """
+        with self._lock:
+            self.cancelled = True
+            if self._interrupt is not None:
+                self._interrupt()
+
+    def expire(self):
+        """
+        Cancel the query because its timeout elapsed.
+        """
+        self.timed_out = True
+        self.cancel()
+
+
+class QueryWatchdog:
+    """
+    Expires QueryHandles once their timeout elapses. One daemon thread
+    waits on a heap of deadlines for every statement of the process, so a
+    timeout costs a heap push instead of starting a thread per statement.
+    """
+
+    def __init__(self):
+        self._deadlines = []  # Heap of [deadline, sequence, handle]
+        self._sequence = itertools.count()
+        self._cancelled = 0  # Disarmed entries still in the heap
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def arm(self, timeout, handle):
+        """
+        Expire `handle` in `timeout` seconds unless disarmed before.
+        Returns:
+            Entry to pass to `disarm`
+        """
+        entry = [time.monotonic() + timeout, next(self._sequence), handle]
+        with self._condition:
+            heapq.heappush(self._deadlines, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="query-watchdog", daemon=True
+                )
+                self._thread.start()
+            if self._deadlines[0] is entry:
+                self._condition.notify()
+        return entry
+
+    def disarm(self, entry):
+        """
+        Keep the handle of an entry from expiring, e.g. once its statement
+        has finished.
+        """
+        with self._condition:
+            if entry[2] is None:
+                return
+            entry[2] = None
+            self._cancelled += 1
+            # Disarmed entries are skipped lazily; rebuild the heap before
+            # they outnumber the live ones under a steady statement load
+            if self._cancelled > len(self._deadlines) // 2:
+                self._deadlines = [
+                    item for item in self._deadlines if item[2] is not None
+                ]
+                heapq.heapify(self._deadlines)
+                self._cancelled = 0
+
+    def _run(self):
+        while True:
+            with self._condition:
+                expired = []
+                while not expired:
+                    now = time.monotonic()
+                    while self._deadlines and (
+                            self._deadlines[0][2] is None
+                            or self._deadlines[0][0] <= now):
+                        entry = heapq.heappop(self._deadlines)
+                        if entry[2] is None:
+                            self._cancelled -= 1
+                        else:
+                            expired.append(entry[2])
+                            entry[2] = None
+                    if not expired:
+                        self._condition.wait(
+                            self._deadlines[0][0] - now
+                            if self._deadlines else None
+                        )
+            # Interrupts run outside the lock so arming never waits on them
+            for handle in expired:
+                handle.expire()
+
+
+_watchdog = QueryWatchdog()
+
+
+def database_config():
+    """
+    DuckDB configuration options applied when a database is opened.
+    Unset options keep DuckDB's own defaults.
+    """
+    config = {}
+    if settings.DB_THREADS:
+        config["threads"] = settings.DB_THREADS
+    if settings.DB_MEMORY_LIMIT:
+        config["memory_limit"] = settings.DB_MEMORY_LIMIT
+    if settings.DB_PRESERVE_INSERTION_ORDER is not None:
+        config["preserve_insertion_order"] = (
+            settings.DB_PRESERVE_INSERTION_ORDER
+        )
+    return config
+
+
+class DuckDBBackend:
+    """
+    Base class for driver backends. Subclasses open connections; query
+    execution is shared because both drivers expose DB-API cursors with
+    Arrow fetches.
+    """
+    name = None
+    # Whether `conn.cursor()` opens a connection with transactions of its
+    # own, so a cursor can read a snapshot while the connection writes
+    independent_cursors = False
+
+    def connect(self, path):
+        """
+        Open a connection to the database file at `path`.
+        """
+        raise NotImplementedError
+
+    def execute(self, conn, query, params=None, handle=None, cursor=None,
+                profile=None):
+        """
+        Execute a query and return its result as a PyArrow table.
+        Args:
+            conn: Connection opened by this backend
+            query: SQL query string to execute
+            params: Optional query parameters
+            handle: Optional QueryHandle allowing the query to be interrupted
+            cursor: Optional transaction cursor from `begin`; the statement
+                is then committed with the transaction instead of on its own
+            profile: Optional dict receiving the DuckDB profile of the run
+                under "plan", so its plan is known without running it again
+        """
+        if cursor is not None:
+            return self._fetch(cursor, query, params, handle, profile)
+        with conn.cursor() as cursor:
+            result = self._fetch(cursor, query, params, handle, profile)
+            conn.commit()
+            return result
+
+    def _fetch(self, cursor, query, params, handle, profile=None):
+        """
+        Run a statement on a cursor and fetch its complete result.
+        """
+        if handle is not None:
+            handle.attach(lambda: self.interrupt(cursor))
+        try:
+            if profile is not None:
+                self.start_profiling(cursor)
+            cursor.execute(query, params or [])
+            # Drain the result before committing: ADBC streams results
+            # lazily and a commit would close the pending result
+            result = self.fetch_arrow(cursor)
+            if profile is not None:
+                profile["plan"] = self.stop_profiling(cursor)
+            return result
+        finally:
+            if handle is not None:
+                handle.detach()
+
+    def _profiling_output(self):
+        """
+        File DuckDB writes the profile of the cursor's statements to. One per
+        thread, because the connections of several workbooks may be
+        profiled at the same time.
+        """
+        return os.path.join(
+            tempfile.gettempdir(),
+            f"liquid-duck-profile-{os.getpid()}-{threading.get_ident()}.txt"
+        )
+
+    def start_profiling(self, cursor):
+        """
+        Make DuckDB profile the next statement run on the cursor.
+        """
+        path = self._profiling_output().replace("'", "''")
+        cursor.execute(
+            "SET enable_profiling = 'query_tree'; "
+            f"SET profiling_output = '{path}';"
+        )
+
+    def stop_profiling(self, cursor):
+        """
+        Turn profiling off again and return the profile of the statement run
+        since `start_profiling`.
+        """
+        cursor.execute("RESET enable_profiling; RESET profiling_output;")
+        path = self._profiling_output()
+        try:
+            with open(path, encoding="utf-8") as output:
+                return output.read()
+        except FileNotFoundError:
+            return None
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    def fetch_arrow(self, cursor):
+        """
+        Fetch the complete result of the last statement as a PyArrow table.
+        """
+        return cursor.fetch_arrow_table()
+
+    def begin(self, conn):
+        """
+        Open a cursor running an explicit transaction.
+        """
+        cursor = conn.cursor()
+        cursor.execute("BEGIN TRANSACTION;")
+        return cursor
+
+    def commit(self, conn, cursor):
+        """
+        Commit the transaction opened by `begin`.
+        """
+        cursor.execute("COMMIT;")
+
+    def rollback(self, conn, cursor):
+        """
+        Roll back the transaction opened by `begin`.
+        """
+        cursor.execute("ROLLBACK;")
+
+    def interrupt(self, cursor):
+        """
+        Interrupt the statement running on `cursor` from another thread.
+        """
+        raise NotImplementedError
+
+    def ingest(self, conn, table_name, arrow_table):
+        """
+        Create `table_name` from a PyArrow table.
+        """
+        raise NotImplementedError
+
+
+class AdbcBackend(DuckDBBackend):
+    """
+    ADBC driver-manager backend loading DuckDB's ADBC entrypoint.
+    """
+    name = "adbc"
+
+    @staticmethod
+    def driver_path():
+        """
+        DuckDB library exposing `duckdb_adbc_init`. Defaults to the library
+        bundled with the installed duckdb Python package.
+        """
+        if settings.ADBC_DRIVER:
+            return settings.ADBC_DRIVER
+        for module in ("_duckdb", "duckdb.duckdb"):
+            try:
+                spec = importlib.util.find_spec(module)
+            except ImportError:
+                spec = None
+            if spec is not None and spec.origin:
+                return spec.origin
+        raise RuntimeError(
+            "No DuckDB ADBC driver found. Set LIQUID_DUCK_ADBC_DRIVER to the "
+            "path of the DuckDB shared library."
+        )
+
+    def connect(self, path):
+        from adbc_driver_manager import dbapi
+
+        db_kwargs = {
+            key: str(value).lower() if isinstance(value, bool) else str(value)
+            for key, value in database_config().items()
+        }
+        db_kwargs["path"] = path
+        return dbapi.connect(
+            driver=self.driver_path(),
+            entrypoint="duckdb_adbc_init",
+            db_kwargs=db_kwargs
+        )
+
+    def ingest(self, conn, table_name, arrow_table):
+        with conn.cursor() as cursor:
+            cursor.adbc_ingest(table_name, arrow_table)
+        conn.commit()
+
+    def interrupt(self, cursor):
+        cursor.adbc_cancel()
+
+    def begin(self, conn):
+        # The driver manager disables autocommit, so every statement on the
+        # connection already belongs to a transaction until commit
+        return conn.cursor()
+
+    def commit(self, conn, cursor):
+        conn.commit()
+
+    def rollback(self, conn, cursor):
+        conn.rollback()
+
+
+class NativeBackend(DuckDBBackend):
+    """
+    Native duckdb Python API backend. Avoids the driver-manager layer and
+    is the same driver `data.py` and the tests use.
+    """
+    name = "native"
+    independent_cursors = True
+
+    def connect(self, path):
+        import duckdb
+
+        return duckdb.connect(path, config=database_config())
+
+    def ingest(self, conn, table_name, arrow_table):
+        conn.from_arrow(arrow_table).create(table_name)
+
+    def fetch_arrow(self, cursor):
+        # duckdb 1.4 deprecates fetch_arrow_table in favour of to_arrow_table
+        to_arrow_table = getattr(cursor, "to_arrow_table", None)
+        if to_arrow_table is None:
+            return cursor.fetch_arrow_table()
+        return to_arrow_table()
+
+    def interrupt(self, cursor):
+        cursor.interrupt()
+
+
+BACKENDS = {
+    AdbcBackend.name: AdbcBackend,
+    NativeBackend.name: NativeBackend,
+}
+
+
+def execute_governed(backend, conn, query, params=None, timeout=None,
+                     handle=None, cursor=None, profile=None):
+    """
+    Execute a query through a backend, interrupting it in DuckDB once
+    `timeout` seconds elapse or when `handle` is cancelled.
+    Raises:
+        QueryTimeoutError: If the query ran out of time
+        QueryCancelledError: If the query was cancelled
+    """
+    handle = handle or QueryHandle()
+    deadline = _watchdog.arm(timeout, handle) if timeout else None
+    try:
+        return backend.execute(conn, query, params, handle, cursor, profile)
+    except QueryCancelledError:
+        raise
+    except Exception as e:
+        if handle.timed_out:
+            raise QueryTimeoutError(
+                f"Query interrupted after exceeding {timeout:.3g}s."
+            ) from e
+        if handle.cancelled:
+            raise QueryCancelledError("Query was cancelled.") from e
+        raise
+    finally:
+        if deadline is not None:
+            _watchdog.disarm(deadline)
+
+
+def statement_types(query):
+    """
+    Types of the statements of a SQL script as parsed by DuckDB, such as
+    "SELECT" or "UPDATE". FROM-first, SUMMARIZE, DESCRIBE and PIVOT /
+    UNPIVOT queries parse as SELECTs, CTEs take the type of their body.
+    Raises:
+        ValueError: If the script does not parse
+    """
+    import duckdb  # Parsing only, on the default in-memory connection
+
+    try:
+        statements = duckdb.extract_statements(query)
+    except duckdb.Error as e:
+        raise ValueError(f"Invalid query: {e}") from e
+    return [statement.type.name for statement in statements]
+
+
+def get_backend(name=None):
+    """
+    Backend instance by name, defaulting to the configured backend.
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    name = name or settings.DB_BACKEND
+    try:
+        return BACKENDS[name]()
+    except KeyError as exc:
+        raise ValueError(
+            f"Unknown DuckDB backend {name!r}, expected one of "
+            f"{sorted(BACKENDS)}"
+        ) from exc
+
+
+def backend_for_connection(conn):
+    """
+    Backend matching an already opened connection object.
+    """
+    if type(conn).__module__.startswith("adbc_driver_manager"):
+        return AdbcBackend()
+    return NativeBackend()
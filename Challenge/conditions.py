@@ -0,0 +1,147 @@
+"""
+Structured condition model for cell updates.
+Replaces free-form SQL WHERE strings with key predicates (equality,
+IN-lists and ranges) on primary and hierarchy columns. Conditions compile
+to parameterized SQL that DuckDB can answer with index point lookups, and
+expose the keys they touch so rebalances, rollups and clients only
+revisit the affected rows.
+"""
+
+from typing import List, Literal, Optional, Union
+
+from pydantic import BaseModel, Field, model_validator
+
+from schema import KEY_COLUMNS, TABLE_COLUMNS
+
+Scalar = Union[int, float, str, None]
+
+
+def validate_target(table, column=None):
+    """
+    Check that a table (and optionally a column) may be edited.
+    Raises:
+        ValueError: If the table or column is unknown
+    """
+    if table not in TABLE_COLUMNS:
+        raise ValueError(f"Unknown table: {table!r}")
+    if column is not None and column not in TABLE_COLUMNS[table]:
+        raise ValueError(f"Unknown column {column!r} for table {table!r}")
+
+
+class Predicate(BaseModel):
+    """
+    A single predicate on a key column.
+    `eq` matches one value (None matches NULL, e.g. the brand of a
+    supplier-level summary row), `in` matches a list of values and `range`
+    matches an inclusive interval with optional bounds.
+    """
+    column: str = Field(..., description="Key column to filter on")
+    op: Literal["eq", "in", "range"] = Field(
+        "eq",
+        description="Predicate operator"
+    )
+    value: Scalar = Field(None, description="Value for eq predicates")
+    values: Optional[List[Scalar]] = Field(
+        None,
+        description="Values for in predicates"
+    )
+    low: Scalar = Field(None, description="Inclusive lower bound for range")
+    high: Scalar = Field(None, description="Inclusive upper bound for range")
+
+    @model_validator(mode="after")
+    def check_operands(self):
+        """
+        Ensure the operands match the operator.
+        """
+        if self.op == "in" and not self.values:
+            raise ValueError("in predicates need a non-empty 'values' list")
+        if self.op == "range" and self.low is None and self.high is None:
+            raise ValueError("range predicates need 'low' and/or 'high'")
+        return self
+
+    def to_sql(self):
+        """
+        Compile to a parameterized SQL fragment.
+        Returns:
+            Tuple of (sql, params)
+        """
+        column = f'"{self.column}"'
+        if self.op == "eq":
+            if self.value is None:
+                return f"{column} IS NULL", []
+            return f"{column} = ?", [self.value]
+        if self.op == "in":
+            placeholders = ", ".join("?" for _ in self.values)
+            return f"{column} IN ({placeholders})", list(self.values)
+        bounds, params = [], []
+        if self.low is not None:
+            bounds.append(f"{column} >= ?")
+            params.append(self.low)
+        if self.high is not None:
+            bounds.append(f"{column} <= ?")
+            params.append(self.high)
+        return " AND ".join(bounds), params
+
+
+class Condition(BaseModel):
+    """
+    Conjunction of key predicates selecting the rows a cell update touches.
+    """
+    all_of: List[Predicate] = Field(
+        ...,
+        min_length=1,
+        description="Predicates that must all hold"
+    )
+
+    def validate_for(self, table):
+        """
+        Check that every predicate filters on a key column of `table`.
+        Raises:
+            ValueError: If a predicate uses a non-key column
+        """
+        validate_target(table)
+        for predicate in self.all_of:
+            if predicate.column not in KEY_COLUMNS[table]:
+                raise ValueError(
+                    f"Column {predicate.column!r} is not a key column of "
+                    f"{table!r}; use one of {KEY_COLUMNS[table]}"
+                )
+
+    def to_sql(self, table):
+        """
+        Compile to a parameterized WHERE clause body for `table`.
+        Returns:
+            Tuple of (sql, params)
+        """
+        self.validate_for(table)
+        fragments, params = [], []
+        for predicate in self.all_of:
+            sql, predicate_params = predicate.to_sql()
+            fragments.append(sql)
+            params.extend(predicate_params)
+        return " AND ".join(fragments), params
+
+
+def build_update(table, column, value, condition):
+    """
+    Build a parameterized UPDATE for a structured condition.
+    Returns:
+        Tuple of (sql, params)
+    """
+    validate_target(table, column)
+    where, params = condition.to_sql(table)
+    return (
+        f'UPDATE {table} SET "{column}" = ? WHERE {where};',
+        [value] + params
+    )
+
+
+def build_key_lookup(table, condition):
+    """
+    Build a parameterized SELECT of the key columns of the matching rows.
+    Returns:
+        Tuple of (sql, params)
+    """
+    where, params = condition.to_sql(table)
+    columns = ", ".join(f'"{column}"' for column in KEY_COLUMNS[table])
+    return f"SELECT DISTINCT {columns} FROM {table} WHERE {where};", params
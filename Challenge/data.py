@@ -5,16 +5,30 @@ and sales data in DuckDB.
 """
 
 import random
+import sys
 
 import duckdb
 import pandas as pd
 from faker import Faker
 
+from formulas import FORMULA_TABLE
+from history import EDIT_HISTORY_TABLE
+from schema import (
+    PIVOT_VIEW_SELECT,
+    ROLLUP_TIERS,
+    SUMMARY_SELECT,
+    SUMMARY_TABLE,
+    key_statements,
+    tier_select_sql,
+)
+
 # Initialize Faker
 fake = Faker()
 
-# Connect to DuckDB
-conn = duckdb.connect("sales_metrics.duckdb")
+# Connect to DuckDB. Pass a path to initialize a workbook shard instead,
+# e.g. `python data.py workbooks/north.duckdb`.
+conn = duckdb.connect(sys.argv[1] if len(sys.argv) > 1
+                      else "sales_metrics.duckdb")
 
 
 conn.execute("DROP TABLE IF EXISTS product")
@@ -58,8 +72,7 @@ sales_data = pd.DataFrame(
     {
         "product_id": [fake.random_int(min=1, max=5) for _ in range(10)],
         "customer_id": [fake.random_int(min=1, max=5) for _ in range(10)],
-        "invoice_date": [fake.date_this_year().strftime
-                         ("%Y-%m-%d") for _ in range(10)],
+        "invoice_date": [fake.date_this_year() for _ in range(10)],
         "quantity": [fake.random_int(min=1, max=50) for _ in range(10)],
         # "net_price": [fake.random_float(min=10.0, max=100.0,
         # ndigits=2) for _ in range(10)]
@@ -67,7 +80,13 @@ sales_data = pd.DataFrame(
                       for _ in range(10)],
     }
 )
-conn.execute("CREATE TABLE sales AS SELECT * FROM sales_data")
+conn.execute(
+    """
+    CREATE TABLE sales AS
+    SELECT * REPLACE (CAST(invoice_date AS DATE) AS invoice_date)
+    FROM sales_data
+"""
+)
 
 print("Created tables: product, customer, sales")
 
@@ -80,33 +99,31 @@ for table in tables:
     print(result)
     print("-" * 50)  # Separator for better readability
 
-conn.execute("DROP TABLE IF EXISTS sales_summary_by_product_family")
+conn.execute(f"DROP TABLE IF EXISTS {SUMMARY_TABLE}")
 
-conn.execute(
-    """
-    CREATE TABLE sales_summary_by_product_family AS
-    SELECT
-        p.supplier,
-        p.brand,
-        p.family,
-        STRFTIME(CAST(s.invoice_date AS DATE), '%Y-%m') AS invoice_date_month,
-        SUM(s.quantity) AS quantity,
-        SUM(s.net_price) AS net_amount,
-        GROUPING_ID(p.supplier, p.brand, p.family) AS grouping_set_id
-    FROM sales s
-    JOIN product p ON s.product_id = p.product_id
-    GROUP BY GROUPING SETS (
-        (p.supplier, p.brand, p.family, STRFTIME(CAST(s.invoice_date AS
-        DATE), '%Y-%m')),
-        (p.supplier, p.brand, STRFTIME(CAST(s.invoice_date AS DATE), '%Y-%m')),
-        (p.supplier, STRFTIME(CAST(s.invoice_date AS DATE), '%Y-%m'))
-    );
-"""
-)
+conn.execute(f"CREATE TABLE {SUMMARY_TABLE} AS {SUMMARY_SELECT}")
 print("Created denormalized table: sales_summary_by_product_family")
 
 
-tables = ["sales_summary_by_product_family"]
+# Quarter and year rollup tiers, materialized from the monthly summary
+for tier, spec in ROLLUP_TIERS.items():
+    conn.execute(f"DROP TABLE IF EXISTS {spec['table']}")
+    conn.execute(f"CREATE TABLE {spec['table']} AS {tier_select_sql(tier)}")
+    print(f"Created {tier} rollup table: {spec['table']}")
+
+# Formula cells of an earlier summary are stale; they are recomputed from
+# the new one when the database is next opened or edited
+conn.execute(f"DROP TABLE IF EXISTS {FORMULA_TABLE}")
+# Undo deltas refer to the rows of the earlier summary; the history table is
+# recreated on the next edit
+conn.execute(f"DROP TABLE IF EXISTS {EDIT_HISTORY_TABLE}")
+
+# Primary keys and ART indexes serving point updates and rebalances
+for statement in key_statements():
+    conn.execute(statement)
+print("Created primary keys and indexes")
+
+tables = [SUMMARY_TABLE] + [spec["table"] for spec in ROLLUP_TIERS.values()]
 
 # print contents
 for table in tables:
@@ -118,20 +135,7 @@ for table in tables:
 conn.execute("DROP VIEW IF EXISTS pivoted_sales")
 
 # Pivot: columns are invoice months
-conn.execute(
-    """
-    CREATE VIEW pivoted_sales AS
-    SELECT *
-    FROM (
-        SELECT supplier, brand, family, invoice_date_month, quantity
-        FROM sales_summary_by_product_family
-    )
-    PIVOT (
-        SUM(quantity) FOR invoice_date_month IN ('2024-01', '2024-02',
-        '2024-03', '2024-04')
-    );
-"""
-)
+conn.execute(f"CREATE VIEW pivoted_sales AS {PIVOT_VIEW_SELECT}")
 print("Created pivoted view: pivoted_sales")
 
 conn.execute("DROP VIEW IF EXISTS unpivoted_sales")
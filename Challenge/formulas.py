@@ -0,0 +1,295 @@
+"""
+Formula engine for computed cells of the sales summary.
+Formulas derive cells from the summary measures: price per unit,
+month-over-month growth and share of parent. Their values are materialized
+in a side table keyed like the summary, joined back to it by a view and
+pivoted by month like pivoted_sales, so clients and snapshot readers query
+them like any other cell.
+
+The dependency graph has two levels. Each formula declares the measure
+columns it reads and the cells it reads relative to its own: the cell
+itself, the same node in the previous month or the node's parent. An edit
+only recomputes the formulas reading the edited column, at the cells that
+read a changed cell, with one set-based UPDATE per dependency shape.
+"""
+
+from hierarchy import PARENT_LEVELS
+from history import EDIT_HISTORY_TABLE
+from schema import KEY_COLUMNS, MEASURE_COLUMNS, PIVOT_MONTHS, SUMMARY_TABLE
+
+FORMULA_TABLE = "sales_summary_formulas"
+FORMULA_VIEW = "sales_summary_with_formulas"
+FORMULA_PIVOT_VIEW = "pivoted_sales_formulas"
+
+# Cells a formula reads, relative to the cell it computes
+CELL = "cell"
+PREVIOUS_MONTH = "previous_month"
+PARENT = "parent"
+
+# Formula name -> measure columns read, cells read and SQL expression over
+# the cell (s), its previous month (prev) and its parent (parent)
+FORMULAS = {
+    "price_per_unit": {
+        "inputs": ["net_amount", "quantity"],
+        "reads": (CELL,),
+        "sql": "s.net_amount / NULLIF(s.quantity, 0)",
+    },
+}
+for _measure in MEASURE_COLUMNS:
+    FORMULAS[f"{_measure}_mom_growth"] = {
+        "inputs": [_measure],
+        "reads": (CELL, PREVIOUS_MONTH),
+        "sql": (
+            f"(s.{_measure} - prev.{_measure}) / NULLIF(prev.{_measure}, 0)"
+        ),
+    }
+    FORMULAS[f"{_measure}_share_of_parent"] = {
+        "inputs": [_measure],
+        "reads": (CELL, PARENT),
+        "sql": f"s.{_measure} / NULLIF(parent.{_measure}, 0)",
+    }
+
+
+def dependent_formulas(column):
+    """
+    Formulas reading a summary column, grouped by the cells they read.
+    Returns:
+        Dict of reads -> formula names, in FORMULAS order
+    """
+    groups = {}
+    for name, formula in FORMULAS.items():
+        if column in formula["inputs"]:
+            groups.setdefault(formula["reads"], []).append(name)
+    return groups
+
+
+def _parent_key(alias):
+    """
+    SQL expressions of the summary key of a row's parent node, NULL for
+    rows without a parent.
+    """
+    level = f"{alias}.grouping_set_id"
+    parent_level = " ".join(
+        f"WHEN {child} THEN {parent}"
+        for child, (parent, _) in PARENT_LEVELS.items()
+    )
+    key = {"invoice_date_month": f"{alias}.invoice_date_month",
+           "grouping_set_id": f"CASE {level} {parent_level} END"}
+    for column in ("supplier", "brand", "family"):
+        levels = [
+            str(child) for child, (_, shared) in PARENT_LEVELS.items()
+            if column in shared
+        ]
+        key[column] = (
+            f"CASE WHEN {level} IN ({', '.join(levels)}) "
+            f"THEN {alias}.{column} END" if levels else "NULL"
+        )
+    return key
+
+
+class FormulaEngine:
+    """
+    Computes the formula cells of one workbook's summary.
+    Statements run through the DuckDBManager handle, normally inside the
+    `transaction()` of the edit whose cells they recompute.
+    """
+
+    def __init__(self, db_manager, table=SUMMARY_TABLE):
+        self.db_manager = db_manager
+        self.table = table
+        self.key_columns = KEY_COLUMNS[table]
+
+    def _execute(self, query, params=None, query_class="interactive"):
+        return self.db_manager.execute_query(
+            query, params, query_class=query_class
+        )
+
+    def _match(self, left, right):
+        """
+        Join condition between two relations holding summary keys.
+        """
+        return " AND ".join(
+            f"{left}.{column} IS NOT DISTINCT FROM {right}.{column}"
+            for column in self.key_columns
+        )
+
+    def _formula_select(self, names, targets=None):
+        """
+        SELECT computing formulas for every summary row, or only for the
+        rows whose keys are in the `targets` relation.
+        """
+        reads = {read for name in names for read in FORMULAS[name]["reads"]}
+        joins = []
+        if targets is not None:
+            joins.append(f"JOIN {targets} AS targets ON "
+                         f"{self._match('s', 'targets')}")
+        if PREVIOUS_MONTH in reads:
+            same_node = " AND ".join(
+                f"prev.{column} IS NOT DISTINCT FROM s.{column}"
+                for column in self.key_columns
+                if column != "invoice_date_month"
+            )
+            joins.append(
+                f"LEFT JOIN {self.table} AS prev ON {same_node} AND "
+                "prev.invoice_date_month = "
+                "CAST(s.invoice_date_month - INTERVAL 1 MONTH AS DATE)"
+            )
+        if PARENT in reads:
+            parent = " AND ".join(
+                f"parent.{column} IS NOT DISTINCT FROM {expression}"
+                for column, expression in _parent_key("s").items()
+            )
+            joins.append(f"LEFT JOIN {self.table} AS parent ON {parent}")
+        columns = ", ".join(f"s.{column}" for column in self.key_columns)
+        formulas = ", ".join(
+            f"CAST({FORMULAS[name]['sql']} AS DOUBLE) AS {name}"
+            for name in names
+        )
+        return f"""
+            SELECT {columns}, {formulas}
+            FROM {self.table} AS s
+            {" ".join(joins)}
+        """
+
+    def _targets(self, reads):
+        """
+        SELECT of the cells reading a cell of the `changed` relation through
+        any of the given dependencies: the changed cells themselves, the same
+        nodes one month later, and the children of changed nodes.
+        """
+        columns = ", ".join(self.key_columns)
+        selects = [f"SELECT {columns} FROM changed"]
+        if PREVIOUS_MONTH in reads:
+            selects.append(
+                "SELECT " + ", ".join(
+                    "CAST(invoice_date_month + INTERVAL 1 MONTH AS DATE)"
+                    if column == "invoice_date_month" else column
+                    for column in self.key_columns
+                ) + " FROM changed"
+            )
+        if PARENT in reads:
+            parent = " AND ".join(
+                f"changed.{column} IS NOT DISTINCT FROM {expression}"
+                for column, expression in _parent_key("child").items()
+            )
+            selects.append(
+                "SELECT " + ", ".join(
+                    f"child.{column}" for column in self.key_columns
+                ) + f" FROM {self.table} AS child JOIN changed ON {parent}"
+            )
+        return " UNION ".join(selects)
+
+    def ensure_table(self):
+        """
+        Create and fill the formula table and its views if the database
+        does not have them yet.
+        Returns:
+            Whether the table was created
+        """
+        exists = self._execute(
+            "SELECT COUNT(*) AS tables FROM duckdb_tables() "
+            "WHERE table_name = $1;",
+            [FORMULA_TABLE]
+        ).to_pylist()[0]["tables"]
+        if exists:
+            return False
+        columns = ", ".join(f"s.{column}" for column in self.key_columns)
+        self._execute(
+            f"""
+            CREATE TABLE {FORMULA_TABLE} AS
+            SELECT * FROM ({self._formula_select(list(FORMULAS))}) LIMIT 0;
+            """
+        )
+        self.recalculate_all()
+        formulas = ", ".join(f"f.{name}" for name in FORMULAS)
+        self._execute(
+            f"""
+            CREATE OR REPLACE VIEW {FORMULA_VIEW} AS
+            SELECT {columns}, s.quantity, s.net_amount, {formulas}
+            FROM {self.table} AS s
+            LEFT JOIN {FORMULA_TABLE} AS f ON {self._match('s', 'f')};
+            """
+        )
+        values = ", ".join(f"FIRST({name}) AS {name}" for name in FORMULAS)
+        months = ", ".join(f"'{month}'" for month in PIVOT_MONTHS)
+        self._execute(
+            f"""
+            CREATE OR REPLACE VIEW {FORMULA_PIVOT_VIEW} AS
+            SELECT *
+            FROM (
+                SELECT supplier, brand, family,
+                STRFTIME(invoice_date_month, '%Y-%m') AS invoice_date_month,
+                {", ".join(FORMULAS)}
+                FROM {FORMULA_TABLE}
+            )
+            PIVOT ({values} FOR invoice_date_month IN ({months}));
+            """
+        )
+        return True
+
+    def recalculate_all(self):
+        """
+        Recompute every formula cell, e.g. after the summary was rebuilt.
+        """
+        self._execute(f"DELETE FROM {FORMULA_TABLE};", query_class="bulk")
+        self._execute(
+            f"INSERT INTO {FORMULA_TABLE} "
+            f"{self._formula_select(list(FORMULAS))};",
+            query_class="bulk"
+        )
+
+    def recalculate(self, column, changed, params=None):
+        """
+        Recompute the formulas depending on changed cells of one column.
+        Args:
+            column: Summary column whose cells changed
+            changed: SELECT of the summary keys of the changed cells
+            params: Parameters of the `changed` query
+        Returns:
+            Dict with the recomputed `formulas` and the `formula_keys` of the
+            cells they were recomputed at
+        """
+        self.ensure_table()
+        recomputed, keys = [], {}
+        for reads, names in dependent_formulas(column).items():
+            computed = self._formula_select(names, targets="targets")
+            rows = self._execute(
+                f"""
+                WITH changed AS ({changed}),
+                targets AS ({self._targets(reads)})
+                UPDATE {FORMULA_TABLE}
+                SET {", ".join(f"{name} = computed.{name}" for name in names)}
+                FROM ({computed}) AS computed
+                WHERE {self._match(FORMULA_TABLE, "computed")}
+                RETURNING {", ".join(
+                    f"{FORMULA_TABLE}.{key}" for key in self.key_columns
+                )};
+                """,
+                params
+            ).to_pylist()
+            recomputed += names
+            for row in rows:
+                keys[tuple(row.values())] = row
+        return {
+            "formulas": recomputed,
+            "formula_keys": sorted(keys.values(), key=str),
+        }
+
+    def recalculate_edit(self, edit_id):
+        """
+        Recompute the formulas depending on the cells an edit changed, as
+        recorded in the edit history.
+        """
+        column = self._execute(
+            f"SELECT ANY_VALUE(column_name) AS column_name "
+            f"FROM {EDIT_HISTORY_TABLE} WHERE edit_id = $1;",
+            [edit_id]
+        ).to_pylist()[0]["column_name"]
+        if column is None:
+            return {"formulas": [], "formula_keys": []}
+        return self.recalculate(
+            column,
+            f"SELECT {', '.join(self.key_columns)} "
+            f"FROM {EDIT_HISTORY_TABLE} WHERE edit_id = $1",
+            [edit_id]
+        )
@@ -0,0 +1,209 @@
+"""
+Hierarchy engine for edits of the sales summary.
+Summary rows form a supplier > brand > family tree per invoice month. An edit
+of any node splits its new value down its own subtree, proportionally to
+the current children or equally, and recomputes the sums of its own
+ancestors. Only rows of that subtree and its ancestor chain are touched.
+"""
+
+from schema import (
+    BRAND_LEVEL,
+    DESCENDANT_LEVELS,
+    FAMILY_LEVEL,
+    MEASURE_COLUMNS,
+    SUMMARY_TABLE,
+    SUPPLIER_LEVEL,
+)
+
+SPLIT_MODES = ("proportional", "equal")
+
+# Parent level and the hierarchy columns a node shares with its parent
+PARENT_LEVELS = {
+    BRAND_LEVEL: (SUPPLIER_LEVEL, ["supplier"]),
+    FAMILY_LEVEL: (BRAND_LEVEL, ["supplier", "brand"]),
+}
+
+# Hierarchy columns identifying a node of each level (besides the month)
+NODE_COLUMNS = {
+    SUPPLIER_LEVEL: ["supplier"],
+    BRAND_LEVEL: ["supplier", "brand"],
+    FAMILY_LEVEL: ["supplier", "brand", "family"],
+}
+
+
+def _node_filter(key, level, alias=None, columns=None, start=1):
+    """
+    Filter selecting the rows that share a node's hierarchy columns and
+    month, i.e. the node itself and its subtree. Uses numbered parameters
+    because DuckDB does not bind positional ones in text order in UPDATEs
+    with subqueries.
+
+    Args:
+        key: Summary key of the node
+        level: Level whose hierarchy columns to match
+        alias: Optional table alias to qualify columns with
+        columns: Hierarchy columns to match, defaults to the node's own
+        start: Number of the first parameter
+    Returns:
+        Tuple of (sql, params)
+    """
+    prefix = f"{alias}." if alias else ""
+    filters = [f"{prefix}invoice_date_month = ${start}"]
+    params = [key["invoice_date_month"]]
+    for column in columns or NODE_COLUMNS[level]:
+        params.append(key[column])
+        filters.append(
+            f"{prefix}{column} IS NOT DISTINCT FROM ${start + len(params) - 1}"
+        )
+    return " AND ".join(filters), params
+
+
+def node_level(key):
+    """
+    Hierarchy level (grouping_set_id) of a summary key.
+    Raises:
+        ValueError: If the key is not a node of the summary hierarchy
+    """
+    level = key.get("grouping_set_id")
+    if level not in NODE_COLUMNS:
+        raise ValueError(f"Unknown hierarchy level: {level!r}")
+    return level
+
+
+def edit_order(keys):
+    """
+    Order edited nodes from the coarsest to the finest level, so an edit of
+    a node inside an edited subtree is applied after (and wins over) the
+    split of its ancestor.
+    """
+    return sorted(keys, key=lambda key: -node_level(key))
+
+
+class HierarchyEngine:
+    """
+    Applies node edits to the summary hierarchy of one workbook.
+    Statements run through the DuckDBManager handle, normally inside its
+    `transaction()` so an edit and its propagation commit together.
+    """
+
+    def __init__(self, db_manager, table=SUMMARY_TABLE):
+        self.db_manager = db_manager
+        self.table = table
+
+    def _execute(self, query, params):
+        return self.db_manager.execute_query(query, params)
+
+    def set_node(self, column, key, value):
+        """
+        Write a new value to the node row itself.
+        """
+        level = node_level(key)
+        where, params = _node_filter(key, level, start=2)
+        self._execute(
+            f"""
+            UPDATE {self.table} SET {column} = $1
+            WHERE {where} AND grouping_set_id = {level};
+            """,
+            [value] + params
+        )
+
+    def split_down(self, column, key, mode="proportional"):
+        """
+        Split the node's current value down its subtree, one level at a
+        time, so every child level sums to its parent. Proportional splits
+        keep the children's ratios and fall back to an equal split when the
+        children sum to zero.
+        """
+        if mode not in SPLIT_MODES:
+            raise ValueError(f"Unknown split mode: {mode!r}")
+        level = node_level(key)
+        for child_level in DESCENDANT_LEVELS[level]:
+            parent_level, shared = PARENT_LEVELS[child_level]
+            subtree, subtree_params = _node_filter(key, level, "parent")
+            join = " AND ".join(
+                f"child.{column_name} IS NOT DISTINCT FROM "
+                f"parent.{column_name}"
+                for column_name in shared + ["invoice_date_month"]
+            )
+            match = " AND ".join(
+                f"{self.table}.{column_name} IS NOT DISTINCT FROM "
+                f"parents.{column_name}"
+                for column_name in shared + ["invoice_date_month"]
+            )
+            proportional = (
+                "COALESCE(parents.child_total, 0) <> 0"
+                if mode == "proportional" else "FALSE"
+            )
+            self._execute(
+                f"""
+                UPDATE {self.table}
+                SET {column} = CASE
+                    WHEN {proportional}
+                    THEN {self.table}.{column} * parents.value
+                        / parents.child_total
+                    ELSE parents.value / parents.children
+                END
+                FROM (
+                    SELECT
+                        {", ".join(f"parent.{c}" for c in shared)},
+                        parent.invoice_date_month,
+                        parent.{column} AS value,
+                        SUM(child.{column}) AS child_total,
+                        COUNT(*) AS children
+                    FROM {self.table} AS parent
+                    JOIN {self.table} AS child
+                        ON {join} AND child.grouping_set_id = {child_level}
+                    WHERE parent.grouping_set_id = {parent_level}
+                    AND {subtree}
+                    GROUP BY ALL
+                ) AS parents
+                WHERE {self.table}.grouping_set_id = {child_level}
+                AND {match};
+                """,
+                subtree_params
+            )
+
+    def roll_up(self, column, key):
+        """
+        Recompute the ancestors of a node, nearest first, as the sums of
+        their children.
+        """
+        level = node_level(key)
+        while level in PARENT_LEVELS:
+            parent_level, shared = PARENT_LEVELS[level]
+            # Both filters match the same key columns and share parameters
+            parent, params = _node_filter(key, parent_level, columns=shared)
+            children, _ = _node_filter(
+                key, parent_level, "child", columns=shared
+            )
+            self._execute(
+                f"""
+                UPDATE {self.table}
+                SET {column} = (
+                    SELECT SUM(child.{column}) FROM {self.table} AS child
+                    WHERE {children} AND child.grouping_set_id = {level}
+                )
+                WHERE {parent} AND grouping_set_id = {parent_level};
+                """,
+                params
+            )
+            level = parent_level
+
+    def edit(self, column, keys, value, mode="proportional"):
+        """
+        Set the given nodes to `value` and propagate each edit down its
+        subtree and up its ancestors.
+        Args:
+            column: Measure column edited (see MEASURE_COLUMNS)
+            keys: Summary keys of the edited nodes
+            value: New numeric value of every edited node
+            mode: "proportional" or "equal" split of the value to children
+        """
+        if column not in MEASURE_COLUMNS:
+            raise ValueError(
+                f"Only measure columns {MEASURE_COLUMNS} can be propagated"
+            )
+        for key in edit_order(keys):
+            self.set_node(column, key, value)
+            self.split_down(column, key, mode)
+            self.roll_up(column, key)
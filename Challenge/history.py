@@ -0,0 +1,222 @@
+"""
+Edit history of summary edits for undo and redo.
+Each applied edit stores inverse deltas in a columnar side table: one row
+per summary cell it changed, including the cells its split and roll-up
+cascaded to, with the old and the new value. Undo writes the old values
+back and redo the new ones. Edits form a stack per workbook; a new edit
+discards the edits that were undone before it.
+"""
+
+import settings
+from schema import KEY_COLUMNS, MEASURE_COLUMNS, SUMMARY_TABLE
+
+EDIT_HISTORY_TABLE = "edit_history"
+
+
+class EditHistory:
+    """
+    Records and replays the inverse deltas of summary edits.
+    Statements run through the DuckDBManager handle and are meant to share
+    the `transaction()` of the edit they record or replay.
+    """
+
+    def __init__(self, db_manager, table=SUMMARY_TABLE):
+        self.db_manager = db_manager
+        self.table = table
+        self.key_columns = KEY_COLUMNS[table]
+
+    def _execute(self, query, params=None):
+        return self.db_manager.execute_query(query, params)
+
+    def _match(self, alias):
+        """
+        Join condition between the summary and history rows of one cell.
+        """
+        return " AND ".join(
+            f"{self.table}.{column} IS NOT DISTINCT FROM {alias}.{column}"
+            for column in self.key_columns
+        )
+
+    def ensure_table(self):
+        """
+        Create the history table if the database does not have it yet.
+        """
+        self._execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {EDIT_HISTORY_TABLE} (
+                edit_id BIGINT,
+                edited_at TIMESTAMPTZ DEFAULT current_timestamp,
+                column_name VARCHAR,
+                supplier VARCHAR,
+                brand VARCHAR,
+                family VARCHAR,
+                invoice_date_month DATE,
+                grouping_set_id BIGINT,
+                old_value DOUBLE,
+                new_value DOUBLE,
+                undone BOOLEAN DEFAULT FALSE
+            );
+            """
+        )
+
+    def begin_edit(self, column, keys):
+        """
+        Start recording an edit: drop the redo stack and save the current
+        values of every row the edit can reach. All of them share a
+        supplier and month with one of the edited nodes.
+        Returns:
+            ID of the new edit
+        """
+        self.ensure_table()
+        self._execute(f"DELETE FROM {EDIT_HISTORY_TABLE} WHERE undone;")
+        edit_id = self._execute(
+            f"SELECT COALESCE(MAX(edit_id), 0) + 1 AS edit_id "
+            f"FROM {EDIT_HISTORY_TABLE};"
+        ).to_pylist()[0]["edit_id"]
+
+        filters, params = [], [edit_id]
+        for supplier, month in sorted(
+                {(key["supplier"], key["invoice_date_month"]) for key in keys},
+                key=str):
+            params += [supplier, month]
+            filters.append(
+                f"(supplier IS NOT DISTINCT FROM ${len(params) - 1} "
+                f"AND invoice_date_month = ${len(params)})"
+            )
+        columns = ", ".join(self.key_columns)
+        self._execute(
+            f"""
+            INSERT INTO {EDIT_HISTORY_TABLE}
+                (edit_id, column_name, {columns}, old_value)
+            SELECT $1, '{column}', {columns}, {column}
+            FROM {self.table}
+            WHERE {" OR ".join(filters)};
+            """,
+            params
+        )
+        return edit_id
+
+    def end_edit(self, edit_id, column):
+        """
+        Finish recording an edit: save the new values, keep only the cells
+        that changed and apply the retention limits.
+        """
+        self._execute(
+            f"""
+            UPDATE {EDIT_HISTORY_TABLE} AS history
+            SET new_value = {self.table}.{column}
+            FROM {self.table}
+            WHERE history.edit_id = $1
+            AND {self._match("history")};
+            """,
+            [edit_id]
+        )
+        self._execute(
+            f"""
+            DELETE FROM {EDIT_HISTORY_TABLE}
+            WHERE edit_id = $1
+            AND old_value IS NOT DISTINCT FROM new_value;
+            """,
+            [edit_id]
+        )
+        self.prune()
+
+    def prune(self):
+        """
+        Drop edits beyond the configured count and age limits.
+        """
+        if settings.EDIT_HISTORY_MAX_EDITS:
+            self._execute(
+                f"""
+                DELETE FROM {EDIT_HISTORY_TABLE}
+                WHERE edit_id NOT IN (
+                    SELECT DISTINCT edit_id FROM {EDIT_HISTORY_TABLE}
+                    ORDER BY edit_id DESC
+                    LIMIT {int(settings.EDIT_HISTORY_MAX_EDITS)}
+                );
+                """
+            )
+        if settings.EDIT_HISTORY_MAX_AGE_SECONDS:
+            self._execute(
+                f"""
+                DELETE FROM {EDIT_HISTORY_TABLE}
+                WHERE edited_at < current_timestamp - to_seconds($1);
+                """,
+                [float(settings.EDIT_HISTORY_MAX_AGE_SECONDS)]
+            )
+
+    def clear(self):
+        """
+        Forget every edit, e.g. after the summary was rebuilt or its keys
+        changed and the stored deltas no longer apply.
+        """
+        self.ensure_table()
+        self._execute(f"DELETE FROM {EDIT_HISTORY_TABLE};")
+
+    def _replay(self, edit_id, value_column, undone):
+        """
+        Write the old or new values of an edit back to the summary.
+        Returns:
+            Dict with the edit ID and the summary keys it changed
+        """
+        edited_columns = [
+            row["column_name"] for row in self._execute(
+                f"SELECT DISTINCT column_name FROM {EDIT_HISTORY_TABLE} "
+                f"WHERE edit_id = $1;",
+                [edit_id]
+            ).to_pylist()
+        ]
+        for column in edited_columns:
+            if column not in MEASURE_COLUMNS:
+                raise ValueError(f"Unknown edited column: {column!r}")
+            self._execute(
+                f"""
+                UPDATE {self.table}
+                SET {column} = history.{value_column}
+                FROM {EDIT_HISTORY_TABLE} AS history
+                WHERE history.edit_id = $1
+                AND history.column_name = '{column}'
+                AND {self._match("history")};
+                """,
+                [edit_id]
+            )
+        self._execute(
+            f"UPDATE {EDIT_HISTORY_TABLE} SET undone = $1 WHERE edit_id = $2;",
+            [undone, edit_id]
+        )
+        keys = self._execute(
+            f"SELECT DISTINCT {', '.join(self.key_columns)} "
+            f"FROM {EDIT_HISTORY_TABLE} WHERE edit_id = $1;",
+            [edit_id]
+        ).to_pylist()
+        return {"edit_id": edit_id, "affected_keys": keys}
+
+    def undo(self):
+        """
+        Revert the most recent edit that is not undone.
+        Returns:
+            Dict with the edit ID and affected keys, None if there is none
+        """
+        self.ensure_table()
+        edit_id = self._execute(
+            f"SELECT MAX(edit_id) AS edit_id FROM {EDIT_HISTORY_TABLE} "
+            f"WHERE NOT undone;"
+        ).to_pylist()[0]["edit_id"]
+        if edit_id is None:
+            return None
+        return self._replay(edit_id, "old_value", True)
+
+    def redo(self):
+        """
+        Re-apply the earliest undone edit.
+        Returns:
+            Dict with the edit ID and affected keys, None if there is none
+        """
+        self.ensure_table()
+        edit_id = self._execute(
+            f"SELECT MIN(edit_id) AS edit_id FROM {EDIT_HISTORY_TABLE} "
+            f"WHERE undone;"
+        ).to_pylist()[0]["edit_id"]
+        if edit_id is None:
+            return None
+        return self._replay(edit_id, "new_value", False)
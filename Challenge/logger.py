@@ -2,21 +2,32 @@ import logging
 import os
 
 
+class LazyFileHandler(logging.FileHandler):
+    """
+    File handler that creates its log directory and opens the log file when
+    the first record is written, so importing the loggers touches no files.
+    """
+
+    def __init__(self, filename, mode="a", encoding=None):
+        super().__init__(filename, mode, encoding, delay=True)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
 def setup_logger(name, log_file, level=logging.INFO):
     """
     Set up a logger with the specified name, log file, and logging level.
+    The log file is created lazily on the first record.
     """
-    print(f"Setting up logger: {name}")
-    os.makedirs(os.path.dirname(log_file), exist_ok=True)
-
-    handler = logging.FileHandler(log_file)
+    handler = LazyFileHandler(log_file)
     formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
     handler.setFormatter(formatter)
 
     logger = logging.getLogger(name)
     logger.setLevel(level)
     logger.addHandler(handler)
-    print(f"Logger {name} is set up.")
     return logger
 
 
@@ -24,4 +35,3 @@ def setup_logger(name, log_file, level=logging.INFO):
 api_logger = setup_logger("api_logger", "logs/api.log")
 redis_logger = setup_logger("redis_logger", "logs/redis.log")
 db_logger = setup_logger("db_logger", "logs/db.log")
-print("Loggers initialized successfully.")
@@ -2,20 +2,51 @@
 FastAPI application module for handling database operations
 and real-time updates.
 Provides REST endpoints for cell updates and multi-user synchronization.
+
+In the default "embedded" mode the API process applies writes itself. In
+"worker" mode (LIQUID_DUCK_API_MODE=worker) it never opens DuckDB: writes are
+forwarded to the single writer process and reads are served from the
+Parquet snapshots, so any number of worker processes can run side by side.
+
+Importing the module opens nothing: `create_app()` only builds the routes,
+and the Redis client, DuckDB handle and exporter are created by the
+application's lifespan when it starts.
 """
 
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
 from typing import Optional
 
-import duckdb
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import APIRouter, FastAPI, HTTPException, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field, ValidationError
 import redis
-import redis.asyncio as aioredis
 
-from duckdb_manager import DuckDBManager
+import settings
+from backends import QueryCancelledError, QueryTimeoutError
+from DuckDBManager import DuckDBManager, is_default_workbook
 from logger import api_logger
+from parquet_exporter import (
+    ParquetExporter,
+    ReadOnlyQueryEngine,
+    SnapshotUnavailableError,
+)
+from profiler import profiler_command
+from redisclient import RedisUnavailableError, get_redis_client
+from streams import response_stream
+from updates import (
+    NothingToReplay,
+    UpdateFailed,
+    UpdateRejected,
+    UpdateRequest,
+    apply_history_action,
+    apply_update,
+    broadcast_history_action,
+    broadcast_update,
+    history_response,
+    update_response,
+)
+from writerclient import WriterClient, WriterUnavailableError
 
 
 @asynccontextmanager
@@ -24,7 +55,9 @@ async def lifespan(application: FastAPI):
     FastAPI lifespan to manage startup and shutdown processes
     for Redis and DuckDB.
     """
+    global redis_client, db_manager, exporter, writer_client
     print(f"Starting {application.title} lifespan...")
+    init_services()
 
     # Startup: Test Redis and DuckDB connections
     try:
@@ -41,22 +74,35 @@ async def lifespan(application: FastAPI):
             "Redis connection failed. Check your Redis server."
         ) from e
 
-    try:
-        await db_manager.execute_query_async("SELECT 1;")
-        print("Connected to DuckDB successfully.")
-        api_logger.info("DuckDB connection successful.")
-    except duckdb.Error as e:
-        print(f"DuckDB connection failed: {e}")
-        api_logger.error(f"DuckDB connection failed: {e}")
-        raise RuntimeError("DuckDB connection failed.") from e
+    export_task = None
+    if db_manager is not None:
+        try:
+            await db_manager.execute_query_async("SELECT 1;")
+            print("Connected to DuckDB successfully.")
+            api_logger.info("DuckDB connection successful.")
+        except Exception as e:
+            print(f"DuckDB connection failed: {e}")
+            api_logger.error(f"DuckDB connection failed: {e}")
+            raise RuntimeError("DuckDB connection failed.") from e
+
+        # Background Parquet exports for the read-only query mode
+        export_task = asyncio.create_task(exporter.run_periodic())
+    # In worker mode the writer process owns DuckDB and the exports
 
     # Allow application to run
     yield
 
+    if export_task is not None:
+        export_task.cancel()
+    if writer_client is not None:
+        await writer_client.close()
+        writer_client = None
+
     # Shutdown: Clean up Redis and ensure all resources are released
     print("Shutting down application lifespan...")
     try:
         await redis_client.close()
+        redis_client = None
         print("Redis connection closed.")
         api_logger.info("Redis connection closed.")
     except (
@@ -70,10 +116,14 @@ async def lifespan(application: FastAPI):
 
     # Additional cleanup for DuckDB (if needed)
     try:
-        db_manager.conn.close()
+        DuckDBManager.close_all()
+        if db_manager is not None:
+            db_manager.conn.close()
+        db_manager = None
+        exporter = None
         print("DuckDB connection closed.")
         api_logger.info("DuckDB connection closed.")
-    except duckdb.Error as e:
+    except Exception as e:
         print(f"Error closing DuckDB connection: {e}")
         api_logger.error(
             f"Error closing DuckDB connection: {e}"
@@ -81,43 +131,90 @@ async def lifespan(application: FastAPI):
 
     print("Application lifespan shutdown complete.")
 
-# Initialize FastAPI app with the lifespan
-app = FastAPI(lifespan=lifespan)
+# Process-wide services, created on startup by `init_services()`
+redis_client = None
+db_manager = None
+exporter = None
+writer_client = None
 
-# Initialize Async Redis client
-redis_client = aioredis.from_url(
-    "redis://localhost:6379",
-    decode_responses=True
-)
+# Read-only engine serving analytical queries from the Parquet snapshots.
+# It connects to a snapshot on its first query.
+reader = ReadOnlyQueryEngine()
+
+router = APIRouter()
+
+
+def init_services():
+    """
+    Create the services of this process that are not set yet: the shared
+    pooled Redis client, and either the DuckDB handle with its Parquet
+    exporter ("embedded" mode) or the client forwarding writes to the
+    single DuckDB writer process ("worker" mode).
+    """
+    global redis_client, db_manager, exporter, writer_client
+    if redis_client is None:
+        # Shared pooled Redis client with retries and circuit breaking
+        redis_client = get_redis_client()
+    if settings.API_MODE == "worker":
+        # Stateless worker: forward writes to the single DuckDB writer process
+        if writer_client is None:
+            writer_client = WriterClient(redis_client)
+    else:
+        if db_manager is None:
+            db_manager = DuckDBManager()
+        if exporter is None:
+            # Parquet snapshots exported from the writer connection
+            exporter = ParquetExporter(db_manager)
+
+
+def record_edit(workbook_id):
+    """
+    Count an applied edit towards the next Parquet export.
+    """
+    if exporter is not None and is_default_workbook(workbook_id):
+        exporter.record_edit()
+
+
+@contextmanager
+def workbook_manager(workbook_id):
+    """
+    DuckDB handle serving a workbook for the duration of a request. The
+    default workbook uses the shared module-level manager; other workbooks
+    are routed to their own shard, pinned so it is not evicted mid-request.
+    """
+    if is_default_workbook(workbook_id):
+        yield db_manager
+        return
+    with DuckDBManager.acquire(workbook_id) as handle:
+        yield handle
 
-# Initialize DuckDB Manager
-db_manager = DuckDBManager()
 
-# Redis streams
-REQUEST_STREAM = "request_duck"
-RESPONSE_STREAM = "response_duck"
+class AnalyticsQuery(BaseModel):
+    """
+    Pydantic model for read-only analytical queries served from the
+    Parquet snapshots instead of the writer connection.
+    """
+    query: str = Field(..., description="Read-only SQL query to execute")
 
 
-# Pydantic model for the request body
-class UpdateRequest(BaseModel):
+class ProfilingRequest(BaseModel):
     """
-    Pydantic model for handling cell update requests.
-    Validates and structures the data needed for database updates.
+    Pydantic model changing the slow-query profiler mode; omitted fields
+    keep their current value.
     """
-    table: str = Field(..., description="Name of the table to update")
-    column: str = Field(..., description="Column to update")
-    value: str = Field(..., description="New value to set")
-    condition: str = Field(
-        ...,
-        description="SQL condition for rows to update"
+    enabled: Optional[bool] = Field(None, description="Profile statements")
+    threshold_ms: Optional[float] = Field(
+        None, ge=0, description="Record statements slower than this"
     )
-    level: Optional[int] = Field(
-        None,
-        description="Grouping level for hierarchical updates"
+    top_n: Optional[int] = Field(
+        None, ge=1, description="Number of slowest query shapes kept"
+    )
+    explain: Optional[bool] = Field(
+        None, description="Capture the plan of the slowest runs"
     )
 
 
-@app.get("/")
+@router.get("/")
 async def read_root():
     """
     Root endpoint for testing server availability.
@@ -126,75 +223,72 @@ async def read_root():
     return {"message": "Welcome to the Liquid Duck API!"}
 
 
-@app.post("/update_cell")
-async def update_cell(request: UpdateRequest):
+async def cancel_on_disconnect(http_request: Request, coroutine):
     """
-    Update a specific cell in the database and propagate changes if necessary.
+    Run a request handler coroutine, cancelling it when the HTTP client
+    disconnects. Cancellation interrupts the running DuckDB statement, so an
+    abandoned request stops consuming the writer connection.
     """
+    task = asyncio.ensure_future(coroutine)
     try:
-        # Extract data from the validated request
-        table = request.table
-        column = request.column
-        value = request.value
-        condition = request.condition
-        level = request.level
-
-        # Validate critical fields
-        if not table or not column or not condition:
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid input: Missing required fields."
+        while True:
+            done, _ = await asyncio.wait(
+                {task}, timeout=settings.DISCONNECT_POLL_SECONDS
             )
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                task.cancel()
+                api_logger.warning(
+                    f"Client disconnected, cancelled {http_request.url.path}."
+                )
+                raise HTTPException(
+                    status_code=499,
+                    detail="Client disconnected."
+                )
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+
+@router.post("/update_cell")
+async def update_cell(request: UpdateRequest, http_request: Request):
+    """
+    Update a specific cell in the database and propagate changes if necessary.
+    The update is cancelled if the client disconnects before it completes.
+    """
+    return await cancel_on_disconnect(http_request, apply_cell_update(request))
 
-        print(
-            f"Received data - Table: {table}, Column: {column}, "
-            f"Value: {value}, Condition: {condition}, Level: {level}"
-        )
-        api_logger.info(f"Processing update request for table {table}.")
 
-        # Test database connectivity
-        await db_manager.execute_query_async("SELECT 1;")
-        print("DuckDB connected successfully.")
+async def apply_cell_update(request: UpdateRequest):
+    """
+    Apply a validated cell update, rebalance the hierarchy and broadcast it.
+    """
+    if writer_client is not None:
+        return await forward_to_writer(request.model_dump(mode="json"))
 
-        # Execute the update query asynchronously
+    try:
         try:
-            await db_manager.execute_query_async(
-                f"""
-                UPDATE {table}
-                SET {column} = '{value}'
-                WHERE {condition};
-                """
-            )
-            print(f"Update query executed successfully for {table}.")
-        except Exception as query_error:
-            api_logger.error(f"Query execution error: {str(query_error)}")
-            raise HTTPException(
-                status_code=500,
-                detail="Query execution failed."
-            ) from query_error
-
-        # Handle proportional rebalance for hierarchical updates
-        if table == "sales_summary_by_product_family" and level is not None:
-            api_logger.info(
-                f"proportional rebalance for level {level}."
-            )
-            await db_manager.proportional_rebalance_async(level, int(value))
-
-        # Broadcast the changes to Redis response stream
+            with workbook_manager(request.workbook_id) as workbook_db:
+                outcome = await apply_update(workbook_db, request)
+        except UpdateRejected as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        except ValueError as e:
+            # Invalid workbook IDs
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        except UpdateFailed as e:
+            raise HTTPException(status_code=500, detail=str(e)) from e
+
+        # Broadcast the changes to Redis response stream. Connectivity is
+        # covered by the client's retries and circuit breaker, not a PING.
         try:
-            await redis_client.ping()
-            print("Redis connected successfully.")
-            await redis_client.xadd(
-                RESPONSE_STREAM,
-                {
-                    "table": table,
-                    "column": column,
-                    "value": value,
-                    "condition": condition,
-                    "level": str(level) if level is not None else "null",
-                }
-            )
-            print(f"Changes broadcasted to Redis stream {RESPONSE_STREAM}.")
+            await broadcast_update(redis_client, request, outcome)
+        except RedisUnavailableError as redis_error:
+            api_logger.error(f"Redis unavailable: {str(redis_error)}")
+            raise HTTPException(
+                status_code=503,
+                detail="Redis is unavailable, changes were not broadcast."
+            ) from redis_error
         except Exception as redis_error:
             api_logger.error(f"Redis broadcast error: {str(redis_error)}")
             raise HTTPException(
@@ -202,14 +296,27 @@ async def update_cell(request: UpdateRequest):
                 detail="Failed to broadcast changes to Redis."
             ) from redis_error
 
-        api_logger.info(f"updated {table}:{column}={value} WHERE {condition}.")
-        return {"status": "success", "message": f"Updated {table}"}
+        record_edit(request.workbook_id)
+
+        return update_response(request, outcome)
 
     except HTTPException as e:
         api_logger.warning(
             f"HTTPException while update_cell: {str(e)}"
         )
         raise e
+    except QueryTimeoutError as e:
+        api_logger.error(f"Update timed out: {str(e)}")
+        raise HTTPException(
+            status_code=504,
+            detail="Update timed out."
+        ) from e
+    except QueryCancelledError as e:
+        api_logger.warning(f"Update cancelled: {str(e)}")
+        raise HTTPException(
+            status_code=499,
+            detail="Update cancelled."
+        ) from e
     except Exception as e:
         api_logger.error(
             f"Unexpected server error: {str(e)}"
@@ -220,14 +327,92 @@ async def update_cell(request: UpdateRequest):
         ) from e
 
 
-@app.get("/get_updates")
-async def get_updates():
+async def forward_to_writer(payload):
+    """
+    Worker mode: have the writer process apply a request and relay its reply.
+    """
+    try:
+        reply = await writer_client.submit(payload)
+    except WriterUnavailableError as e:
+        api_logger.error(f"Writer unavailable: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e)) from e
+    except RedisUnavailableError as e:
+        api_logger.error(f"Redis unavailable: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="Redis is unavailable, the request was not forwarded."
+        ) from e
+    if reply["status_code"] != 200:
+        raise HTTPException(
+            status_code=reply["status_code"],
+            detail=reply.get("detail")
+        )
+    return reply["body"]
+
+
+@router.post("/undo")
+async def undo(workbook_id: Optional[str] = None):
+    """
+    Undo the latest summary edit of a workbook, including the child and
+    parent cells it cascaded to.
+    """
+    return await replay_edit("undo", workbook_id)
+
+
+@router.post("/redo")
+async def redo(workbook_id: Optional[str] = None):
+    """
+    Redo the earliest undone summary edit of a workbook.
+    """
+    return await replay_edit("redo", workbook_id)
+
+
+async def replay_edit(action, workbook_id):
+    """
+    Apply an undo or redo from the edit history and broadcast it.
+    """
+    if writer_client is not None:
+        return await forward_to_writer(
+            {"command": action, "workbook_id": workbook_id}
+        )
+    try:
+        with workbook_manager(workbook_id) as workbook_db:
+            outcome = await apply_history_action(workbook_db, action)
+    except NothingToReplay as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    except ValueError as e:
+        # Invalid workbook IDs
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except QueryTimeoutError as e:
+        api_logger.error(f"{action} timed out: {str(e)}")
+        raise HTTPException(
+            status_code=504,
+            detail=f"{action.capitalize()} timed out."
+        ) from e
+
+    try:
+        await broadcast_history_action(
+            redis_client, workbook_id, action, outcome
+        )
+    except RedisUnavailableError as redis_error:
+        api_logger.error(f"Redis unavailable: {str(redis_error)}")
+        raise HTTPException(
+            status_code=503,
+            detail="Redis is unavailable, changes were not broadcast."
+        ) from redis_error
+
+    record_edit(workbook_id)
+    return history_response(action, outcome)
+
+
+@router.get("/get_updates")
+async def get_updates(workbook_id: Optional[str] = None):
     """
     Retrieve updates from Redis response stream for multi-user sync.
     """
     try:
         api_logger.info("Fetching updates from Redis response stream...")
-        updates = await redis_client.xrange(RESPONSE_STREAM)
+        updates = await redis_client.xrange(response_stream(workbook_id))
         api_logger.info("Fetched updates successfully.")
         return {"status": "success", "updates": updates}
     except Exception as e:
@@ -238,7 +423,87 @@ async def get_updates():
         ) from e
 
 
-@app.exception_handler(Exception)
+@router.post("/analytics/query")
+async def analytics_query(request: AnalyticsQuery, http_request: Request):
+    """
+    Run a read-only analytical query against the latest Parquet snapshot.
+    """
+    import duckdb  # Loaded with the reader's first snapshot connection
+
+    try:
+        result = await cancel_on_disconnect(
+            http_request, reader.execute_query_async(request.query)
+        )
+    except QueryTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e)) from e
+    except SnapshotUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e)) from e
+    except (ValueError, duckdb.Error) as e:
+        api_logger.warning(f"Rejected analytical query: {e}")
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    api_logger.info(f"Served analytical query from {reader.snapshot}.")
+    return {
+        "status": "success",
+        "snapshot": reader.snapshot,
+        "rows": result.to_pylist(),
+    }
+
+
+@router.post("/analytics/export")
+async def analytics_export():
+    """
+    Export a fresh Parquet snapshot immediately.
+    """
+    if writer_client is not None:
+        return await forward_to_writer({"command": "export"})
+    try:
+        snapshot_dir = await exporter.export_snapshot_async()
+    except Exception as e:
+        api_logger.error(f"Parquet export failed: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Parquet export failed."
+        ) from e
+    return {"status": "success", "snapshot": snapshot_dir}
+
+
+@router.get("/admin/slow_queries")
+async def slow_queries():
+    """
+    Slowest query shapes recorded by the profiler, with their plans.
+    """
+    return await run_profiler_command({"command": "slow_queries"})
+
+
+@router.delete("/admin/slow_queries")
+async def reset_slow_queries():
+    """
+    Forget the recorded slow queries.
+    """
+    return await run_profiler_command({"command": "reset_slow_queries"})
+
+
+@router.post("/admin/profiling")
+async def configure_profiling(request: ProfilingRequest):
+    """
+    Turn the slow-query profiler on or off and change its threshold.
+    """
+    return await run_profiler_command(
+        {"command": "profiling", **request.model_dump(exclude_none=True)}
+    )
+
+
+async def run_profiler_command(payload):
+    """
+    Profile the process that runs the DuckDB statements: this one in
+    embedded mode, the writer in worker mode.
+    """
+    if writer_client is not None:
+        return await forward_to_writer(payload)
+    return profiler_command(payload)
+
+
 async def global_exception_handler(_request: Request, exc: Exception):
     """
     Global exception handler for all unhandled exceptions.
@@ -252,7 +517,6 @@ async def global_exception_handler(_request: Request, exc: Exception):
     )
 
 
-@app.exception_handler(ValidationError)
 async def validation_exception_handler(
     _request: Request,
     exc: ValidationError
@@ -265,4 +529,23 @@ async def validation_exception_handler(
     return JSONResponse(
         status_code=422,
         content={"detail": exc.errors()},
-    )
\ No newline at end of file
+    )
+
+
+def create_app():
+    """
+    Build the FastAPI application. Construction is cheap: services are
+    created by the lifespan when the application starts, so workers can be
+    spawned and restarted quickly.
+    """
+    application = FastAPI(lifespan=lifespan)
+    application.include_router(router)
+    application.add_exception_handler(Exception, global_exception_handler)
+    application.add_exception_handler(
+        ValidationError, validation_exception_handler
+    )
+    return application
+
+
+# Initialize FastAPI app with the lifespan
+app = create_app()
@@ -0,0 +1,217 @@
+"""
+Schema migrations for existing sales metrics database files.
+Files created by older versions of `data.py` store invoice dates as text,
+lack the rollup tiers, have no primary keys or indexes, store summary
+measures as integers and have no formula cells. Migrations bring them up to
+the current schema in place and are recorded in a schema_migrations table,
+so each one runs once per file. Each migration commits together with its
+record, so an interrupted one is rolled back and runs again.
+
+Usage:
+    python migrations.py [workbook_id ...]
+"""
+
+import sys
+
+from formulas import FormulaEngine
+from logger import db_logger
+from schema import (
+    INDEXES,
+    MEASURE_COLUMNS,
+    PIVOT_VIEW_SELECT,
+    PRIMARY_KEYS,
+    ROLLUP_TIERS,
+    SUMMARY_SELECT,
+    SUMMARY_TABLE,
+    index_statements,
+    primary_key_statements,
+    tier_select_sql,
+)
+
+MIGRATIONS_TABLE = "schema_migrations"
+
+
+def _rows(db_manager, query, params=None):
+    """
+    Run a catalog query and return its rows as dicts.
+    """
+    return db_manager.execute_query(
+        query, params, query_class="bulk"
+    ).to_pylist()
+
+
+def _tables(db_manager):
+    """
+    Names of the base tables in the database.
+    """
+    return {
+        row["table_name"] for row in _rows(
+            db_manager,
+            "SELECT table_name FROM information_schema.tables "
+            "WHERE table_type = 'BASE TABLE';"
+        )
+    }
+
+
+def _column_type(db_manager, table, column):
+    """
+    Declared type of a column, or None if it does not exist.
+    """
+    rows = _rows(
+        db_manager,
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_name = ? AND column_name = ?;",
+        [table, column]
+    )
+    return rows[0]["data_type"] if rows else None
+
+
+def typed_dates(db_manager):
+    """
+    Store sales invoice dates as DATE and key the summary on a DATE month,
+    creating the quarter / year rollup tiers from it.
+    """
+    tables = _tables(db_manager)
+    if "sales" in tables and _column_type(
+            db_manager, "sales", "invoice_date") != "DATE":
+        db_manager.execute_query(
+            "ALTER TABLE sales ALTER invoice_date TYPE DATE "
+            "USING CAST(invoice_date AS DATE);",
+            query_class="bulk"
+        )
+    if not {"sales", "product"} <= tables:
+        return
+    if SUMMARY_TABLE not in tables or _column_type(
+            db_manager, SUMMARY_TABLE, "invoice_date_month") != "DATE":
+        # The text month cannot be cast in place, rebuild from the base rows
+        db_manager.execute_query(
+            f"CREATE OR REPLACE TABLE {SUMMARY_TABLE} AS {SUMMARY_SELECT};",
+            query_class="bulk"
+        )
+        db_manager.execute_query(
+            f"CREATE OR REPLACE VIEW pivoted_sales AS {PIVOT_VIEW_SELECT};",
+            query_class="bulk"
+        )
+        tables -= {spec["table"] for spec in ROLLUP_TIERS.values()}
+    for tier, spec in ROLLUP_TIERS.items():
+        if spec["table"] not in tables:
+            db_manager.execute_query(
+                f"CREATE OR REPLACE TABLE {spec['table']} AS "
+                f"{tier_select_sql(tier)};",
+                query_class="bulk"
+            )
+
+
+def keys_and_indexes(db_manager):
+    """
+    Declare primary keys and create the ART indexes of the current schema.
+    """
+    tables = _tables(db_manager)
+    keyed = {
+        row["table_name"] for row in _rows(
+            db_manager,
+            "SELECT table_name FROM duckdb_constraints() "
+            "WHERE constraint_type = 'PRIMARY KEY';"
+        )
+    }
+    unkeyed = (tables & PRIMARY_KEYS.keys()) - keyed
+    for statement in (primary_key_statements(unkeyed)
+                      + index_statements(tables)):
+        db_manager.execute_query(statement, query_class="bulk")
+
+
+def double_measures(db_manager):
+    """
+    Store the summary and tier measures as DOUBLE so hierarchy splits do
+    not round. DuckDB cannot alter columns of indexed tables, so the
+    table's indexes are dropped and recreated around the change.
+    """
+    tables = _tables(db_manager)
+    for table in [SUMMARY_TABLE] + [
+            spec["table"] for spec in ROLLUP_TIERS.values()]:
+        if table not in tables:
+            continue
+        columns = [
+            column for column in MEASURE_COLUMNS
+            if _column_type(db_manager, table, column) != "DOUBLE"
+        ]
+        if not columns:
+            continue
+        for name, index_table, _, _ in INDEXES:
+            if index_table == table:
+                db_manager.execute_query(
+                    f"DROP INDEX IF EXISTS {name};", query_class="bulk"
+                )
+        for column in columns:
+            db_manager.execute_query(
+                f"ALTER TABLE {table} ALTER {column} TYPE DOUBLE;",
+                query_class="bulk"
+            )
+        for statement in index_statements([table]):
+            db_manager.execute_query(statement, query_class="bulk")
+
+
+def formula_cells(db_manager):
+    """
+    Materialize the formula cells of the summary with their views.
+    """
+    if SUMMARY_TABLE in _tables(db_manager):
+        FormulaEngine(db_manager).ensure_table()
+
+
+# Ordered (version, name, function); append new migrations at the end
+MIGRATIONS = [
+    (1, "typed_dates", typed_dates),
+    (2, "keys_and_indexes", keys_and_indexes),
+    (3, "double_measures", double_measures),
+    (4, "formula_cells", formula_cells),
+]
+
+
+def migrate(db_manager):
+    """
+    Apply the migrations not yet recorded in the database.
+    Args:
+        db_manager: DuckDBManager handle of the database file
+    Returns:
+        Names of the migrations that were applied
+    """
+    db_manager.execute_query(
+        f"""
+        CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR,
+            applied_at TIMESTAMP DEFAULT current_timestamp
+        );
+        """,
+        query_class="bulk"
+    )
+    applied = {
+        row["version"] for row in _rows(
+            db_manager, f"SELECT version FROM {MIGRATIONS_TABLE};"
+        )
+    }
+    ran = []
+    for version, name, migration in MIGRATIONS:
+        if version in applied:
+            continue
+        print(f"Applying migration {version}: {name}")
+        db_logger.info(f"Applying migration {version}: {name}")
+        with db_manager.transaction():
+            migration(db_manager)
+            db_manager.execute_query(
+                f"INSERT INTO {MIGRATIONS_TABLE} (version, name) "
+                "VALUES (?, ?);",
+                [version, name],
+                query_class="bulk"
+            )
+        ran.append(name)
+    return ran
+
+
+if __name__ == "__main__":
+    from DuckDBManager import DuckDBManager
+
+    # Opening a workbook handle migrates its database file
+    for workbook_id in sys.argv[1:] or [None]:
+        DuckDBManager.for_workbook(workbook_id)
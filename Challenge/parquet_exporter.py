@@ -0,0 +1,422 @@
+"""
+Parquet snapshot exporter and read-only analytical query engine.
+Heavy analytical reads of the summary hierarchy and the pivot views are
+served from partitioned Parquet snapshots by a separate DuckDB instance,
+which keeps the single writer connection free for interactive edits.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+
+import settings
+from backends import (
+    NativeBackend,
+    QueryHandle,
+    execute_governed,
+    statement_types,
+)
+from formulas import FORMULA_TABLE
+from logger import db_logger
+from schema import ROLLUP_TIERS
+
+# Tables exported on every snapshot, with the query used to export them and
+# the Hive partition columns. Sales rows are tagged with their supplier and
+# invoice month so that both base and summary data prune the same way.
+EXPORT_TABLES = {
+    "sales_summary_by_product_family": {
+        "query": "SELECT * FROM sales_summary_by_product_family",
+        "partition_by": ["supplier", "invoice_date_month"],
+    },
+    "sales": {
+        "query": """
+            SELECT
+                s.*,
+                p.supplier AS supplier,
+                CAST(DATE_TRUNC('month', CAST(s.invoice_date AS DATE))
+                AS DATE) AS invoice_date_month
+            FROM sales s
+            LEFT JOIN product p ON s.product_id = p.product_id
+        """,
+        "requires": ["sales", "product"],
+        "partition_by": ["supplier", "invoice_date_month"],
+    },
+    "product": {
+        "query": "SELECT * FROM product",
+        "partition_by": ["supplier"],
+    },
+    "customer": {
+        "query": "SELECT * FROM customer",
+        "partition_by": [],
+    },
+}
+EXPORT_TABLES[FORMULA_TABLE] = {
+    "query": f"SELECT * FROM {FORMULA_TABLE}",
+    "partition_by": ["supplier", "invoice_date_month"],
+}
+EXPORT_TABLES.update({
+    spec["table"]: {
+        "query": f"SELECT * FROM {spec['table']}",
+        "partition_by": ["supplier", spec["column"]],
+    }
+    for spec in ROLLUP_TIERS.values()
+})
+
+CURRENT_POINTER = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+
+
+def check_read_only(query):
+    """
+    Accept only a single SELECT statement (including FROM-first, SUMMARIZE,
+    DESCRIBE and PIVOT / UNPIVOT queries that DuckDB parses as SELECTs).
+    Raises:
+        ValueError: If the query does not parse, holds several statements or
+            is not a SELECT
+    """
+    types = statement_types(query)
+    if len(types) != 1:
+        raise ValueError("Exactly one statement is allowed.")
+    if types[0] != "SELECT":
+        raise ValueError("Only read-only queries are allowed.")
+
+
+class SnapshotUnavailableError(RuntimeError):
+    """
+    Raised when a read-only query arrives before any snapshot was exported.
+    """
+
+
+def _sql_path(path):
+    """
+    Quote a filesystem path for use as a SQL string literal.
+    """
+    return "'" + path.replace("'", "''") + "'"
+
+
+def _column_names(arrow_table, column="column_name"):
+    """
+    Extract a list of values of a single column from a PyArrow table.
+    """
+    return arrow_table.column(column).to_pylist()
+
+
+class ParquetExporter:
+    """
+    Writes the summary and base tables to Parquet snapshots partitioned by
+    supplier and month. Exports run after a number of edits or on a fixed
+    interval, and each snapshot is published atomically through a pointer
+    file so readers never observe a half-written export.
+    """
+
+    def __init__(self, db_manager, export_dir=None, every_n_edits=None,
+                 interval_seconds=None, keep_snapshots=None):
+        self.db_manager = db_manager
+        self.export_dir = export_dir or settings.EXPORT_DIR
+        self.every_n_edits = (
+            settings.EXPORT_EVERY_N_EDITS if every_n_edits is None
+            else every_n_edits
+        )
+        self.interval_seconds = (
+            settings.EXPORT_INTERVAL_SECONDS if interval_seconds is None
+            else interval_seconds
+        )
+        self.keep_snapshots = max(
+            1,
+            settings.EXPORT_KEEP_SNAPSHOTS if keep_snapshots is None
+            else keep_snapshots
+        )
+        self.edits_since_export = 0
+        self._export_lock = threading.Lock()
+        self._export_task = None
+
+    def _existing_tables(self, execute):
+        """
+        Names of the tables present in the writer database.
+        """
+        result = execute("SELECT table_name FROM duckdb_tables();")
+        return set(_column_names(result, "table_name"))
+
+    def _export_table(self, execute, snapshot_dir, name, spec):
+        """
+        Export a single table through the snapshot's `execute` function and
+        return its manifest entry.
+        """
+        query = spec["query"]
+        described = execute(f"DESCRIBE {query}")
+        columns = _column_names(described)
+        types = dict(zip(columns, _column_names(described, "column_type")))
+        row_count = execute(
+            f"SELECT COUNT(*) AS row_count FROM ({query});"
+        ).column("row_count")[0].as_py()
+
+        if row_count == 0 or not spec["partition_by"]:
+            # Partitioned COPY writes no files for empty results, so empty and
+            # unpartitioned tables go to a single file the reader can bind to.
+            target = os.path.join(snapshot_dir, f"{name}.parquet")
+            execute(
+                f"COPY ({query}) TO {_sql_path(target)} (FORMAT PARQUET);"
+            )
+            return {"columns": columns, "path": target, "hive": False}
+
+        target = os.path.join(snapshot_dir, name)
+        partition_by = ", ".join(spec["partition_by"])
+        execute(
+            f"""
+            COPY ({query}) TO {_sql_path(target)}
+            (FORMAT PARQUET, PARTITION_BY ({partition_by}));
+            """
+        )
+        return {
+            "columns": columns,
+            "path": os.path.join(target, "**", "*.parquet"),
+            "hive": True,
+            # Partition values live in directory names, so their types are
+            # recorded to read typed keys such as DATE months back unchanged
+            "hive_types": {
+                column: types[column] for column in spec["partition_by"]
+            },
+        }
+
+    def export_snapshot(self):
+        """
+        Export all known tables and view definitions into a new snapshot
+        directory and publish it as the current snapshot.
+        Returns:
+            Absolute path of the published snapshot directory
+        """
+        with self._export_lock:
+            self.edits_since_export = 0
+            started = time.perf_counter()
+            os.makedirs(self.export_dir, exist_ok=True)
+            snapshot_name = f"snapshot-{time.time_ns()}"
+            snapshot_dir = os.path.abspath(
+                os.path.join(self.export_dir, snapshot_name)
+            )
+            os.makedirs(snapshot_dir)
+
+            try:
+                # Every table is read from the same snapshot, so the summary,
+                # its tiers and the base tables agree even while edits land
+                with self.db_manager.read_snapshot() as execute:
+                    existing = self._existing_tables(execute)
+                    manifest = {"tables": {}, "views": []}
+                    for name, spec in EXPORT_TABLES.items():
+                        if not set(spec.get("requires", [name])) <= existing:
+                            continue
+                        manifest["tables"][name] = self._export_table(
+                            execute, snapshot_dir, name, spec
+                        )
+
+                    views = execute(
+                        "SELECT sql FROM duckdb_views() WHERE NOT internal;"
+                    )
+                    manifest["views"] = _column_names(views, "sql")
+
+                with open(os.path.join(snapshot_dir, MANIFEST_FILE), "w",
+                          encoding="utf-8") as manifest_file:
+                    json.dump(manifest, manifest_file)
+            except Exception:
+                shutil.rmtree(snapshot_dir, ignore_errors=True)
+                raise
+
+            pointer = os.path.join(self.export_dir, CURRENT_POINTER)
+            with open(pointer + ".tmp", "w", encoding="utf-8") as tmp:
+                tmp.write(snapshot_name)
+            os.replace(pointer + ".tmp", pointer)
+            self._prune_snapshots(snapshot_name)
+
+            elapsed = time.perf_counter() - started
+            print(f"Exported Parquet snapshot {snapshot_name} in "
+                  f"{elapsed:.3f}s.")
+            db_logger.info(
+                f"Exported Parquet snapshot {snapshot_name} "
+                f"({len(manifest['tables'])} tables) in {elapsed:.3f}s."
+            )
+            return snapshot_dir
+
+    def _prune_snapshots(self, current):
+        """
+        Remove the oldest snapshots beyond the retention count.
+        """
+        snapshots = sorted(
+            entry for entry in os.listdir(self.export_dir)
+            if entry.startswith("snapshot-") and entry != current
+        )
+        stale = snapshots[:max(0, len(snapshots) - self.keep_snapshots + 1)]
+        for entry in stale:
+            shutil.rmtree(os.path.join(self.export_dir, entry),
+                          ignore_errors=True)
+
+    async def export_snapshot_async(self):
+        """
+        Asynchronously export a snapshot using the default executor.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.export_snapshot)
+
+    async def _export_logged(self):
+        """
+        Run an export, logging instead of raising so background tasks
+        never die with an unretrieved exception.
+        """
+        try:
+            return await self.export_snapshot_async()
+        except Exception as e:
+            print(f"Error during Parquet export: {e}")
+            db_logger.error(f"Error during Parquet export: {e}")
+            return None
+
+    def schedule_export(self):
+        """
+        Start a background export unless one is already running.
+        Returns:
+            The asyncio task performing the export
+        """
+        if self._export_task is None or self._export_task.done():
+            loop = asyncio.get_running_loop()
+            self._export_task = loop.create_task(self._export_logged())
+        return self._export_task
+
+    def record_edit(self):
+        """
+        Count an applied edit and schedule an export once the configured
+        number of edits has accumulated.
+        """
+        self.edits_since_export += 1
+        if self.every_n_edits and \
+                self.edits_since_export >= self.every_n_edits:
+            self.schedule_export()
+
+    async def run_periodic(self):
+        """
+        Export a snapshot every `interval_seconds` until cancelled.
+        """
+        if not self.interval_seconds:
+            return
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            await self._export_logged()
+
+
+class ReadOnlyQueryEngine:
+    """
+    Runs analytical queries against the latest Parquet snapshot with its own
+    in-memory DuckDB instance, independent of the writer connection.
+    """
+
+    def __init__(self, export_dir=None):
+        self.export_dir = export_dir or settings.EXPORT_DIR
+        self.conn = None
+        self.snapshot = None
+        self._lock = threading.Lock()
+
+    def _current_snapshot(self):
+        """
+        Name of the currently published snapshot, or None.
+        """
+        pointer = os.path.join(self.export_dir, CURRENT_POINTER)
+        try:
+            with open(pointer, encoding="utf-8") as pointer_file:
+                return pointer_file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _refresh(self):
+        """
+        Bind a fresh reader connection when a newer snapshot is published.
+        """
+        # Imported on first use so API workers start without loading DuckDB
+        import duckdb
+
+        snapshot = self._current_snapshot()
+        if snapshot is None:
+            raise SnapshotUnavailableError(
+                "No Parquet snapshot has been exported yet."
+            )
+        if snapshot == self.snapshot:
+            return
+
+        snapshot_dir = os.path.join(self.export_dir, snapshot)
+        with open(os.path.join(snapshot_dir, MANIFEST_FILE),
+                  encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+
+        conn = duckdb.connect(":memory:")
+        for name, entry in manifest["tables"].items():
+            columns = ", ".join(f'"{column}"' for column in entry["columns"])
+            options = "hive_partitioning = false"
+            if entry["hive"]:
+                hive_types = ", ".join(
+                    f"'{column}': {column_type}"
+                    for column, column_type in entry["hive_types"].items()
+                )
+                options = (
+                    f"hive_partitioning = true, hive_types = {{{hive_types}}}"
+                )
+            conn.execute(
+                f"""
+                CREATE VIEW {name} AS
+                SELECT {columns}
+                FROM read_parquet({_sql_path(entry['path'])}, {options});
+                """
+            )
+        for view_sql in manifest["views"]:
+            try:
+                conn.execute(view_sql)
+            except duckdb.Error as e:
+                db_logger.warning(f"Skipping view in snapshot {snapshot}: {e}")
+
+        # Lock the reader down to the snapshot's files: queries can neither
+        # read other paths nor write files, attach databases or lift the
+        # restriction again
+        conn.execute(
+            f"SET allowed_directories = "
+            f"[{_sql_path(os.path.abspath(snapshot_dir) + os.sep)}];"
+        )
+        conn.execute("SET enable_external_access = false;")
+        conn.execute("SET lock_configuration = true;")
+
+        # Queries still running keep the previous instance alive via their
+        # cursors, so it is simply dropped rather than closed here.
+        self.conn = conn
+        self.snapshot = snapshot
+        db_logger.info(f"Read-only engine bound to snapshot {snapshot}.")
+
+    def execute_query(self, query, params=None, timeout=None, handle=None):
+        """
+        Execute a read-only query against the current snapshot. Analytical
+        queries run under the bulk query timeout unless one is given.
+        Returns:
+            PyArrow table with query results
+        """
+        check_read_only(query)
+        with self._lock:
+            self._refresh()
+            conn = self.conn
+        timeout = (
+            settings.BULK_QUERY_TIMEOUT_SECONDS if timeout is None
+            else timeout
+        )
+        print(f"Executing read-only query: {query}")
+        return execute_governed(NativeBackend(), conn, query, params,
+                                timeout, handle)
+
+    async def execute_query_async(self, query, params=None, timeout=None):
+        """
+        Asynchronously execute a read-only query using the default executor.
+        Cancelling the awaiting task interrupts the query.
+        """
+        handle = QueryHandle()
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                None, self.execute_query, query, params, timeout, handle
+            )
+        except asyncio.CancelledError:
+            handle.cancel()
+            raise
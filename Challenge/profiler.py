@@ -0,0 +1,229 @@
+"""
+Opt-in slow-query profiler for DuckDBManager.execute_query.
+Statements slower than a threshold are fingerprinted by shape: literals,
+parameters and repeated predicate groups are collapsed, so every edit of
+the same kind shares one entry. The profiler keeps the top-N slowest shapes
+with their call statistics and the DuckDB plan of their slowest run. The
+plan is DuckDB's profile of that run itself, so no statement is run again
+to explain it and the connection is not held any longer than the run.
+"""
+
+import hashlib
+import re
+import threading
+import time
+
+import settings
+from backends import statement_types
+from logger import db_logger
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_PARAMETERS = re.compile(r"\$\d+|\?")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ROWS = re.compile(r"\(\?, \.\.\.\)(?:\s*,\s*\(\?, \.\.\.\))+")
+_REPEATED_GROUPS = re.compile(r"(\([^()]*\))(?:\s+or\s+\1)+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """
+    Shape of a query: literals and parameters become `?`, value lists, rows
+    and OR-ed copies of one predicate group collapse to a single one, case
+    and whitespace are normalized.
+    """
+    text = _COMMENTS.sub(" ", query)
+    text = _STRINGS.sub("?", text)
+    text = _PARAMETERS.sub("?", text)
+    text = _NUMBERS.sub("?", text)
+    text = _WHITESPACE.sub(" ", text).strip().rstrip(";").strip().lower()
+    text = _ROWS.sub("(?, ...)", _LISTS.sub("(?, ...)", text))
+    return _REPEATED_GROUPS.sub(r"\1", text)
+
+
+def fingerprint(query):
+    """
+    Short stable ID of a query's shape.
+    """
+    return hashlib.sha1(
+        normalize_query(query).encode("utf-8")
+    ).hexdigest()[:12]
+
+
+class QueryProfiler:
+    """
+    Records statements slower than `threshold_ms` and keeps the `top_n`
+    slowest query shapes. Thread-safe; one instance is shared by every
+    handle of the process.
+    """
+
+    def __init__(self, enabled=None, threshold_ms=None, top_n=None,
+                 explain=None):
+        self.enabled = (
+            settings.PROFILE_QUERIES if enabled is None else enabled
+        )
+        self.threshold_ms = (
+            settings.PROFILE_THRESHOLD_MS if threshold_ms is None
+            else threshold_ms
+        )
+        self.top_n = settings.PROFILE_TOP_N if top_n is None else top_n
+        self.explain = (
+            settings.PROFILE_EXPLAIN if explain is None else explain
+        )
+        self._entries = {}  # fingerprint -> entry
+        self._lock = threading.Lock()
+
+    def is_slow(self, elapsed_ms):
+        return self.enabled and elapsed_ms >= self.threshold_ms
+
+    def captures_plans(self):
+        """
+        Whether statements are profiled by DuckDB as they run, so slow ones
+        are recorded with the plan of that run.
+        """
+        return self.enabled and self.explain
+
+    @staticmethod
+    def has_plan(query):
+        """
+        Whether DuckDB's profile of a query is its whole plan. Scripts of
+        several statements get no plan, their profile only covers the last
+        statement.
+        """
+        try:
+            return len(statement_types(query)) == 1
+        except ValueError:
+            return False
+
+    def record(self, query, elapsed_ms, query_class=None, workbook_id=None,
+               plan=None, plan_kind=None):
+        """
+        Record a slow statement under its shape, keeping the plan of the
+        slowest run, and evict the fastest shape beyond `top_n`.
+        """
+        key = fingerprint(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {
+                    "fingerprint": key,
+                    "shape": normalize_query(query),
+                    "query_class": query_class,
+                    "workbook_id": workbook_id,
+                    "calls": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "query": None,
+                    "plan": None,
+                    "plan_kind": None,
+                }
+            entry["calls"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["last_ms"] = elapsed_ms
+            entry["last_seen"] = time.time()
+            if elapsed_ms >= entry["max_ms"]:
+                entry["max_ms"] = elapsed_ms
+                entry["query"] = query.strip()[:settings.PROFILE_QUERY_CHARS]
+                if plan is not None:
+                    entry["plan"] = plan
+                    entry["plan_kind"] = plan_kind
+            self._evict()
+        db_logger.warning(
+            f"Slow query {key} ({elapsed_ms:.1f} ms, {query_class}): "
+            f"{normalize_query(query)[:200]}"
+        )
+
+    def _evict(self):
+        """
+        Drop the fastest shapes beyond `top_n`. Called with the lock held.
+        """
+        while len(self._entries) > self.top_n:
+            fastest = min(
+                self._entries.values(), key=lambda item: item["max_ms"]
+            )
+            del self._entries[fastest["fingerprint"]]
+
+    def report(self):
+        """
+        Recorded query shapes, slowest first.
+        """
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries.values()]
+        for entry in entries:
+            entry["mean_ms"] = entry["total_ms"] / entry["calls"]
+        return sorted(entries, key=lambda entry: -entry["max_ms"])
+
+    def configure(self, enabled=None, threshold_ms=None, top_n=None,
+                  explain=None):
+        """
+        Change the profiling mode at runtime; None keeps a value.
+        """
+        with self._lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if threshold_ms is not None:
+                self.threshold_ms = threshold_ms
+            if top_n is not None:
+                self.top_n = top_n
+                self._evict()
+            if explain is not None:
+                self.explain = explain
+
+    def status(self):
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold_ms,
+            "top_n": self.top_n,
+            "explain": self.explain,
+        }
+
+    def reset(self):
+        """
+        Forget every recorded query shape.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+_shared_profiler = None
+
+
+def get_profiler():
+    """
+    The process-wide QueryProfiler, created on first use.
+    """
+    global _shared_profiler
+    if _shared_profiler is None:
+        _shared_profiler = QueryProfiler()
+    return _shared_profiler
+
+
+PROFILER_COMMANDS = ("slow_queries", "profiling", "reset_slow_queries")
+
+
+def profiler_command(request, profiler=None):
+    """
+    Apply an admin profiler command, either sent to the API or forwarded to
+    the writer process, whose statements are the ones being profiled.
+    "profiling" takes the optional `enabled`, `threshold_ms`, `top_n` and
+    `explain` fields of the request.
+    Returns:
+        Response body with the profiling mode and the slowest query shapes
+    """
+    profiler = profiler or get_profiler()
+    command = request["command"]
+    if command == "profiling":
+        profiler.configure(
+            enabled=request.get("enabled"),
+            threshold_ms=request.get("threshold_ms"),
+            top_n=request.get("top_n"),
+            explain=request.get("explain"),
+        )
+    elif command == "reset_slow_queries":
+        profiler.reset()
+    return {
+        "status": "success",
+        "profiling": profiler.status(),
+        "slow_queries": profiler.report(),
+    }
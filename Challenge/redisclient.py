@@ -0,0 +1,546 @@
+"""
+Shared asynchronous Redis layer for the API and the Redis listener.
+Provides one pooled RESP3 client per process with retries and exponential
+backoff, a circuit breaker that fails fast while Redis is down, and XADD
+batching that sends concurrent stream appends in a single pipeline. A
+`memory://` URL selects an in-process stand-in so tests and benchmarks run
+without a Redis server.
+"""
+
+import asyncio
+import time
+
+import redis
+
+import settings
+from logger import redis_logger
+
+# Errors that indicate Redis itself is unreachable, as opposed to a bad
+# command; only these are retried and counted by the circuit breaker
+CONNECTION_ERRORS = (
+    redis.exceptions.ConnectionError,
+    redis.exceptions.TimeoutError,
+    OSError,
+)
+
+
+class RedisUnavailableError(redis.exceptions.ConnectionError):
+    """
+    Raised without contacting Redis while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+    After `threshold` failed calls the circuit opens and calls fail fast for
+    `reset_seconds`. Then a single trial call is let through: success closes
+    the circuit, failure opens it again.
+    """
+
+    def __init__(self, threshold, reset_seconds, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        """
+        "closed", "open" or "half_open".
+        """
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """
+        Admit or reject a call.
+        Raises:
+            RedisUnavailableError: If the circuit is open
+        """
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return
+        raise RedisUnavailableError(
+            "Redis circuit breaker is open, skipping call."
+        )
+
+    def record_success(self):
+        """
+        Close the circuit after a successful call.
+        """
+        if self.opened_at is not None:
+            redis_logger.info("Redis circuit breaker closed.")
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        """
+        End a call that neither succeeded nor failed to connect (another
+        error or cancellation), letting the next call be the trial.
+        """
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        """
+        Count a failed call, opening the circuit at the threshold.
+        """
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.failures >= self.threshold or self.opened_at is not None:
+            self.opened_at = self.clock()
+            redis_logger.error(
+                f"Redis circuit breaker open after {self.failures} failures."
+            )
+
+
+def _entry_id(entry_id):
+    """
+    Parse a stream entry ID such as "1700000000000-3" into a sortable tuple.
+    """
+    milliseconds, _, sequence = str(entry_id).partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+class InMemoryPipeline:
+    """
+    Buffered commands of an InMemoryRedis, applied on `execute`.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.commands = []
+
+    def xadd(self, name, fields, **kwargs):
+        self.commands.append((name, fields, kwargs))
+        return self
+
+    async def execute(self):
+        results = [
+            await self.client.xadd(name, fields, **kwargs)
+            for name, fields, kwargs in self.commands
+        ]
+        self.commands = []
+        return results
+
+
+class InMemoryRedis:
+    """
+    In-process stand-in for the Redis stream commands used by Liquid Duck.
+    Mirrors redis-py with `decode_responses=True` and RESP2-shaped replies.
+    """
+
+    # Blocking XREADs poll instead of waiting on a condition so the stand-in
+    # can be shared by event loops created and closed by separate tests
+    POLL_SECONDS = 0.005
+
+    def __init__(self):
+        self.streams = {}
+        self.groups = {}  # (stream, group) -> last delivered ID and pending
+        self._last_id = (0, 0)
+
+    def _next_id(self):
+        milliseconds = int(time.time() * 1000)
+        if milliseconds <= self._last_id[0]:
+            self._last_id = (self._last_id[0], self._last_id[1] + 1)
+        else:
+            self._last_id = (milliseconds, 0)
+        return f"{self._last_id[0]}-{self._last_id[1]}"
+
+    async def ping(self):
+        return True
+
+    async def xadd(self, name, fields, id="*", maxlen=None,
+                   approximate=True):
+        entry_id = self._next_id() if id == "*" else id
+        entries = self.streams.setdefault(name, [])
+        entries.append(
+            (entry_id, {str(key): str(value) for key, value in fields.items()})
+        )
+        if maxlen is not None and len(entries) > maxlen:
+            del entries[:len(entries) - maxlen]
+        return entry_id
+
+    async def xrange(self, name, min="-", max="+", count=None):
+        low = (0, 0) if min == "-" else _entry_id(min)
+        high = None if max == "+" else _entry_id(max)
+        entries = [
+            entry for entry in self.streams.get(name, [])
+            if _entry_id(entry[0]) >= low
+            and (high is None or _entry_id(entry[0]) <= high)
+        ]
+        return entries[:count] if count else entries
+
+    async def xlen(self, name):
+        return len(self.streams.get(name, []))
+
+    async def xread(self, streams, count=None, block=None):
+        # "$" means entries added after this call started
+        after = {
+            name: (
+                _entry_id(self.streams[name][-1][0])
+                if entry_id == "$" and self.streams.get(name)
+                else (0, 0) if entry_id == "$" else _entry_id(entry_id)
+            )
+            for name, entry_id in streams.items()
+        }
+        deadline = (
+            time.monotonic() + block / 1000 if block is not None else None
+        )
+        while True:
+            result = []
+            for name, last in after.items():
+                entries = [
+                    entry for entry in self.streams.get(name, [])
+                    if _entry_id(entry[0]) > last
+                ]
+                if entries:
+                    result.append([name, entries[:count] if count else entries])
+            if result or deadline is None or (
+                    block and time.monotonic() >= deadline):
+                return result
+            await asyncio.sleep(self.POLL_SECONDS)
+
+    async def xgroup_create(self, name, groupname, id="$", mkstream=False):
+        if (name, groupname) in self.groups:
+            raise redis.exceptions.ResponseError(
+                "BUSYGROUP Consumer Group name already exists"
+            )
+        if name not in self.streams:
+            if not mkstream:
+                raise redis.exceptions.ResponseError(
+                    "The XGROUP subcommand requires the key to exist."
+                )
+            self.streams[name] = []
+        entries = self.streams[name]
+        self.groups[(name, groupname)] = {
+            "last": (
+                _entry_id(entries[-1][0]) if id == "$" and entries
+                else (0, 0) if id == "$" else _entry_id(id)
+            ),
+            "pending": {},  # entry ID -> consumer
+        }
+        return True
+
+    async def xreadgroup(self, groupname, consumername, streams, count=None,
+                         block=None, noack=False):
+        # ">" delivers new entries; any other ID re-reads the consumer's
+        # pending entries after it, without blocking
+        for name in streams:
+            if (name, groupname) not in self.groups:
+                raise redis.exceptions.ResponseError(
+                    f"NOGROUP No such consumer group '{groupname}' for "
+                    f"key name '{name}'"
+                )
+        history = any(entry_id != ">" for entry_id in streams.values())
+        deadline = (
+            time.monotonic() + block / 1000 if block is not None else None
+        )
+        while True:
+            result = []
+            for name, entry_id in streams.items():
+                group = self.groups[(name, groupname)]
+                if entry_id != ">":
+                    pending = [
+                        entry for entry in self.streams.get(name, [])
+                        if group["pending"].get(entry[0]) == consumername
+                        and _entry_id(entry[0]) > _entry_id(entry_id)
+                    ]
+                    result.append([name, pending[:count] if count else pending])
+                    continue
+                entries = [
+                    entry for entry in self.streams.get(name, [])
+                    if _entry_id(entry[0]) > group["last"]
+                ]
+                entries = entries[:count] if count else entries
+                if entries:
+                    group["last"] = _entry_id(entries[-1][0])
+                    if not noack:
+                        for delivered, _ in entries:
+                            group["pending"][delivered] = consumername
+                    result.append([name, entries])
+            if result or history or deadline is None or (
+                    block and time.monotonic() >= deadline):
+                return result
+            await asyncio.sleep(self.POLL_SECONDS)
+
+    async def xack(self, name, groupname, *ids):
+        group = self.groups.get((name, groupname))
+        if group is None:
+            return 0
+        return sum(
+            group["pending"].pop(entry_id, None) is not None
+            for entry_id in ids
+        )
+
+    async def delete(self, *names):
+        for name, groupname in list(self.groups):
+            if name in names:
+                del self.groups[(name, groupname)]
+        return sum(self.streams.pop(name, None) is not None for name in names)
+
+    def pipeline(self, transaction=True):
+        return InMemoryPipeline(self)
+
+    async def aclose(self):
+        return None
+
+
+def _stream_pairs(reply):
+    """
+    Normalize an XREAD reply to a list of [stream, entries] pairs.
+    RESP3 connections of older redis-py versions return a mapping of stream
+    to a one-element list wrapping the entries instead.
+    """
+    if not reply:
+        return []
+    if not isinstance(reply, dict):
+        return reply
+    pairs = []
+    for stream, entries in reply.items():
+        if entries and (not entries[0] or not isinstance(entries[0][0], str)):
+            entries = entries[0]
+        pairs.append([stream, entries])
+    return pairs
+
+
+def _bounded_block(block):
+    """
+    BLOCK of a stream read, capped so it ends before the socket times out.
+    """
+    return min(block, settings.REDIS_MAX_BLOCK_MS) if block else block
+
+
+class RedisClient:
+    """
+    Resilient wrapper around a pooled Redis client (or the in-process
+    stand-in). Every call passes the circuit breaker. Connection errors are
+    retried with backoff by the connection pool before they count as a
+    failure. Concurrent `xadd` calls are coalesced into one pipeline.
+    """
+
+    def __init__(self, client, breaker=None):
+        self.client = client
+        self.breaker = breaker or CircuitBreaker(
+            settings.REDIS_BREAKER_THRESHOLD,
+            settings.REDIS_BREAKER_RESET_SECONDS
+        )
+        self._pending = []  # (name, fields, kwargs, future) awaiting a flush
+        self._flush_tasks = set()  # strong references to running flushes
+
+    async def _call(self, command, *args, **kwargs):
+        """
+        Run a client command through the circuit breaker. A blocking read
+        that times out returns no entries without counting as a failure:
+        the stream was idle, the server is not necessarily unreachable.
+        """
+        self.breaker.before_call()
+        try:
+            result = await command(*args, **kwargs)
+        except CONNECTION_ERRORS as e:
+            if kwargs.get("block") and isinstance(
+                    e, redis.exceptions.TimeoutError):
+                self.breaker.release_trial()
+                return []
+            self.breaker.record_failure()
+            redis_logger.error(f"Redis call failed: {e}")
+            raise
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def ping(self):
+        return await self._call(self.client.ping)
+
+    async def xadd(self, name, fields, **kwargs):
+        """
+        Append an entry to a stream. Entries appended by concurrent tasks
+        during the same event loop iteration share one pipelined round trip.
+        Returns:
+            ID of the new stream entry
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((name, fields, kwargs, future))
+        if len(self._pending) == 1:
+            asyncio.get_running_loop().call_soon(self._start_flush)
+        return await future
+
+    def _start_flush(self):
+        """
+        Run a flush as a task, keeping a reference until it is done.
+        """
+        task = asyncio.ensure_future(self._flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task):
+        self._flush_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            redis_logger.error(f"Redis XADD flush failed: {task.exception()}")
+
+    async def _flush(self):
+        """
+        Send every pending XADD in a single pipeline.
+        """
+        batch, self._pending = self._pending, []
+        try:
+            entry_ids = await self.xadd_many(
+                [(name, fields, kwargs) for name, fields, kwargs, _ in batch]
+            )
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (*_, future), entry_id in zip(batch, entry_ids):
+            if not future.done():
+                future.set_result(entry_id)
+
+    async def xadd_many(self, entries):
+        """
+        Append several entries in one non-transactional pipeline.
+        Args:
+            entries: (stream, fields) or (stream, fields, xadd kwargs) tuples
+        Returns:
+            List of the new entry IDs in order
+        """
+        async def send():
+            async with self.client.pipeline(transaction=False) as pipe:
+                for name, fields, *options in entries:
+                    pipe.xadd(name, fields, **(options[0] if options else {}))
+                return await pipe.execute()
+
+        return await self._call(send)
+
+    async def xrange(self, name, min="-", max="+", count=None):
+        return await self._call(self.client.xrange, name, min, max, count)
+
+    async def xread(self, streams, count=None, block=None):
+        """
+        Read new stream entries as a list of [stream, entries] pairs,
+        whichever RESP version the connection speaks.
+        """
+        reply = await self._call(
+            self.client.xread, streams, count=count,
+            block=_bounded_block(block)
+        )
+        return _stream_pairs(reply)
+
+    async def ensure_group(self, name, group, id="$"):
+        """
+        Create a consumer group on a stream, creating the stream if needed.
+        An existing group keeps its position.
+        Returns:
+            Whether the group was created
+        """
+        try:
+            await self._call(
+                self.client.xgroup_create, name, group, id=id, mkstream=True
+            )
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+            return False
+        return True
+
+    async def xreadgroup(self, group, consumer, streams, count=None,
+                         block=None):
+        """
+        Read stream entries through a consumer group as a list of
+        [stream, entries] pairs. The ID ">" reads entries never delivered
+        to the group, any other ID re-reads the consumer's pending entries.
+        """
+        reply = await self._call(
+            self.client.xreadgroup, group, consumer, streams,
+            count=count, block=_bounded_block(block)
+        )
+        return _stream_pairs(reply)
+
+    async def xack(self, name, group, *ids):
+        return await self._call(self.client.xack, name, group, *ids)
+
+    async def delete(self, *names):
+        return await self._call(self.client.delete, *names)
+
+    async def close(self):
+        """
+        Close the client and disconnect its connection pool.
+        """
+        close = getattr(self.client, "aclose", None) or self.client.close
+        await close()
+        pool = getattr(self.client, "connection_pool", None)
+        if pool is not None:
+            await pool.disconnect()
+
+
+def create_redis_client(url=None):
+    """
+    Build a RedisClient for `url`, defaulting to the configured URL.
+    Real servers get a bounded connection pool speaking RESP3 with retries,
+    exponential backoff with jitter and periodic health checks of idle
+    connections, so no per-request PING is needed.
+    """
+    url = url or settings.REDIS_URL
+    if url.startswith("memory://"):
+        return RedisClient(InMemoryRedis())
+    # The asyncio client is only loaded once a real server is used
+    import redis.asyncio as aioredis
+    from redis.asyncio.retry import Retry
+    from redis.backoff import EqualJitterBackoff
+
+    pool = aioredis.ConnectionPool.from_url(
+        url,
+        decode_responses=True,
+        protocol=settings.REDIS_PROTOCOL,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        # The socket timeout also bounds blocking stream reads, so it must
+        # outlast the longest BLOCK by a full command timeout
+        socket_timeout=(
+            settings.REDIS_SOCKET_TIMEOUT_SECONDS
+            + settings.REDIS_MAX_BLOCK_MS / 1000
+        ),
+        socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+        health_check_interval=30,
+        retry=Retry(
+            EqualJitterBackoff(
+                cap=settings.REDIS_BACKOFF_CAP_SECONDS,
+                base=settings.REDIS_BACKOFF_BASE_SECONDS
+            ),
+            settings.REDIS_RETRIES
+        ),
+        retry_on_error=[
+            redis.exceptions.ConnectionError,
+            redis.exceptions.TimeoutError,
+        ],
+    )
+    return RedisClient(aioredis.Redis(connection_pool=pool))
+
+
+_shared_client = None
+
+
+def get_redis_client():
+    """
+    The process-wide RedisClient, created on first use.
+    """
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = create_redis_client()
+    return _shared_client
@@ -1,54 +1,245 @@
+"""
+DuckDB writer process.
+Applies the update, undo and redo requests of the Redis request streams in
+order, whether published directly or forwarded by stateless API workers,
+broadcasts them on the response streams and replies to the worker that
+forwarded them. It is the only process that opens the database files, and it
+exports the Parquet snapshots the API workers serve reads from.
+"""
+
 import asyncio
-import redis.asyncio as aioredis
+import contextlib
+import sys
 import json
-from DuckDBManager import DuckDBManager
+import settings
+from pydantic import ValidationError
+from backends import QueryCancelledError, QueryTimeoutError
+from DuckDBManager import DuckDBManager, is_default_workbook
 from logger import redis_logger
+from parquet_exporter import ParquetExporter
+from profiler import PROFILER_COMMANDS, profiler_command
+from redisclient import RedisUnavailableError, get_redis_client
+from streams import (
+    REQUEST_CONSUMER,
+    REQUEST_GROUP,
+    request_stream,
+    workbook_from_stream,
+)
+from updates import (
+    HISTORY_ACTIONS,
+    NothingToReplay,
+    UpdateFailed,
+    UpdateRejected,
+    UpdateRequest,
+    apply_history_action,
+    apply_update,
+    broadcast_history_action,
+    broadcast_update,
+    history_response,
+    update_response,
+)
+from writerclient import send_reply
+
+# Shared Redis client, created when the listener starts
+redis_client = None
+
+
+@contextlib.contextmanager
+def pinned_workbook(workbook_id):
+    """
+    Hold a workbook handle while a request is applied to it, rejecting
+    invalid workbook IDs.
+    """
+    try:
+        handle = DuckDBManager.for_workbook(workbook_id, pin=True)
+    except ValueError as e:
+        raise UpdateRejected(str(e)) from e
+    try:
+        yield handle
+    finally:
+        DuckDBManager.release(handle)
+
+
+async def handle_request(request, exporter=None):
+    """
+    Apply one request and build the reply for the worker that sent it.
+    Returns:
+        Dict with a `status_code` and a `body` or `detail`
+    """
+    try:
+        if request.get("command") == "export":
+            if exporter is None:
+                return {"status_code": 409, "detail": "Exports are disabled."}
+            snapshot_dir = await exporter.export_snapshot_async()
+            return {
+                "status_code": 200,
+                "body": {"status": "success", "snapshot": snapshot_dir},
+            }
+        if request.get("command") in PROFILER_COMMANDS:
+            return {"status_code": 200, "body": profiler_command(request)}
+        if request.get("command") in HISTORY_ACTIONS:
+            action = request["command"]
+            workbook_id = request.get("workbook_id")
+            with pinned_workbook(workbook_id) as workbook_db:
+                outcome = await apply_history_action(workbook_db, action)
+            await broadcast_history_action(
+                redis_client, workbook_id, action, outcome
+            )
+            if exporter is not None and is_default_workbook(workbook_id):
+                exporter.record_edit()
+            return {
+                "status_code": 200,
+                "body": history_response(action, outcome),
+            }
+
+        # Publishers writing to the stream directly may send numeric values
+        if "value" in request and not isinstance(request["value"], str):
+            request = {**request, "value": str(request["value"])}
+        update = UpdateRequest.model_validate(request)
+        with pinned_workbook(update.workbook_id) as workbook_db:
+            outcome = await apply_update(workbook_db, update)
+        await broadcast_update(redis_client, update, outcome)
+        if exporter is not None and is_default_workbook(update.workbook_id):
+            exporter.record_edit()
+        return {"status_code": 200, "body": update_response(update, outcome)}
+    except (ValidationError, UpdateRejected) as e:
+        return {"status_code": 400, "detail": str(e)}
+    except NothingToReplay as e:
+        return {"status_code": 409, "detail": str(e)}
+    except QueryTimeoutError:
+        return {"status_code": 504, "detail": "Update timed out."}
+    except QueryCancelledError:
+        return {"status_code": 499, "detail": "Update cancelled."}
+    except UpdateFailed as e:
+        return {"status_code": 500, "detail": str(e)}
+    except RedisUnavailableError:
+        return {
+            "status_code": 503,
+            "detail": "Redis is unavailable, changes were not broadcast.",
+        }
+    except Exception as e:
+        redis_logger.error(f"Unexpected error applying request: {str(e)}")
+        return {"status_code": 500, "detail": f"Server error: {str(e)}"}
+
 
-redis_client = aioredis.from_url("redis://localhost:6379", decode_responses=True)
-db_manager = DuckDBManager()
+async def process_messages(workbook_id, message_list, exporter=None):
+    """
+    Apply the requests of one workbook shard in stream order.
+    """
+    for _, message in message_list:
+        request = json.loads(message["data"])
+        print(f"Processing request for workbook {workbook_id}: {request}")
+        redis_logger.info(f"Processing request for workbook {workbook_id}: {request}")
+
+        reply = await handle_request(request, exporter)
+        if reply["status_code"] != 200:
+            redis_logger.error(f"Request failed: {reply['detail']}")
+
+        # Answer the API worker that forwarded the request, if any
+        await send_reply(redis_client, message, reply)
+        print(f"Processed request with status {reply['status_code']}: {request}")
+        redis_logger.info(f"Processed request with status {reply['status_code']}: {request}")
+
+
+async def process_deliveries(workbook_id, deliveries, exporter=None):
+    """
+    Apply the requests of one workbook shard read through the consumer
+    group, acknowledging each once it is answered so that it is not
+    replayed after a restart.
+    Args:
+        deliveries: (request stream, stream entry) pairs in stream order
+    """
+    for stream, entry in deliveries:
+        await process_messages(workbook_id, [entry], exporter)
+        await redis_client.xack(stream, REQUEST_GROUP, entry[0])
 
 
-REQUEST_STREAM = "request_duck"
-RESPONSE_STREAM = "response_duck"
+def request_workbook(stream, fields):
+    """
+    Workbook a request stream entry is for, None if it is not a request.
+    """
+    try:
+        return (
+            json.loads(fields["data"]).get("workbook_id")
+            or workbook_from_stream(stream)
+        )
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
 
 
-async def listen_to_requests():
+async def listen_to_requests(workbook_ids=None, export=True):
     """
-    Listen to Redis request stream and process updates.
+    Listen to the default Redis request stream and those of the given
+    workbooks and process updates. Every workbook is its own shard with a separate database file,
+    so shards are applied concurrently while requests within one shard keep
+    their order. Requests name their workbook, which lets API workers send
+    every write through the default stream.
+
+    Streams are read through a consumer group, so requests sent while the
+    writer starts or restarts wait in the stream instead of being skipped.
+    A restarted writer first replays the requests it had read but not
+    answered before reading new ones.
     """
+    global redis_client
+    if redis_client is None:
+        redis_client = get_redis_client()
     print("Starting Redis listener...")
-    redis_logger.info("Listening to Redis request stream...")
-    while True:
-        try:
-            print("Waiting for messages on the request stream...")
-            messages = await redis_client.xread({REQUEST_STREAM: "$"}, block=5000, count=1)
-            print(f"Received message(s): {messages}")
-            for stream, message_list in messages:
-                for _, message in message_list:
-                    request = json.loads(message["data"])
-                    print(f"Processing request: {request}")
-                    redis_logger.info(f"Processing request: {request}")
-
-                    # Update DuckDB table
-                    await db_manager.execute_query_async(
-                        f"""
-                        UPDATE {request['table']}
-                        SET {request['column']} = '{request['value']}'
-                        WHERE {request['condition']};
-                        """
-                    )
-
-                    # Broadcast the success response to the response stream
-                    await redis_client.xadd(
-                        RESPONSE_STREAM,
-                        {"data": json.dumps({"status": "success", "request": request})},
-                    )
-                    print(f"Broadcasted response for request: {request}")
-                    redis_logger.info(f"Broadcasted response for request: {request}")
-        except Exception as e:
-            print(f"Error processing request stream: {str(e)}")
-            redis_logger.error(f"Error processing request stream: {str(e)}")
+    # The default stream is always read: API workers forward every write
+    # there. "0" replays this consumer's pending requests, ">" then reads
+    # new ones
+    streams = {
+        request_stream(workbook_id): "0"
+        for workbook_id in [None, *(workbook_ids or [])]
+    }
+    for stream in streams:
+        await redis_client.ensure_group(stream, REQUEST_GROUP)
+    redis_logger.info(f"Listening to Redis request streams: {list(streams)}")
+
+    # The writer owns the default database, so it also exports the Parquet
+    # snapshots that API workers serve reads from
+    exporter = ParquetExporter(DuckDBManager()) if export else None
+    export_task = asyncio.create_task(exporter.run_periodic()) if exporter else None
+    try:
+        while True:
+            try:
+                print("Waiting for messages on the request streams...")
+                messages = await redis_client.xreadgroup(
+                    REQUEST_GROUP, REQUEST_CONSUMER, streams,
+                    block=settings.REDIS_MAX_BLOCK_MS, count=10
+                )
+                print(f"Received message(s): {messages}")
+                shards = {}
+                for stream, message_list in messages:
+                    if streams[stream] != ">":
+                        # Continue the replay after the last pending entry,
+                        # then switch to new entries once none are left
+                        streams[stream] = (
+                            message_list[-1][0] if message_list else ">"
+                        )
+                    for entry in message_list:
+                        workbook_id = request_workbook(stream, entry[1])
+                        if workbook_id is None:
+                            # Trimmed or malformed entries cannot be applied
+                            redis_logger.error(f"Skipping request {entry[0]} on {stream}.")
+                            await redis_client.xack(stream, REQUEST_GROUP, entry[0])
+                            continue
+                        shards.setdefault(workbook_id, []).append((stream, entry))
+                await asyncio.gather(*(
+                    process_deliveries(workbook_id, deliveries, exporter)
+                    for workbook_id, deliveries in shards.items()
+                ))
+            except RedisUnavailableError as e:
+                # The circuit breaker is open; wait for it to allow a trial call
+                redis_logger.warning(f"Redis unavailable: {str(e)}")
+                await asyncio.sleep(settings.REDIS_BREAKER_RESET_SECONDS)
+            except Exception as e:
+                print(f"Error processing request stream: {str(e)}")
+                redis_logger.error(f"Error processing request stream: {str(e)}")
+    finally:
+        if export_task is not None:
+            export_task.cancel()
 
 
 if __name__ == "__main__":
-    asyncio.run(listen_to_requests())
+    # Usage: python redislistener.py [workbook_id ...]
+    asyncio.run(listen_to_requests(sys.argv[1:] or None))
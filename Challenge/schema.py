@@ -0,0 +1,196 @@
+"""
+Shared SQL definitions for the sales summary hierarchy.
+The monthly summary and its quarter / year rollup tiers are defined once
+here and used by both the data initialization script and DuckDBManager.
+"""
+
+SUMMARY_TABLE = "sales_summary_by_product_family"
+
+# Monthly summary over the supplier > brand > family hierarchy. The invoice
+# month is derived once per sales row and stored as a typed DATE key holding
+# the first day of the month. Measures are DOUBLE so that splitting an edit
+# across children keeps the parent sums exact.
+SUMMARY_SELECT = """
+    WITH sales_by_month AS (
+        SELECT
+            p.supplier,
+            p.brand,
+            p.family,
+            CAST(DATE_TRUNC('month', CAST(s.invoice_date AS DATE)) AS DATE)
+            AS invoice_date_month,
+            s.quantity,
+            s.net_price
+        FROM sales s
+        JOIN product p ON s.product_id = p.product_id
+    )
+    SELECT
+        supplier,
+        brand,
+        family,
+        invoice_date_month,
+        CAST(SUM(quantity) AS DOUBLE) AS quantity,
+        CAST(SUM(net_price) AS DOUBLE) AS net_amount,
+        GROUPING_ID(supplier, brand, family) AS grouping_set_id
+    FROM sales_by_month
+    GROUP BY GROUPING SETS (
+        (supplier, brand, family, invoice_date_month),
+        (supplier, brand, invoice_date_month),
+        (supplier, invoice_date_month)
+    )
+"""
+
+# grouping_set_id values of GROUPING_ID(supplier, brand, family): a bit is
+# set for every aggregated column, so coarser levels have larger IDs
+FAMILY_LEVEL = 0
+BRAND_LEVEL = 1
+SUPPLIER_LEVEL = 3
+DESCENDANT_LEVELS = {
+    SUPPLIER_LEVEL: [BRAND_LEVEL, FAMILY_LEVEL],
+    BRAND_LEVEL: [FAMILY_LEVEL],
+    FAMILY_LEVEL: [],
+}
+
+# Summary columns holding values that are split and summed along the
+# hierarchy
+MEASURE_COLUMNS = ["quantity", "net_amount"]
+
+# Coarser time buckets materialized from the monthly summary
+ROLLUP_TIERS = {
+    "quarter": {
+        "table": "sales_summary_by_product_family_quarter",
+        "column": "invoice_date_quarter",
+    },
+    "year": {
+        "table": "sales_summary_by_product_family_year",
+        "column": "invoice_date_year",
+    },
+}
+
+
+def tier_select_sql(tier, where=""):
+    """
+    Build the SELECT aggregating monthly summary rows into a rollup tier.
+    Args:
+        tier: Key of ROLLUP_TIERS, also used as the DATE_TRUNC part
+        where: Optional WHERE clause restricting the monthly rows read
+    Returns:
+        SQL string producing the rows of the tier table
+    """
+    column = ROLLUP_TIERS[tier]["column"]
+    return f"""
+        SELECT
+            supplier,
+            brand,
+            family,
+            CAST(DATE_TRUNC('{tier}', invoice_date_month) AS DATE) AS {column},
+            SUM(quantity) AS quantity,
+            SUM(net_amount) AS net_amount,
+            grouping_set_id
+        FROM {SUMMARY_TABLE}
+        {where}
+        GROUP BY supplier, brand, family, {column}, grouping_set_id
+    """
+
+
+# Editable tables and their columns. Structured conditions may only filter
+# on KEY_COLUMNS: primary keys and hierarchy columns that point lookups and
+# targeted rebalances are keyed on.
+TABLE_COLUMNS = {
+    "product": ["product_id", "name", "supplier", "brand", "family"],
+    "customer": [
+        "customer_id", "type", "capacity", "chain", "city", "province",
+        "postal_code",
+    ],
+    "sales": [
+        "product_id", "customer_id", "invoice_date", "quantity", "net_price",
+    ],
+    SUMMARY_TABLE: [
+        "supplier", "brand", "family", "invoice_date_month", "quantity",
+        "net_amount", "grouping_set_id",
+    ],
+}
+
+KEY_COLUMNS = {
+    "product": ["product_id", "supplier", "brand", "family"],
+    "customer": ["customer_id"],
+    "sales": ["product_id", "customer_id", "invoice_date"],
+    SUMMARY_TABLE: [
+        "supplier", "brand", "family", "invoice_date_month", "grouping_set_id",
+    ],
+}
+
+# Primary keys of the base tables
+PRIMARY_KEYS = {
+    "product": ["product_id"],
+    "customer": ["customer_id"],
+}
+
+# ART indexes as (name, table, columns, unique). DuckDB answers a filter from
+# an index only when it is a single-column equality or IN predicate, so every
+# column that cell updates and rebalances look rows up by gets its own index.
+# The summary key holds NULLs for the brand and family of coarser levels,
+# which rules out a primary key there; a unique index declares it instead.
+INDEXES = [
+    ("idx_sales_product_id", "sales", ["product_id"], False),
+    ("idx_sales_customer_id", "sales", ["customer_id"], False),
+    ("idx_summary_key", SUMMARY_TABLE, KEY_COLUMNS[SUMMARY_TABLE], True),
+    ("idx_summary_supplier", SUMMARY_TABLE, ["supplier"], False),
+    ("idx_summary_brand", SUMMARY_TABLE, ["brand"], False),
+    ("idx_summary_family", SUMMARY_TABLE, ["family"], False),
+] + [
+    (
+        f"idx_summary_{tier}_key",
+        spec["table"],
+        ["supplier", "brand", "family", spec["column"], "grouping_set_id"],
+        True,
+    )
+    for tier, spec in ROLLUP_TIERS.items()
+]
+
+# Invoice months given their own column by the pivot views
+PIVOT_MONTHS = ["2024-01", "2024-02", "2024-03", "2024-04"]
+
+# Pivot of the monthly summary with one column per invoice month
+PIVOT_VIEW_SELECT = f"""
+    SELECT *
+    FROM (
+        SELECT supplier, brand, family,
+        STRFTIME(invoice_date_month, '%Y-%m') AS invoice_date_month, quantity
+        FROM {SUMMARY_TABLE}
+    )
+    PIVOT (
+        SUM(quantity) FOR invoice_date_month IN (
+        {", ".join(f"'{month}'" for month in PIVOT_MONTHS)})
+    )
+"""
+
+
+def primary_key_statements(tables=None):
+    """
+    DDL declaring the primary keys, optionally restricted to `tables`.
+    Primary keys may only be added to tables that do not have one yet.
+    """
+    return [
+        f"ALTER TABLE {table} ADD PRIMARY KEY ({', '.join(columns)});"
+        for table, columns in PRIMARY_KEYS.items()
+        if tables is None or table in tables
+    ]
+
+
+def index_statements(tables=None):
+    """
+    Idempotent DDL creating the indexes, optionally restricted to `tables`.
+    """
+    return [
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} "
+        f"ON {table} ({', '.join(columns)});"
+        for name, table, columns, unique in INDEXES
+        if tables is None or table in tables
+    ]
+
+
+def key_statements():
+    """
+    DDL declaring every primary key and index of freshly created tables.
+    """
+    return primary_key_statements() + index_statements()
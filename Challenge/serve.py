@@ -0,0 +1,56 @@
+"""
+Multi-process deployment of the Liquid Duck API.
+Starts the single DuckDB writer process (redislistener.py) and N stateless
+Uvicorn API workers. Workers forward writes to the writer over the Redis
+request stream and serve analytical reads from the Parquet snapshots the
+writer exports, so HTTP throughput scales with the number of cores.
+
+Usage:
+    python serve.py --workers 4 --port 8000 [workbook_id ...]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+import uvicorn
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "workbooks", nargs="*",
+        help="Workbook request streams the writer listens to besides the "
+             "default stream"
+    )
+    args = parser.parse_args()
+
+    # The writer is the only process opening the DuckDB files
+    writer = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "redislistener.py"),
+         *args.workbooks],
+        env={**os.environ, "LIQUID_DUCK_API_MODE": "embedded"}
+    )
+    # Worker processes inherit the environment when Uvicorn spawns them
+    os.environ["LIQUID_DUCK_API_MODE"] = "worker"
+    try:
+        uvicorn.run(
+            "mainapi:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            app_dir=HERE,
+        )
+    finally:
+        writer.terminate()
+        writer.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Runtime settings for the Liquid Duck services.
+Values are read from environment variables so the API, the Redis listener
+and the background workers can be tuned per deployment without code changes.
+"""
+
+import os
+
+# Parquet snapshot export and read-only analytical queries
+EXPORT_DIR = os.environ.get("LIQUID_DUCK_EXPORT_DIR", "exports")
+EXPORT_EVERY_N_EDITS = int(
+    os.environ.get("LIQUID_DUCK_EXPORT_EVERY_N_EDITS", "50")
+)
+EXPORT_INTERVAL_SECONDS = float(
+    os.environ.get("LIQUID_DUCK_EXPORT_INTERVAL_SECONDS", "300")
+)
+EXPORT_KEEP_SNAPSHOTS = int(
+    os.environ.get("LIQUID_DUCK_EXPORT_KEEP_SNAPSHOTS", "2")
+)
+
+# DuckDB database files. The default workbook keeps the original database
+# file; every other workbook is sharded into its own file under WORKBOOK_DIR.
+DATABASE_PATH = os.environ.get(
+    "LIQUID_DUCK_DATABASE_PATH", "sales_metrics.duckdb"
+)
+DEFAULT_WORKBOOK = os.environ.get("LIQUID_DUCK_DEFAULT_WORKBOOK", "default")
+WORKBOOK_DIR = os.environ.get("LIQUID_DUCK_WORKBOOK_DIR", "workbooks")
+MAX_OPEN_WORKBOOKS = int(
+    os.environ.get("LIQUID_DUCK_MAX_OPEN_WORKBOOKS", "16")
+)
+WORKBOOK_IDLE_SECONDS = float(
+    os.environ.get("LIQUID_DUCK_WORKBOOK_IDLE_SECONDS", "600")
+)
+
+# DuckDB driver backend ("adbc" or "native") and tuned database settings
+DB_BACKEND = os.environ.get("LIQUID_DUCK_DB_BACKEND", "adbc")
+ADBC_DRIVER = os.environ.get("LIQUID_DUCK_ADBC_DRIVER")
+DB_THREADS = int(os.environ.get("LIQUID_DUCK_DB_THREADS", "0")) or None
+DB_MEMORY_LIMIT = os.environ.get("LIQUID_DUCK_DB_MEMORY_LIMIT")
+# Results are always explicitly ordered where order matters, so setting this
+# to false lets DuckDB reorder rows to cut memory use on large scans. Unset
+# keeps DuckDB's default (true)
+DB_PRESERVE_INSERTION_ORDER = os.environ.get(
+    "LIQUID_DUCK_DB_PRESERVE_INSERTION_ORDER"
+)
+if DB_PRESERVE_INSERTION_ORDER is not None:
+    DB_PRESERVE_INSERTION_ORDER = DB_PRESERVE_INSERTION_ORDER.lower() in (
+        "1", "true", "yes"
+    )
+
+# Resource governance per query class. Interactive queries serve cell edits
+# and must fail fast; bulk queries rebuild summaries and export snapshots.
+# Unset thread / memory limits fall back to the database-wide settings.
+INTERACTIVE_QUERY_TIMEOUT_SECONDS = float(
+    os.environ.get("LIQUID_DUCK_INTERACTIVE_QUERY_TIMEOUT_SECONDS", "10")
+)
+INTERACTIVE_THREADS = int(
+    os.environ.get("LIQUID_DUCK_INTERACTIVE_THREADS", "0")
+) or None
+INTERACTIVE_MEMORY_LIMIT = os.environ.get(
+    "LIQUID_DUCK_INTERACTIVE_MEMORY_LIMIT"
+)
+BULK_QUERY_TIMEOUT_SECONDS = float(
+    os.environ.get("LIQUID_DUCK_BULK_QUERY_TIMEOUT_SECONDS", "600")
+)
+BULK_THREADS = int(os.environ.get("LIQUID_DUCK_BULK_THREADS", "0")) or None
+BULK_MEMORY_LIMIT = os.environ.get("LIQUID_DUCK_BULK_MEMORY_LIMIT")
+# How often a pending request checks whether its HTTP client went away
+DISCONNECT_POLL_SECONDS = float(
+    os.environ.get("LIQUID_DUCK_DISCONNECT_POLL_SECONDS", "0.25")
+)
+
+# Shared Redis client. A memory:// URL selects the in-process stand-in used
+# by tests and benchmarks instead of a Redis server.
+REDIS_URL = os.environ.get("LIQUID_DUCK_REDIS_URL", "redis://localhost:6379")
+REDIS_PROTOCOL = int(os.environ.get("LIQUID_DUCK_REDIS_PROTOCOL", "3"))
+REDIS_MAX_CONNECTIONS = int(
+    os.environ.get("LIQUID_DUCK_REDIS_MAX_CONNECTIONS", "64")
+)
+REDIS_SOCKET_TIMEOUT_SECONDS = float(
+    os.environ.get("LIQUID_DUCK_REDIS_SOCKET_TIMEOUT_SECONDS", "5")
+)
+# Longest BLOCK of a stream read. The connection pool's socket timeout is
+# raised by this much so idle blocking reads never time out
+REDIS_MAX_BLOCK_MS = int(
+    os.environ.get("LIQUID_DUCK_REDIS_MAX_BLOCK_MS", "5000")
+)
+# Retries with exponential backoff of connection errors and timeouts
+REDIS_RETRIES = int(os.environ.get("LIQUID_DUCK_REDIS_RETRIES", "3"))
+REDIS_BACKOFF_BASE_SECONDS = float(
+    os.environ.get("LIQUID_DUCK_REDIS_BACKOFF_BASE_SECONDS", "0.05")
+)
+REDIS_BACKOFF_CAP_SECONDS = float(
+    os.environ.get("LIQUID_DUCK_REDIS_BACKOFF_CAP_SECONDS", "1")
+)
+# Consecutive failed calls that open the circuit breaker, and how long it
+# fails fast before letting a trial call through
+REDIS_BREAKER_THRESHOLD = int(
+    os.environ.get("LIQUID_DUCK_REDIS_BREAKER_THRESHOLD", "5")
+)
+REDIS_BREAKER_RESET_SECONDS = float(
+    os.environ.get("LIQUID_DUCK_REDIS_BREAKER_RESET_SECONDS", "10")
+)
+
+# Deployment mode of the API. "embedded" applies writes in the API process;
+# "worker" runs stateless API workers that forward writes to the single
+# DuckDB writer process over the Redis request stream and serve reads from
+# the Parquet snapshots.
+API_MODE = os.environ.get("LIQUID_DUCK_API_MODE", "embedded")
+# How long a worker waits for the writer to apply a forwarded request
+WRITER_REPLY_TIMEOUT_SECONDS = float(
+    os.environ.get("LIQUID_DUCK_WRITER_REPLY_TIMEOUT_SECONDS", "30")
+)
+# Approximate number of replies kept per worker reply stream
+REPLY_STREAM_MAXLEN = int(
+    os.environ.get("LIQUID_DUCK_REPLY_STREAM_MAXLEN", "1000")
+)
+
+# Undo / redo history of summary edits, bounded by the number of edits kept
+# per workbook and by their age (0 disables a limit)
+EDIT_HISTORY_MAX_EDITS = int(
+    os.environ.get("LIQUID_DUCK_EDIT_HISTORY_MAX_EDITS", "100")
+)
+EDIT_HISTORY_MAX_AGE_SECONDS = float(
+    os.environ.get("LIQUID_DUCK_EDIT_HISTORY_MAX_AGE_SECONDS", "604800")
+)
+
+# Slow-query profiler: statements slower than the threshold are recorded by
+# query shape with the plan of their slowest run, keeping the top N shapes
+PROFILE_QUERIES = os.environ.get(
+    "LIQUID_DUCK_PROFILE_QUERIES", "false"
+).lower() in ("1", "true", "yes")
+PROFILE_THRESHOLD_MS = float(
+    os.environ.get("LIQUID_DUCK_PROFILE_THRESHOLD_MS", "100")
+)
+PROFILE_TOP_N = int(os.environ.get("LIQUID_DUCK_PROFILE_TOP_N", "20"))
+PROFILE_EXPLAIN = os.environ.get(
+    "LIQUID_DUCK_PROFILE_EXPLAIN", "true"
+).lower() in ("1", "true", "yes")
+PROFILE_QUERY_CHARS = int(
+    os.environ.get("LIQUID_DUCK_PROFILE_QUERY_CHARS", "2000")
+)
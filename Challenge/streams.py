@@ -0,0 +1,56 @@
+"""
+Redis stream names shared by the API and the Redis listener.
+Each workbook shard gets its own request and response stream; the default
+workbook keeps the original stream names. API workers of the multi-process
+deployment each read the writer's replies from their own reply stream.
+"""
+
+import settings
+
+REQUEST_STREAM = "request_duck"
+RESPONSE_STREAM = "response_duck"
+REPLY_STREAM = "reply_duck"
+
+# Consumer group the writer reads the request streams through. There is a
+# single writer, so one consumer name lets a restarted writer find the
+# requests it had read but not answered
+REQUEST_GROUP = "writer"
+REQUEST_CONSUMER = "writer"
+
+
+def _shard_stream(base, workbook_id):
+    """
+    Name of the per-workbook variant of a base stream.
+    """
+    if workbook_id is None or workbook_id == settings.DEFAULT_WORKBOOK:
+        return base
+    return f"{base}:{workbook_id}"
+
+
+def request_stream(workbook_id=None):
+    """
+    Request stream consumed by the writer of a workbook.
+    """
+    return _shard_stream(REQUEST_STREAM, workbook_id)
+
+
+def response_stream(workbook_id=None):
+    """
+    Response stream clients of a workbook subscribe to.
+    """
+    return _shard_stream(RESPONSE_STREAM, workbook_id)
+
+
+def reply_stream(worker_id):
+    """
+    Stream the writer sends the replies for one API worker to.
+    """
+    return f"{REPLY_STREAM}:{worker_id}"
+
+
+def workbook_from_stream(stream):
+    """
+    Workbook ID encoded in a request or response stream name.
+    """
+    _, _, workbook_id = stream.partition(":")
+    return workbook_id or settings.DEFAULT_WORKBOOK
@@ -0,0 +1,334 @@
+"""
+Cell update logic shared by the API and the DuckDB writer process.
+In the embedded deployment the API applies updates itself; in the
+multi-process deployment stateless API workers forward validated requests
+over Redis and the single writer applies them with the same code, so both
+modes rebalance, refresh rollups, undo / redo and broadcast identically.
+"""
+
+import json
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+from backends import QueryCancelledError, QueryTimeoutError
+from conditions import Condition, build_key_lookup, build_update
+from formulas import FORMULAS
+from logger import api_logger
+from schema import KEY_COLUMNS, MEASURE_COLUMNS, SUMMARY_TABLE
+from streams import response_stream
+
+
+class UpdateRejected(ValueError):
+    """
+    Raised for update requests that are invalid and were not applied.
+    """
+
+
+class UpdateFailed(RuntimeError):
+    """
+    Raised when DuckDB fails to execute a valid update request.
+    """
+
+
+# Pydantic model for the request body
+class UpdateRequest(BaseModel):
+    """
+    Pydantic model for handling cell update requests.
+    Validates and structures the data needed for database updates.
+    """
+    table: str = Field(..., description="Name of the table to update")
+    column: str = Field(..., description="Column to update")
+    value: str = Field(..., description="New value to set")
+    condition: Optional[str] = Field(
+        None,
+        description="Free-form SQL condition for rows to update (legacy)"
+    )
+    where: Optional[Condition] = Field(
+        None,
+        description="Structured key predicates selecting rows to update"
+    )
+    level: Optional[int] = Field(
+        None,
+        description="Grouping level for hierarchical updates (informational, "
+                    "each edited row propagates from its own grouping level)"
+    )
+    split: Literal["proportional", "equal"] = Field(
+        "proportional",
+        description="How an edited summary measure is split to its children"
+    )
+    workbook_id: Optional[str] = Field(
+        None,
+        description="Workbook (database shard) to update, default if omitted"
+    )
+
+
+async def apply_update(workbook_db, request):
+    """
+    Apply a cell update to a workbook and propagate it through the hierarchy.
+    Summary measure edits are split down each edited node's subtree and
+    summed up its ancestors by the hierarchy engine in one transaction.
+    Args:
+        workbook_db: DuckDBManager handle of the request's workbook
+        request: UpdateRequest to apply
+    Returns:
+        Dict with the condition applied, the affected summary keys (None for
+        legacy conditions), the number of matched rows and the recomputed
+        formulas with the keys of their recomputed cells
+    Raises:
+        UpdateRejected: If the request is invalid
+        UpdateFailed: If the update statement fails
+        QueryTimeoutError: If a statement ran out of time
+        QueryCancelledError: If the update was cancelled
+    """
+    table = request.table
+    column = request.column
+    value = request.value
+    condition = request.condition
+    level = request.level
+    where = request.where
+
+    # Validate critical fields
+    if not table or not column or not (condition or where):
+        raise UpdateRejected("Invalid input: Missing required fields.")
+
+    if where is not None:
+        try:
+            update_query, update_params = build_update(
+                table, column, value, where
+            )
+            lookup_query, lookup_params = build_key_lookup(table, where)
+        except ValueError as e:
+            raise UpdateRejected(str(e)) from e
+        condition = condition or where.model_dump_json()
+
+    propagate = table == SUMMARY_TABLE and column in MEASURE_COLUMNS
+    if propagate:
+        try:
+            new_value = float(value)
+        except ValueError as e:
+            raise UpdateRejected(
+                f"Invalid input: {column} must be numeric."
+            ) from e
+
+    print(
+        f"Received data - Table: {table}, Column: {column}, "
+        f"Value: {value}, Condition: {condition}, Level: {level}"
+    )
+    api_logger.info(f"Processing update request for table {table}.")
+
+    # Test database connectivity
+    await workbook_db.execute_query_async("SELECT 1;")
+    print("DuckDB connected successfully.")
+
+    # Execute the update query asynchronously. Summary measure edits are
+    # written by the hierarchy engine, which records their old values for
+    # undo in the same transaction.
+    affected_keys = None
+    matched_rows = None
+    edited = None
+    try:
+        if where is not None:
+            # Resolve the touched keys with an index lookup, then update
+            # exactly those rows, or edit them through the hierarchy, in one
+            # transaction. Structured edits only revisit the subtrees,
+            # ancestors, rollup buckets and formula cells of those rows.
+            edited = await workbook_db.update_where_async(
+                column,
+                (lookup_query, lookup_params),
+                (update_query, update_params),
+                new_value if propagate else None,
+                request.split,
+            )
+            affected_keys = edited.pop("keys")
+            matched_rows = len(affected_keys)
+            if propagate:
+                api_logger.info(
+                    f"{request.split} split of {matched_rows} rows."
+                )
+            if column in KEY_COLUMNS[table]:
+                affected_keys += [
+                    {**key, column: value} for key in affected_keys
+                ]
+        elif not propagate:
+            await workbook_db.execute_query_async(
+                f"""
+                UPDATE {table}
+                SET {column} = '{value}'
+                WHERE {condition};
+                """
+            )
+        print(f"Update query executed successfully for {table}.")
+    except (QueryTimeoutError, QueryCancelledError):
+        raise
+    except Exception as query_error:
+        api_logger.error(f"Query execution error: {str(query_error)}")
+        raise UpdateFailed("Query execution failed.") from query_error
+
+    # Propagate legacy summary edits through the hierarchy and the formulas
+    formulas = []
+    try:
+        if propagate and where is None:
+            api_logger.info(
+                f"{request.split} split of rows WHERE {condition}."
+            )
+            edited = await workbook_db.edit_nodes_where_async(
+                column, condition, new_value, request.split
+            )
+        elif not propagate and table == SUMMARY_TABLE:
+            # Edited keys no longer match the rows the undo history refers to
+            await workbook_db.clear_edit_history_async()
+            if affected_keys is not None:
+                await workbook_db.refresh_rollup_tiers_for_keys_async(
+                    affected_keys
+                )
+            else:
+                # Keep the quarter / year rollup tiers in step with the edit
+                await workbook_db.refresh_rollup_tiers_async()
+            # Formula cells are keyed like the summary rows, rebuild them
+            await workbook_db.recalculate_formulas_async()
+            formulas = list(FORMULAS)
+    except (QueryTimeoutError, QueryCancelledError):
+        raise
+    except Exception as propagation_error:
+        api_logger.error(f"Hierarchy propagation error: {propagation_error}")
+        raise UpdateFailed(
+            "Hierarchy propagation failed."
+        ) from propagation_error
+
+    api_logger.info(f"updated {table}:{column}={value} WHERE {condition}.")
+    return {
+        "condition": condition,
+        "affected_keys": affected_keys,
+        "matched_rows": matched_rows,
+        "formulas": (edited or {}).get("formulas", formulas),
+        # Empty when every formula cell was recomputed
+        "formula_keys": (edited or {}).get("formula_keys", []),
+    }
+
+
+def formula_fields(outcome):
+    """
+    Response stream fields naming the formulas an edit recomputed and the
+    formula cells (keyed like summary cells) clients should reload.
+    """
+    return {
+        "formulas": json.dumps(outcome.get("formulas", [])),
+        "formula_keys": json.dumps(
+            outcome.get("formula_keys", []), default=str
+        ),
+    }
+
+
+async def broadcast_update(redis_client, request, outcome):
+    """
+    Publish an applied update on its workbook's response stream.
+    Returns:
+        Name of the stream the update was published on
+    """
+    stream = response_stream(request.workbook_id)
+    await redis_client.xadd(
+        stream,
+        {
+            "workbook_id": request.workbook_id or "",
+            "table": request.table,
+            "column": request.column,
+            "value": request.value,
+            "condition": outcome["condition"],
+            "level": (
+                str(request.level) if request.level is not None else "null"
+            ),
+            # Exact cells to invalidate, empty for legacy conditions
+            "affected_keys": json.dumps(
+                outcome["affected_keys"] or [], default=str
+            ),
+            **formula_fields(outcome),
+        }
+    )
+    print(f"Changes broadcasted to Redis stream {stream}.")
+    return stream
+
+
+class NothingToReplay(LookupError):
+    """
+    Raised when there is no edit to undo or redo.
+    """
+
+
+HISTORY_ACTIONS = ("undo", "redo")
+
+
+async def apply_history_action(workbook_db, action):
+    """
+    Undo the latest summary edit of a workbook or redo the earliest undone
+    one, in a single transaction.
+    Args:
+        workbook_db: DuckDBManager handle of the workbook
+        action: "undo" or "redo"
+    Returns:
+        Dict with the `edit_id` and the `affected_keys` it changed
+    Raises:
+        UpdateRejected: If the action is unknown
+        NothingToReplay: If there is no edit to undo or redo
+    """
+    if action not in HISTORY_ACTIONS:
+        raise UpdateRejected(f"Unknown history action: {action!r}")
+    if action == "undo":
+        outcome = await workbook_db.undo_edit_async()
+    else:
+        outcome = await workbook_db.redo_edit_async()
+    if outcome is None:
+        raise NothingToReplay(f"Nothing to {action}.")
+    api_logger.info(
+        f"{action} of edit {outcome['edit_id']}: "
+        f"{len(outcome['affected_keys'])} cells."
+    )
+    return outcome
+
+
+async def broadcast_history_action(redis_client, workbook_id, action,
+                                   outcome):
+    """
+    Publish an undo or redo on its workbook's response stream so clients
+    reload the cells it changed.
+    Returns:
+        Name of the stream the action was published on
+    """
+    stream = response_stream(workbook_id)
+    await redis_client.xadd(
+        stream,
+        {
+            "workbook_id": workbook_id or "",
+            "action": action,
+            "edit_id": str(outcome["edit_id"]),
+            "table": SUMMARY_TABLE,
+            "affected_keys": json.dumps(
+                outcome["affected_keys"], default=str
+            ),
+            **formula_fields(outcome),
+        }
+    )
+    print(f"{action} broadcasted to Redis stream {stream}.")
+    return stream
+
+
+def history_response(action, outcome):
+    """
+    Response body returned to the client of an undo or redo.
+    """
+    return {
+        "status": "success",
+        "message": f"{action.capitalize()} of edit {outcome['edit_id']}",
+        "edit_id": outcome["edit_id"],
+        "affected_rows": len(outcome["affected_keys"]),
+    }
+
+
+def update_response(request, outcome):
+    """
+    Response body returned to the client of an applied update.
+    """
+    response = {"status": "success", "message": f"Updated {request.table}"}
+    if outcome["affected_keys"] is not None:
+        response["affected_rows"] = outcome["matched_rows"]
+    return response
@@ -0,0 +1,142 @@
+"""
+Link between stateless API workers and the single DuckDB writer process.
+DuckDB allows one writer process per database file, so in the multi-process
+deployment API workers never open the database. They forward each write to
+the writer over the Redis request stream and wait for its reply on a reply
+stream of their own.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import uuid
+
+import settings
+from logger import api_logger
+from streams import REQUEST_STREAM, reply_stream
+
+
+class WriterUnavailableError(RuntimeError):
+    """
+    Raised when the writer does not reply to a forwarded request in time.
+    """
+
+
+class WriterClient:
+    """
+    Forwards requests to the writer process and matches its replies.
+    Every request carries an ID and the worker's reply stream; a background
+    task reads that stream and resolves the waiting request.
+    """
+
+    def __init__(self, redis_client, worker_id=None):
+        self.redis_client = redis_client
+        self.worker_id = worker_id or (
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        )
+        self.reply_stream = reply_stream(self.worker_id)
+        self._waiters = {}  # request ID -> future of the reply
+        self._reader_task = None
+
+    def _ensure_reader(self):
+        """
+        Start the reply reader on the running event loop if needed.
+        """
+        if self._reader_task is None or self._reader_task.done():
+            self._reader_task = asyncio.ensure_future(self._read_replies())
+
+    async def _read_replies(self):
+        """
+        Resolve waiting requests with the replies sent by the writer.
+        """
+        last_id = "0"  # The stream is private to this worker
+        while True:
+            try:
+                messages = await self.redis_client.xread(
+                    {self.reply_stream: last_id}, block=1000, count=100
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                api_logger.error(f"Error reading writer replies: {e}")
+                await asyncio.sleep(settings.REDIS_BACKOFF_CAP_SECONDS)
+                continue
+            for _, entries in messages:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    waiter = self._waiters.pop(fields.get("request_id"), None)
+                    if waiter is not None and not waiter.done():
+                        waiter.set_result(json.loads(fields["data"]))
+
+    async def submit(self, payload, timeout=None):
+        """
+        Forward a request to the writer and wait for its reply.
+        Args:
+            payload: JSON-serializable request, e.g. a dumped UpdateRequest
+            timeout: Seconds to wait, defaults to the configured timeout
+        Returns:
+            Reply dict with a `status_code` and a `body` or `detail`
+        Raises:
+            WriterUnavailableError: If no reply arrived in time
+        """
+        self._ensure_reader()
+        request_id = uuid.uuid4().hex
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[request_id] = waiter
+        try:
+            # All workbooks go through the default request stream; the writer
+            # routes each request to its workbook's database file
+            await self.redis_client.xadd(
+                REQUEST_STREAM,
+                {
+                    "data": json.dumps(payload, default=str),
+                    "request_id": request_id,
+                    "reply_to": self.reply_stream,
+                }
+            )
+            return await asyncio.wait_for(
+                waiter,
+                settings.WRITER_REPLY_TIMEOUT_SECONDS if timeout is None
+                else timeout
+            )
+        except asyncio.TimeoutError as e:
+            raise WriterUnavailableError(
+                "The DuckDB writer did not reply in time."
+            ) from e
+        finally:
+            self._waiters.pop(request_id, None)
+
+    async def close(self):
+        """
+        Stop reading replies and drop the worker's reply stream.
+        """
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._reader_task = None
+        await self.redis_client.delete(self.reply_stream)
+
+
+async def send_reply(redis_client, fields, reply):
+    """
+    Writer side: send the reply to a forwarded request, if it expects one.
+    Args:
+        redis_client: Shared RedisClient of the writer
+        fields: Fields of the request stream entry
+        reply: Dict with a `status_code` and a `body` or `detail`
+    """
+    reply_to = fields.get("reply_to")
+    if not reply_to:
+        return
+    await redis_client.xadd(
+        reply_to,
+        {
+            "request_id": fields.get("request_id", ""),
+            "data": json.dumps(reply, default=str),
+        },
+        maxlen=settings.REPLY_STREAM_MAXLEN,
+    )
@@ -0,0 +1,134 @@
+"""
+Benchmark of the ADBC and native duckdb backends on the Liquid Duck
+workloads: point cell updates, summary scans returned as Arrow, the pivot
+view, and a full summary rebuild.
+
+Usage:
+    python benchmarks/bench_backends.py --sales-rows 200000 --repeat 20
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                    "Challenge")
+)
+
+import duckdb  # noqa: E402
+
+from backends import BACKENDS, get_backend  # noqa: E402
+from schema import (  # noqa: E402
+    PIVOT_VIEW_SELECT,
+    SUMMARY_SELECT,
+    SUMMARY_TABLE,
+    index_statements,
+    primary_key_statements,
+)
+
+
+def build_database(path, products, sales_rows):
+    """
+    Create a synthetic sales database with the production schema.
+    """
+    conn = duckdb.connect(path)
+    conn.execute(
+        f"""
+        CREATE TABLE product AS
+        SELECT
+            i AS product_id,
+            'name_' || i AS name,
+            'supplier_' || (i % 20) AS supplier,
+            'brand_' || (i % 100) AS brand,
+            'family_' || i AS family
+        FROM range({products}) t(i);
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE sales AS
+        SELECT
+            CAST(random() * {products} AS INTEGER) % {products} AS product_id,
+            CAST(random() * 1000 AS INTEGER) AS customer_id,
+            DATE '2024-01-01' + CAST(random() * 365 AS INTEGER) AS
+            invoice_date,
+            CAST(random() * 50 AS INTEGER) + 1 AS quantity,
+            ROUND(random() * 90 + 10, 2) AS net_price
+        FROM range({sales_rows});
+        """
+    )
+    conn.execute(f"CREATE TABLE {SUMMARY_TABLE} AS {SUMMARY_SELECT}")
+    conn.execute(f"CREATE VIEW pivoted_sales AS {PIVOT_VIEW_SELECT}")
+    tables = {"product", "sales", SUMMARY_TABLE}
+    for statement in (primary_key_statements(tables)
+                      + index_statements(tables)):
+        conn.execute(statement)
+    conn.close()
+
+
+WORKLOADS = {
+    "point_update": (
+        f"UPDATE {SUMMARY_TABLE} SET quantity = quantity + 1 "
+        "WHERE supplier = 'supplier_3' AND brand = 'brand_3' "
+        "AND family = 'family_3' AND grouping_set_id = 0;"
+    ),
+    "summary_scan_arrow": f"SELECT * FROM {SUMMARY_TABLE};",
+    "pivot_view": "SELECT * FROM pivoted_sales;",
+    "recalculate_summary": (
+        f"DELETE FROM {SUMMARY_TABLE}; "
+        f"INSERT INTO {SUMMARY_TABLE} {SUMMARY_SELECT};"
+    ),
+}
+
+
+def run_workload(backend, conn, query, repeat):
+    """
+    Time `repeat` executions of a query, returning per-run milliseconds.
+    """
+    backend.execute(conn, query)  # Warm-up
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        backend.execute(conn, query)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--sales-rows", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--backends", nargs="+", default=sorted(BACKENDS))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'backend':<8} {'workload':<22} {'median ms':>10} "
+              f"{'p95 ms':>10} {'connect ms':>11}")
+        for name in args.backends:
+            path = os.path.join(directory, f"{name}.duckdb")
+            build_database(path, args.products, args.sales_rows)
+            backend = get_backend(name)
+
+            started = time.perf_counter()
+            conn = backend.connect(path)
+            connect_ms = (time.perf_counter() - started) * 1000
+
+            for workload, query in WORKLOADS.items():
+                timings = sorted(
+                    run_workload(backend, conn, query, args.repeat)
+                )
+                p95 = timings[min(len(timings) - 1,
+                                  int(len(timings) * 0.95))]
+                print(f"{name:<8} {workload:<22} "
+                      f"{statistics.median(timings):>10.3f} {p95:>10.3f} "
+                      f"{connect_ms:>11.3f}")
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
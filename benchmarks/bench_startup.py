@@ -0,0 +1,112 @@
+"""
+Startup-time benchmark of the API and writer processes.
+Every sample runs in a fresh interpreter, as a restarted or autoscaled
+worker would, and times the module import, app construction and the
+lifespan startup until the process is ready to serve. Redis is the
+in-process stand-in, so only Liquid Duck's own startup cost is measured.
+
+Usage:
+    python benchmarks/bench_startup.py --repeat 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CHALLENGE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "Challenge"
+)
+
+# Each scenario prints the seconds from interpreter start of the script to
+# each of its milestones as JSON
+API_STARTUP = """
+import asyncio, json, time
+started = time.perf_counter()
+import mainapi
+imported = time.perf_counter()
+application = mainapi.create_app()
+built = time.perf_counter()
+
+async def start():
+    async with mainapi.lifespan(application):
+        return time.perf_counter()
+
+ready = asyncio.run(start())
+print(json.dumps({
+    "import": imported - started,
+    "create_app": built - started,
+    "ready": ready - started,
+}))
+"""
+
+LISTENER_IMPORT = """
+import json, time
+started = time.perf_counter()
+import redislistener
+print(json.dumps({"import": time.perf_counter() - started}))
+"""
+
+SCENARIOS = {
+    "api_embedded": (API_STARTUP, {"LIQUID_DUCK_API_MODE": "embedded"}),
+    "api_worker": (API_STARTUP, {"LIQUID_DUCK_API_MODE": "worker"}),
+    "listener": (LISTENER_IMPORT, {}),
+}
+
+
+def run_sample(script, env):
+    """
+    Run one scenario in a fresh interpreter.
+    Returns:
+        Dict of milestone -> milliseconds, plus the process wall time
+    """
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=CHALLENGE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    wall = time.perf_counter() - started
+    milestones = json.loads(output.strip().splitlines()[-1])
+    milestones["process"] = wall
+    return {name: seconds * 1000 for name, seconds in milestones.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        base_env = {
+            **os.environ,
+            "LIQUID_DUCK_REDIS_URL": "memory://",
+            "LIQUID_DUCK_DATABASE_PATH": os.path.join(
+                directory, "sales_metrics.duckdb"
+            ),
+            "LIQUID_DUCK_EXPORT_DIR": os.path.join(directory, "exports"),
+        }
+        print(f"{'scenario':<14} {'milestone':<12} {'median ms':>10} "
+              f"{'max ms':>10}")
+        for name in args.scenarios:
+            script, env = SCENARIOS[name]
+            env = {**base_env, **env}
+            run_sample(script, env)  # Warm-up, also applies migrations
+            samples = [run_sample(script, env) for _ in range(args.repeat)]
+            for milestone in samples[0]:
+                timings = [sample[milestone] for sample in samples]
+                print(f"{name:<14} {milestone:<12} "
+                      f"{statistics.median(timings):>10.1f} "
+                      f"{max(timings):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""
+Load generator simulating many concurrent spreadsheet users.
+Each simulated user edits summary cells picked with a configurable hot-spot
+skew across the supplier > brand > family hierarchy, through the HTTP API
+(`/update_cell`) or by publishing to the `request_duck` stream directly. A
+subscriber reads the workbook's response stream and measures the
+edit-to-visible latency of every edit. The report gives throughput and
+latency percentiles for sizing deployments.
+
+Usage:
+    # Against a running API (keys are read through /analytics/query)
+    python benchmarks/loadgen.py --target api --api-url http://127.0.0.1:8000
+
+    # Straight to the request stream of a running writer
+    python benchmarks/loadgen.py --target stream --keys-file keys.json
+
+    # Self-contained: in-process writer and Redis stand-in
+    LIQUID_DUCK_DATABASE_PATH=sales_metrics.duckdb \\
+        python benchmarks/loadgen.py --target stream --redis-url memory://
+"""
+
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                    "Challenge")
+)
+
+from redisclient import create_redis_client  # noqa: E402
+from schema import KEY_COLUMNS, SUMMARY_TABLE  # noqa: E402
+from streams import request_stream, response_stream  # noqa: E402
+
+LEVELS = {"supplier": 3, "brand": 1, "family": 0}
+
+
+class KeyPicker:
+    """
+    Picks the summary node each edit targets. Levels are drawn by weight,
+    then nodes within a level from a Zipf distribution: with skew s the
+    node of rank r is picked with probability proportional to 1 / r**s, so
+    0 is uniform and larger values concentrate edits on a few hot nodes.
+    """
+
+    def __init__(self, keys, skew=1.0, level_weights=None, seed=None):
+        self.rng = random.Random(seed)
+        level_weights = level_weights or {"family": 1.0}
+        self.levels = []
+        for name, weight in level_weights.items():
+            level_keys = [
+                key for key in keys
+                if key["grouping_set_id"] == LEVELS[name]
+            ]
+            if weight > 0 and level_keys:
+                # Hot nodes are a random sample, not the first in key order
+                self.rng.shuffle(level_keys)
+                cumulative = list(itertools.accumulate(
+                    1 / rank ** skew for rank in range(1, len(level_keys) + 1)
+                ))
+                self.levels.append((weight, level_keys, cumulative))
+        if not self.levels:
+            raise ValueError("No summary keys at the requested levels.")
+
+    def pick(self):
+        weight_total = sum(weight for weight, _, _ in self.levels)
+        draw = self.rng.random() * weight_total
+        for weight, level_keys, cumulative in self.levels:
+            if draw < weight:
+                break
+            draw -= weight
+        index = bisect.bisect_left(
+            cumulative, self.rng.random() * cumulative[-1]
+        )
+        return level_keys[min(index, len(level_keys) - 1)]
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a list of values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class LoadStats:
+    """
+    Latencies and outcomes recorded during a run.
+    """
+
+    def __init__(self):
+        self.request_ms = []
+        self.visible_ms = []
+        self.statuses = {}
+        self.started = None
+        self.finished = None
+
+    def record_request(self, status, milliseconds):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status == 200:
+            self.request_ms.append(milliseconds)
+
+    def record_visible(self, milliseconds):
+        self.visible_ms.append(milliseconds)
+
+    def report(self):
+        """
+        Summary of the run: throughput and latency percentiles in ms.
+        """
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        report = {
+            "duration_s": round(elapsed, 3),
+            "edits_sent": sum(self.statuses.values()),
+            "statuses": self.statuses,
+            "edits_visible": len(self.visible_ms),
+            "throughput_per_s": round(len(self.visible_ms) / elapsed, 1),
+        }
+        for name, values in (("request", self.request_ms),
+                             ("visible", self.visible_ms)):
+            report[f"{name}_ms"] = {
+                "p50": percentile(values, 0.50),
+                "p95": percentile(values, 0.95),
+                "p99": percentile(values, 0.99),
+                "max": max(values) if values else None,
+                "mean": statistics.fmean(values) if values else None,
+            }
+        return report
+
+
+class ApiSender:
+    """
+    Sends edits to the HTTP API.
+    """
+
+    def __init__(self, api_url):
+        import httpx
+
+        self.client = httpx.AsyncClient(base_url=api_url, timeout=60)
+
+    async def send(self, payload):
+        response = await self.client.post("/update_cell", json=payload)
+        return response.status_code
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class StreamSender:
+    """
+    Publishes edits to the workbook's request stream like a direct stream
+    client. The writer applies them asynchronously, so the request latency
+    is only the XADD round trip.
+    """
+
+    def __init__(self, redis_client, workbook_id=None):
+        self.redis_client = redis_client
+        self.stream = request_stream(workbook_id)
+
+    async def send(self, payload):
+        await self.redis_client.xadd(
+            self.stream, {"data": json.dumps(payload, default=str)}
+        )
+        return 200
+
+    async def close(self):
+        return None
+
+
+def edit_payload(key, column, value, workbook_id=None):
+    """
+    Structured cell edit of one summary node.
+    """
+    payload = {
+        "table": SUMMARY_TABLE,
+        "column": column,
+        "value": value,
+        "where": {"all_of": [
+            {"column": name, "value": key[name]}
+            for name in KEY_COLUMNS[SUMMARY_TABLE]
+        ]},
+        "level": key["grouping_set_id"],
+    }
+    if workbook_id is not None:
+        payload["workbook_id"] = workbook_id
+    return payload
+
+
+async def subscribe(redis_client, stream, pending, stats, ready, stop):
+    """
+    Read the response stream and record when pending edits become visible.
+    Edits are matched by their value, which is unique per edit.
+    """
+    last_id = "$"
+    ready.set()
+    while not stop.is_set():
+        messages = await redis_client.xread(
+            {stream: last_id}, block=200, count=500
+        )
+        for _, entries in messages:
+            for entry_id, fields in entries:
+                last_id = entry_id
+                sent = pending.pop(fields.get("value"), None)
+                if sent is not None:
+                    stats.record_visible(
+                        (time.perf_counter() - sent) * 1000
+                    )
+
+
+async def simulate_user(sender, picker, args, pending, stats, sequence,
+                        deadline, rng):
+    """
+    One user editing cells until the deadline or the edit budget runs out.
+    """
+    while time.perf_counter() < deadline:
+        number = next(sequence)
+        if args.edits and number >= args.edits:
+            return
+        # A unique value identifies the edit on the response stream
+        value = str(args.base_value + number)
+        payload = edit_payload(
+            picker.pick(), args.column, value, args.workbook_id
+        )
+        started = time.perf_counter()
+        pending[value] = started
+        try:
+            status = await sender.send(payload)
+        except Exception as e:
+            status = type(e).__name__
+        stats.record_request(status, (time.perf_counter() - started) * 1000)
+        if status != 200:
+            pending.pop(value, None)
+        if args.think_ms:
+            await asyncio.sleep(rng.expovariate(1000 / args.think_ms))
+
+
+async def load_keys(args, redis_client=None):
+    """
+    Summary keys the users edit: from a JSON file, the in-process writer's
+    database or the API's read-only analytical endpoint.
+    """
+    columns = ", ".join(KEY_COLUMNS[SUMMARY_TABLE])
+    query = f"SELECT DISTINCT {columns} FROM {SUMMARY_TABLE};"
+    if args.keys_file:
+        with open(args.keys_file, encoding="utf-8") as keys_file:
+            return json.load(keys_file)
+    if args.redis_url.startswith("memory://"):
+        from DuckDBManager import DuckDBManager
+
+        return [
+            {**key, "invoice_date_month": str(key["invoice_date_month"])}
+            for key in DuckDBManager.for_workbook(
+                args.workbook_id
+            ).execute_query(query).to_pylist()
+        ]
+    import httpx
+
+    async with httpx.AsyncClient(base_url=args.api_url, timeout=120) as client:
+        response = await client.post("/analytics/query", json={"query": query})
+        if response.status_code == 503:
+            # No snapshot yet: export one and retry
+            await client.post("/analytics/export")
+            response = await client.post(
+                "/analytics/query", json={"query": query}
+            )
+        response.raise_for_status()
+        return response.json()["rows"]
+
+
+async def run_load(args):
+    """
+    Run the simulated users and return the report.
+    """
+    redis_client = create_redis_client(args.redis_url)
+    writer_task = None
+    if args.redis_url.startswith("memory://"):
+        if args.target != "stream":
+            raise ValueError("memory:// only supports the stream target.")
+        # The stand-in lives in this process, so the writer must too
+        import redislistener
+
+        redislistener.redis_client = redis_client
+        writer_task = asyncio.create_task(
+            redislistener.listen_to_requests(
+                [args.workbook_id] if args.workbook_id else None,
+                export=False
+            )
+        )
+
+    keys = await load_keys(args, redis_client)
+    picker = KeyPicker(keys, args.skew, args.levels, args.seed)
+    sender = (
+        ApiSender(args.api_url) if args.target == "api"
+        else StreamSender(redis_client, args.workbook_id)
+    )
+    stats = LoadStats()
+    pending = {}
+    ready, stop = asyncio.Event(), asyncio.Event()
+    subscriber = asyncio.create_task(subscribe(
+        redis_client, response_stream(args.workbook_id), pending, stats,
+        ready, stop
+    ))
+    await ready.wait()
+    await asyncio.sleep(0.05)  # Let the first XREAD reach Redis
+
+    sequence = itertools.count()
+    rng = random.Random(args.seed)
+    stats.started = time.perf_counter()
+    deadline = stats.started + args.duration
+    try:
+        await asyncio.gather(*(
+            simulate_user(sender, picker, args, pending, stats, sequence,
+                          deadline, random.Random(rng.random()))
+            for _ in range(args.users)
+        ))
+        # Wait for the broadcasts of edits still in flight
+        drain_deadline = time.perf_counter() + args.drain_seconds
+        while pending and time.perf_counter() < drain_deadline:
+            await asyncio.sleep(0.05)
+        stats.finished = time.perf_counter()
+    finally:
+        stop.set()
+        await subscriber
+        await sender.close()
+        if writer_task is not None:
+            writer_task.cancel()
+            try:
+                await writer_task
+            except asyncio.CancelledError:
+                pass
+        await redis_client.close()
+    report = stats.report()
+    report["edits_lost"] = len(pending)
+    return report
+
+
+def parse_levels(text):
+    """
+    Parse level weights such as "family=0.7,brand=0.2,supplier=0.1".
+    """
+    weights = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in LEVELS:
+            raise argparse.ArgumentTypeError(f"Unknown level: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def print_report(args, report):
+    """
+    Print a human-readable load report.
+    """
+    print(f"target={args.target} users={args.users} "
+          f"duration={report['duration_s']}s")
+    print(f"sent={report['edits_sent']} visible={report['edits_visible']} "
+          f"lost={report['edits_lost']} statuses={report['statuses']}")
+    print(f"throughput={report['throughput_per_s']} edits/s")
+    print(f"{'latency':<10} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for name in ("request", "visible"):
+        values = report[f"{name}_ms"]
+        print(f"{name:<10} " + " ".join(
+            f"{values[p]:>9.1f}" if values[p] is not None else f"{'-':>9}"
+            for p in ("p50", "p95", "p99", "max")
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--target", choices=["api", "stream"], default="api")
+    parser.add_argument("--api-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--redis-url", default=os.environ.get(
+        "LIQUID_DUCK_REDIS_URL", "redis://localhost:6379"
+    ))
+    parser.add_argument("--workbook-id")
+    parser.add_argument("--keys-file",
+                        help="JSON list of summary keys to edit")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30,
+                        help="Seconds to generate load for")
+    parser.add_argument("--edits", type=int, default=0,
+                        help="Stop after this many edits (0: no limit)")
+    parser.add_argument("--think-ms", type=float, default=100,
+                        help="Mean pause between a user's edits")
+    parser.add_argument("--skew", type=float, default=1.1,
+                        help="Zipf exponent of the hot-spot skew, 0 uniform")
+    parser.add_argument("--levels", type=parse_levels,
+                        default={"family": 0.7, "brand": 0.2,
+                                 "supplier": 0.1},
+                        help="Level weights, e.g. family=0.7,brand=0.3")
+    parser.add_argument("--column", default="quantity")
+    parser.add_argument("--base-value", type=int, default=1000,
+                        help="Edits write base + sequence number")
+    parser.add_argument("--drain-seconds", type=float, default=10)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", action="store_true",
+                        help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(args, report)
+    if report["edits_lost"]:
+        # Latencies of a run that lost edits do not describe applied writes
+        print(f"{report['edits_lost']} edits were never broadcast.",
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
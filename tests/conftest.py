@@ -0,0 +1,47 @@
+import duckdb
+import pytest
+from Challenge.schema import ROLLUP_TIERS, SUMMARY_SELECT, tier_select_sql
+
+SUMMARY = "sales_summary_by_product_family"
+
+
+def create_summary(connection, product_rows, sales_rows):
+    """
+    Create the product and sales tables holding the given rows, the summary
+    built from them and its rollup tiers.
+    Args:
+        product_rows: (product_id, supplier, brand, family) tuples
+        sales_rows: (product_id, customer_id, invoice_date, quantity,
+            net_price) tuples
+    """
+    connection.execute(
+        "CREATE TABLE product (product_id INT, supplier VARCHAR, brand VARCHAR, family VARCHAR);"
+    )
+    connection.executemany("INSERT INTO product VALUES (?, ?, ?, ?);", product_rows)
+    connection.execute(
+        "CREATE TABLE sales (product_id INT, customer_id INT, invoice_date DATE, quantity INT, net_price DOUBLE);"
+    )
+    connection.executemany("INSERT INTO sales VALUES (?, ?, ?, ?, ?);", sales_rows)
+    connection.execute(f"CREATE TABLE {SUMMARY} AS {SUMMARY_SELECT}")
+    for tier, spec in ROLLUP_TIERS.items():
+        connection.execute(f"CREATE TABLE {spec['table']} AS {tier_select_sql(tier)}")
+
+
+@pytest.fixture
+def summary_database():
+    """
+    Build in-memory DuckDB instances with a summary and its rollup tiers
+    from the given product and sales rows, see `create_summary`. They are
+    closed after the test.
+    """
+    connections = []
+
+    def build(product_rows, sales_rows):
+        connection = duckdb.connect(":memory:")
+        connections.append(connection)
+        create_summary(connection, product_rows, sales_rows)
+        return connection
+
+    yield build
+    for connection in connections:
+        connection.close()
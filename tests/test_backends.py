@@ -0,0 +1,105 @@
+import threading
+
+import pyarrow
+import pytest
+from Challenge.DuckDBManager import DuckDBManager
+from Challenge.backends import (
+    AdbcBackend,
+    NativeBackend,
+    QueryTimeoutError,
+    backend_for_connection,
+    execute_governed,
+    get_backend,
+    settings,
+)
+
+
+@pytest.fixture(params=["adbc", "native"])
+def backend(request, monkeypatch):
+    """
+    Each configured backend with tuned settings applied.
+    """
+    monkeypatch.setattr(settings, "DB_THREADS", 2)
+    monkeypatch.setattr(settings, "DB_MEMORY_LIMIT", "512MB")
+    monkeypatch.setattr(settings, "DB_PRESERVE_INSERTION_ORDER", False)
+    return get_backend(request.param)
+
+
+def test_backend_applies_settings(backend, tmp_path):
+    """
+    Test that connections open with the configured DuckDB settings.
+    """
+    conn = backend.connect(str(tmp_path / "settings.duckdb"))
+    result = backend.execute(
+        conn,
+        "SELECT current_setting('threads') AS threads, "
+        "current_setting('preserve_insertion_order') AS preserve_insertion_order;",
+    )
+    conn.close()
+    assert result.to_pylist() == [{"threads": 2, "preserve_insertion_order": False}]
+
+
+def test_unset_settings_keep_duckdb_defaults(backend, tmp_path, monkeypatch):
+    """
+    Test that insertion order is only changed when it is configured.
+    """
+    monkeypatch.setattr(settings, "DB_PRESERVE_INSERTION_ORDER", None)
+    conn = backend.connect(str(tmp_path / "defaults.duckdb"))
+    result = backend.execute(
+        conn, "SELECT current_setting('preserve_insertion_order') AS preserve_insertion_order;"
+    )
+    conn.close()
+    assert result.to_pylist() == [{"preserve_insertion_order": True}]
+
+
+@pytest.mark.filterwarnings("error::DeprecationWarning")
+def test_backend_round_trip_arrow(backend, tmp_path):
+    """
+    Test that ingested Arrow data is returned as an Arrow table.
+    """
+    conn = backend.connect(str(tmp_path / "round_trip.duckdb"))
+    backend.ingest(conn, "bands", pyarrow.table({"name": ["Wu Tang Clan"], "albums": [7]}))
+    backend.execute(conn, "UPDATE bands SET albums = albums + ? WHERE name = ?;", [1, "Wu Tang Clan"])
+    result = backend.execute(conn, "SELECT * FROM bands;")
+    conn.close()
+    assert isinstance(result, pyarrow.Table)
+    assert result.to_pylist() == [{"name": "Wu Tang Clan", "albums": 8}]
+
+
+def test_manager_uses_configured_backend(tmp_path, monkeypatch):
+    """
+    Test that DuckDBManager connects through the configured backend.
+    """
+    monkeypatch.setattr(settings, "DB_BACKEND", "native")
+    conn = DuckDBManager._connect(str(tmp_path / "configured.duckdb"))
+    assert isinstance(backend_for_connection(conn), NativeBackend)
+    conn.close()
+
+    monkeypatch.setattr(settings, "DB_BACKEND", "adbc")
+    conn = DuckDBManager._connect(str(tmp_path / "configured.duckdb"))
+    assert isinstance(backend_for_connection(conn), AdbcBackend)
+    conn.close()
+
+    monkeypatch.setattr(settings, "DB_BACKEND", "odbc")
+    with pytest.raises(ValueError):
+        DuckDBManager._connect(str(tmp_path / "configured.duckdb"))
+
+
+def test_timeouts_share_one_watchdog_thread(backend, tmp_path):
+    """
+    Test that statements with a timeout do not start a thread each, and that
+    the shared watchdog still interrupts a runaway statement.
+    """
+    conn = backend.connect(str(tmp_path / "watchdog.duckdb"))
+    for _ in range(50):
+        execute_governed(backend, conn, "SELECT 1;", timeout=30)
+    timers = [thread for thread in threading.enumerate() if isinstance(thread, threading.Timer)]
+    assert timers == []
+    assert [thread.name for thread in threading.enumerate()].count("query-watchdog") == 1
+
+    with pytest.raises(QueryTimeoutError):
+        execute_governed(
+            backend, conn, "SELECT COUNT(*) FROM range(100000000000) a WHERE hash(a.range) % 7 = 3;",
+            timeout=0.2
+        )
+    conn.close()
@@ -0,0 +1,102 @@
+import pytest
+from pydantic import ValidationError
+from Challenge.DuckDBManager import DuckDBManager
+from Challenge.conditions import Condition, Predicate, build_key_lookup, build_update
+
+
+@pytest.fixture
+def setup_hierarchy(summary_database):
+    """
+    Set up an in-memory DuckDB instance with a small summary hierarchy.
+    """
+    return summary_database(
+        [(1, "Acme", "Fizz", "Cola"), (2, "Acme", "Fizz", "Lime"), (3, "Acme", "Pop", "Root")],
+        [(1, 1, "2024-01-05", 10, 20.0), (2, 1, "2024-01-07", 30, 10.0), (3, 2, "2024-01-09", 60, 14.0)],
+    )
+
+
+def test_condition_compiles_to_parameterized_sql():
+    """
+    Test that predicates compile to placeholders instead of inlined values.
+    """
+    condition = Condition(all_of=[
+        Predicate(column="supplier", value="O'Reilly"),
+        Predicate(column="brand", value=None),
+        Predicate(column="grouping_set_id", op="in", values=[1, 3]),
+        Predicate(column="invoice_date_month", op="range", low="2024-01-01", high="2024-03-01"),
+    ])
+    sql, params = condition.to_sql("sales_summary_by_product_family")
+    assert sql == (
+        '"supplier" = ? AND "brand" IS NULL AND "grouping_set_id" IN (?, ?) '
+        'AND "invoice_date_month" >= ? AND "invoice_date_month" <= ?'
+    )
+    assert params == ["O'Reilly", 1, 3, "2024-01-01", "2024-03-01"]
+
+
+def test_condition_rejects_non_key_columns_and_bad_operands():
+    """
+    Test that only key columns and well-formed predicates are accepted.
+    """
+    with pytest.raises(ValueError):
+        Condition(all_of=[Predicate(column="quantity", value=1)]).to_sql("sales_summary_by_product_family")
+    with pytest.raises(ValueError):
+        build_update("sales_summary_by_product_family", "quantity = 0; DROP TABLE sales; --", 1,
+                     Condition(all_of=[Predicate(column="supplier", value="Acme")]))
+    with pytest.raises(ValidationError):
+        Predicate(column="supplier", op="in", values=[])
+
+
+def test_structured_update_and_targeted_rebalance(setup_hierarchy):
+    """
+    Test that a structured brand edit touches only its own subtree and tiers.
+    """
+    DuckDBManager.set_instance_for_testing(setup_hierarchy)
+    db_manager = DuckDBManager()
+    table = "sales_summary_by_product_family"
+    condition = Condition(all_of=[
+        Predicate(column="supplier", value="Acme"),
+        Predicate(column="brand", value="Fizz"),
+        Predicate(column="family", value=None),
+        Predicate(column="invoice_date_month", value="2024-01-01"),
+    ])
+
+    lookup_sql, lookup_params = build_key_lookup(table, condition)
+    keys = db_manager.execute_query(lookup_sql, lookup_params).to_pylist()
+    assert [(key["brand"], key["grouping_set_id"]) for key in keys] == [("Fizz", 1)]
+
+    update = build_update(table, "quantity", "80", condition)
+    edited = db_manager.update_where("quantity", (lookup_sql, lookup_params), update, 80.0)
+    assert edited["keys"] == keys
+    assert edited["edit_id"] is not None
+
+    families = setup_hierarchy.execute(
+        f"SELECT family, quantity FROM {table} WHERE grouping_set_id = 0 ORDER BY family;"
+    ).fetchall()
+    assert families == [("Cola", 20), ("Lime", 60), ("Root", 60)]
+    quarter = setup_hierarchy.execute(
+        "SELECT quantity FROM sales_summary_by_product_family_quarter WHERE brand = 'Fizz' AND grouping_set_id = 1;"
+    ).fetchall()
+    assert quarter == [(80,)]
+
+
+def test_update_where_rolls_back_with_its_lookup(setup_hierarchy, monkeypatch):
+    """
+    Test that a structured update and the key lookup it came from commit
+    together, so a failed update leaves no partial change behind.
+    """
+    DuckDBManager.set_instance_for_testing(setup_hierarchy)
+    db_manager = DuckDBManager()
+    table = "sales_summary_by_product_family"
+    condition = Condition(all_of=[Predicate(column="family", value="Cola")])
+    before = setup_hierarchy.execute(f"SELECT * FROM {table} ORDER BY ALL;").fetchall()
+
+    def interrupted(*args, **kwargs):
+        raise RuntimeError("interrupted")
+
+    monkeypatch.setattr(db_manager, "refresh_rollup_tiers_for_keys", interrupted)
+    with pytest.raises(RuntimeError):
+        db_manager.update_where(
+            "quantity", build_key_lookup(table, condition), build_update(table, "quantity", "5", condition), 5.0
+        )
+    assert setup_hierarchy.execute(f"SELECT * FROM {table} ORDER BY ALL;").fetchall() == before
+    assert db_manager.undo_edit() is None
@@ -1,6 +1,10 @@
+import asyncio
+import threading
+import time
+
 import pytest
 import duckdb
-from Challenge.DuckDBManager import DuckDBManager
+from Challenge.DuckDBManager import DuckDBManager, QueryTimeoutError, settings
 
 
 @pytest.fixture
@@ -67,3 +71,234 @@ def test_rollup_to_parents(setup_duckdb):
     db_manager.execute_query("UPDATE sales SET quantity = 30 WHERE id = 1;")
     result = setup_duckdb.execute("SELECT * FROM sales WHERE id = 1;").fetchall()
     assert result == [(1, 30)]
+
+
+@pytest.fixture
+def setup_hierarchy(summary_database):
+    """
+    Set up an in-memory DuckDB instance with base tables and rollup tiers.
+    """
+    return summary_database(
+        [(1, "Acme", "Fizz", "Cola"), (2, "Acme", "Pop", "Lime"), (3, "Zenith", "Buzz", "Root")],
+        [
+            (1, 1, "2024-01-05", 10, 20.0), (2, 1, "2024-02-07", 5, 10.0),
+            (3, 2, "2024-03-09", 7, 14.0), (1, 2, "2024-05-11", 4, 8.0),
+        ],
+    )
+
+
+def test_recalculate_summary_tiers(setup_hierarchy):
+    """
+    Test that quarter and year tiers are rebuilt with typed date keys.
+    """
+    DuckDBManager.set_instance_for_testing(setup_hierarchy)
+    db_manager = DuckDBManager()
+
+    setup_hierarchy.execute("UPDATE sales SET quantity = 20 WHERE product_id = 1 AND invoice_date = '2024-01-05';")
+    db_manager.recalculate_summary()
+
+    month_type = setup_hierarchy.execute(
+        "SELECT DISTINCT typeof(invoice_date_month) FROM sales_summary_by_product_family;"
+    ).fetchall()
+    assert month_type == [("DATE",)]
+    quarters = setup_hierarchy.execute(
+        """
+        SELECT CAST(invoice_date_quarter AS VARCHAR), quantity
+        FROM sales_summary_by_product_family_quarter
+        WHERE supplier = 'Acme' AND grouping_set_id = 3
+        ORDER BY invoice_date_quarter;
+        """
+    ).fetchall()
+    assert quarters == [("2024-01-01", 25), ("2024-04-01", 4)]
+    years = setup_hierarchy.execute(
+        "SELECT SUM(quantity) FROM sales_summary_by_product_family_year WHERE grouping_set_id = 3;"
+    ).fetchall()
+    assert years == [(36,)]
+
+
+def test_refresh_rollup_tiers_targeted(setup_hierarchy):
+    """
+    Test that a targeted tier refresh only rewrites the affected bucket.
+    """
+    DuckDBManager.set_instance_for_testing(setup_hierarchy)
+    db_manager = DuckDBManager()
+
+    setup_hierarchy.execute(
+        """
+        UPDATE sales_summary_by_product_family SET quantity = quantity + 100
+        WHERE invoice_date_month IN ('2024-02-01', '2024-03-01');
+        """
+    )
+    db_manager.refresh_rollup_tiers(supplier="Acme", month="2024-02-01")
+
+    acme = setup_hierarchy.execute(
+        """
+        SELECT quantity FROM sales_summary_by_product_family_quarter
+        WHERE supplier = 'Acme' AND grouping_set_id = 3 AND invoice_date_quarter = '2024-01-01';
+        """
+    ).fetchall()
+    zenith = setup_hierarchy.execute(
+        """
+        SELECT quantity FROM sales_summary_by_product_family_quarter
+        WHERE supplier = 'Zenith' AND grouping_set_id = 3;
+        """
+    ).fetchall()
+    assert acme == [(115,)]
+    assert zenith == [(7,)]
+
+
+@pytest.fixture
+def workbook_registry(tmp_path, monkeypatch):
+    """
+    Route workbook shards to native DuckDB files in a temporary directory.
+    """
+    monkeypatch.setattr(settings, "WORKBOOK_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "MAX_OPEN_WORKBOOKS", 2)
+    monkeypatch.setattr(DuckDBManager, "_connect", classmethod(lambda cls, path: duckdb.connect(path)))
+    yield tmp_path
+    DuckDBManager.close_all()
+
+
+def test_for_workbook_routes_to_separate_files(workbook_registry):
+    """
+    Test that each workbook gets its own database file and handle.
+    """
+    first = DuckDBManager.for_workbook("north")
+    second = DuckDBManager.for_workbook("south")
+    first.execute_query("CREATE TABLE sales (id INT, quantity INT);")
+    first.execute_query("INSERT INTO sales VALUES (1, 10);")
+    second.execute_query("CREATE TABLE sales (id INT, quantity INT);")
+
+    assert DuckDBManager.for_workbook("north") is first
+    assert (workbook_registry / "north.duckdb").exists()
+    assert (workbook_registry / "south.duckdb").exists()
+    assert second.execute_query("SELECT COUNT(*) AS n FROM sales;").column("n")[0].as_py() == 0
+
+
+def test_for_workbook_lru_and_idle_eviction(workbook_registry, monkeypatch):
+    """
+    Test that the registry caps open files and closes idle handles.
+    """
+    DuckDBManager.for_workbook("a")
+    DuckDBManager.for_workbook("b")
+    DuckDBManager.for_workbook("a")
+    DuckDBManager.for_workbook("c")
+    assert DuckDBManager.open_workbooks() == ["a", "c"]
+
+    monkeypatch.setattr(settings, "WORKBOOK_IDLE_SECONDS", -1)
+    DuckDBManager.evict_idle()
+    assert DuckDBManager.open_workbooks() == []
+
+
+def test_acquired_workbooks_are_not_evicted(workbook_registry, monkeypatch):
+    """
+    Test that a handle held by a request stays open between its statements
+    while other workbooks are opened and idle handles are evicted.
+    """
+    with DuckDBManager.acquire("a") as handle:
+        handle.execute_query("CREATE TABLE sales (id INT);")
+        DuckDBManager.for_workbook("b")
+        DuckDBManager.for_workbook("c")
+        monkeypatch.setattr(settings, "WORKBOOK_IDLE_SECONDS", -1)
+        DuckDBManager.evict_idle()
+        assert DuckDBManager.open_workbooks() == ["a"]
+        assert handle.execute_query("SELECT COUNT(*) AS n FROM sales;").column("n")[0].as_py() == 0
+    assert handle.pinned == 0
+    DuckDBManager.evict_idle()
+    assert DuckDBManager.open_workbooks() == []
+
+
+def test_opening_a_workbook_does_not_block_others(workbook_registry, monkeypatch):
+    """
+    Test that other workbooks are served while one shard's file is still
+    being opened, and that concurrent requests for that shard share one
+    handle.
+    """
+    DuckDBManager.for_workbook("fast")
+    release = threading.Event()
+    connect = DuckDBManager._connect
+
+    def slow_connect(cls, path):
+        if path.endswith("slow.duckdb"):
+            release.wait(5)
+        return connect(path)
+
+    monkeypatch.setattr(DuckDBManager, "_connect", classmethod(slow_connect))
+    opened = []
+    openers = [
+        threading.Thread(target=lambda: opened.append(DuckDBManager.for_workbook("slow")))
+        for _ in range(2)
+    ]
+    for opener in openers:
+        opener.start()
+    try:
+        with DuckDBManager.acquire("fast") as handle:
+            assert handle.execute_query("SELECT 1 AS one;").column("one")[0].as_py() == 1
+        assert not opened
+    finally:
+        release.set()
+        for opener in openers:
+            opener.join(5)
+    assert len(opened) == 2 and opened[0] is opened[1]
+
+
+def test_for_workbook_rejects_unsafe_ids(workbook_registry):
+    """
+    Test that workbook IDs cannot escape the workbook directory.
+    """
+    with pytest.raises(ValueError):
+        DuckDBManager.for_workbook("../sales_metrics")
+
+
+SLOW_QUERY = "SELECT COUNT(*) FROM range(100000000000) a WHERE hash(a.range) % 7 = 3;"
+
+
+def test_execute_query_timeout_interrupts(setup_duckdb):
+    """
+    Test that a runaway query is interrupted once its timeout elapses.
+    """
+    DuckDBManager.set_instance_for_testing(setup_duckdb)
+    db_manager = DuckDBManager()
+
+    started = time.monotonic()
+    with pytest.raises(QueryTimeoutError):
+        db_manager.execute_query(SLOW_QUERY, timeout=0.2)
+    assert time.monotonic() - started < 5
+
+    # The connection is free again for the next statement
+    assert db_manager.execute_query("SELECT 1 AS one;").column("one")[0].as_py() == 1
+
+
+@pytest.mark.asyncio
+async def test_execute_query_async_cancellation(setup_duckdb):
+    """
+    Test that cancelling the awaiting task interrupts the DuckDB statement.
+    """
+    DuckDBManager.set_instance_for_testing(setup_duckdb)
+    db_manager = DuckDBManager()
+
+    task = asyncio.ensure_future(db_manager.execute_query_async(SLOW_QUERY, timeout=0))
+    await asyncio.sleep(0.2)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    started = time.monotonic()
+    await db_manager.execute_query_async("SELECT 1;", timeout=5)
+    assert time.monotonic() - started < 5
+
+
+def test_query_class_limits(setup_duckdb, monkeypatch):
+    """
+    Test that bulk and interactive queries run with their own thread limits.
+    """
+    monkeypatch.setattr(settings, "BULK_THREADS", 1)
+    monkeypatch.setattr(settings, "INTERACTIVE_THREADS", 2)
+    DuckDBManager.set_instance_for_testing(setup_duckdb)
+    db_manager = DuckDBManager()
+
+    query = "SELECT current_setting('threads') AS threads;"
+    assert db_manager.execute_query(query, query_class="bulk").column("threads")[0].as_py() == 1
+    assert db_manager.execute_query(query).column("threads")[0].as_py() == 2
+    with pytest.raises(ValueError):
+        db_manager.execute_query(query, query_class="batch")
@@ -0,0 +1,89 @@
+import pytest
+from Challenge.DuckDBManager import DuckDBManager
+from Challenge.formulas import FORMULA_PIVOT_VIEW, FORMULA_TABLE, FormulaEngine
+
+
+@pytest.fixture
+def setup_formulas(summary_database):
+    """
+    Set up an in-memory DuckDB instance with two months of summary rows and
+    their formula cells.
+    """
+    connection = summary_database(
+        [(1, "Acme", "Fizz", "Cola"), (2, "Acme", "Fizz", "Lime"), (3, "Acme", "Pop", "Root")],
+        [
+            (1, 1, "2024-01-05", 10, 20.0), (2, 1, "2024-01-07", 30, 90.0),
+            (3, 2, "2024-01-09", 20, 40.0), (1, 2, "2024-02-11", 20, 50.0),
+            (2, 2, "2024-02-12", 15, 45.0), (3, 1, "2024-02-14", 25, 75.0),
+        ],
+    )
+    DuckDBManager.set_instance_for_testing(connection)
+    FormulaEngine(DuckDBManager()).ensure_table()
+    return connection
+
+
+def formula_cells(connection):
+    return connection.execute(f"SELECT * FROM {FORMULA_TABLE} ORDER BY ALL;").fetchall()
+
+
+def node_key(connection, month, brand=None, family=None, level=1):
+    date = connection.execute(f"SELECT DATE '2024-{month:02d}-01'").fetchone()[0]
+    return {"supplier": "Acme", "brand": brand, "family": family,
+            "invoice_date_month": date, "grouping_set_id": level}
+
+
+def test_formulas_are_computed_from_the_summary(setup_formulas):
+    """
+    Test the price per unit, month-over-month growth and share of parent
+    cells, and their pivot by month.
+    """
+    cola_february = setup_formulas.execute(
+        f"""
+        SELECT price_per_unit, quantity_mom_growth, quantity_share_of_parent
+        FROM {FORMULA_TABLE}
+        WHERE family = 'Cola' AND month(invoice_date_month) = 2;
+        """
+    ).fetchone()
+    # 50 / 20, (20 - 10) / 10 and 20 of the 35 units of brand Fizz
+    assert cola_february == pytest.approx((2.5, 1.0, 20 / 35))
+    supplier_share = setup_formulas.execute(
+        f"SELECT quantity_share_of_parent FROM {FORMULA_TABLE} WHERE grouping_set_id = 3;"
+    ).fetchall()
+    assert supplier_share == [(None,), (None,)]
+    pivot = setup_formulas.execute(
+        f'SELECT "2024-02_price_per_unit" FROM {FORMULA_PIVOT_VIEW} WHERE family = \'Lime\';'
+    ).fetchone()
+    assert pivot == (3.0,)
+
+
+def test_edits_recompute_only_dependent_formulas(setup_formulas):
+    """
+    Test that edits and their undo recompute the same formula values as a
+    full recalculation, touching only the cells that read a changed cell.
+    """
+    db_manager = DuckDBManager()
+
+    edited = db_manager.edit_nodes("quantity", [node_key(setup_formulas, 1, "Fizz")], 80.0)
+    assert edited["formulas"] == [
+        "price_per_unit", "quantity_mom_growth", "quantity_share_of_parent",
+    ]
+    recomputed = {
+        (key["brand"], key["family"], key["invoice_date_month"].month)
+        for key in edited["formula_keys"]
+    }
+    # The January cells of the edited tree, their February growth and the
+    # share of Pop, whose parent changed; Pop's own values did not change
+    assert (None, None, 2) in recomputed and ("Fizz", "Cola", 2) in recomputed
+    assert ("Pop", None, 1) in recomputed
+    assert ("Pop", None, 2) not in recomputed and ("Pop", "Root", 1) not in recomputed
+
+    incremental = formula_cells(setup_formulas)
+    FormulaEngine(db_manager).recalculate_all()
+    assert formula_cells(setup_formulas) == pytest.approx(incremental)
+
+    db_manager.edit_nodes("net_amount", [node_key(setup_formulas, 2, "Pop", "Root", 0)], 10.0)
+    undone = db_manager.undo_edit()
+    assert "net_amount_share_of_parent" in undone["formulas"]
+    incremental = formula_cells(setup_formulas)
+    FormulaEngine(db_manager).recalculate_all()
+    assert formula_cells(setup_formulas) == incremental
@@ -0,0 +1,196 @@
+import duckdb
+import pytest
+from hypothesis import given, settings as hypothesis_settings, strategies as st
+from Challenge.DuckDBManager import DuckDBManager
+from Challenge.schema import ROLLUP_TIERS, key_statements
+from tests.conftest import create_summary
+
+SUMMARY = "sales_summary_by_product_family"
+COLUMNS = ["supplier", "brand", "family", "invoice_date_month", "grouping_set_id"]
+NODE_COLUMNS = {3: ["supplier"], 1: ["supplier", "brand"], 0: ["supplier", "brand", "family"]}
+
+products = st.lists(
+    st.tuples(
+        st.sampled_from(["Acme", "Zenith"]),
+        st.sampled_from(["Fizz", "Pop", "Buzz"]),
+        st.sampled_from(["Cola", "Lime", "Root"]),
+    ),
+    min_size=1, max_size=8, unique=True,
+)
+sales = st.lists(
+    st.tuples(
+        st.integers(0, 7),  # product index, wrapped to the product count
+        st.sampled_from(["2024-01-05", "2024-02-07"]),
+        st.integers(0, 50),
+    ),
+    min_size=1, max_size=20,
+)
+
+
+def build_database(product_rows, sales_rows, path=":memory:", keys=False):
+    """
+    Create a workbook with a summary built from the given rows, optionally
+    file-backed and with the primary keys and unique indexes of data.py.
+    """
+    connection = duckdb.connect(path)
+    create_summary(
+        connection,
+        [(index, *row) for index, row in enumerate(product_rows)],
+        [(product % len(product_rows), 1, day, quantity, quantity * 2.0)
+         for product, day, quantity in sales_rows],
+    )
+    if keys:
+        connection.execute("CREATE TABLE customer (customer_id INT);")
+        for statement in key_statements():
+            connection.execute(statement)
+        # Reopen the file like a database built by data.py, so the rows and
+        # index entries are read back from storage
+        connection.close()
+        connection = duckdb.connect(path)
+    DuckDBManager.set_instance_for_testing(connection)
+    return connection
+
+
+def summary_rows(connection, column="quantity"):
+    rows = connection.execute(
+        f"SELECT {', '.join(COLUMNS)}, {column} FROM {SUMMARY};"
+    ).fetchall()
+    return {tuple(row[:-1]): row[-1] for row in rows}
+
+
+def related(row, key):
+    """
+    Whether a summary row is in the edited node's subtree or ancestor chain.
+    """
+    coarser = max(row[4], key["grouping_set_id"])
+    return row[3] == key["invoice_date_month"] and all(
+        row[COLUMNS.index(column)] == key[column] for column in NODE_COLUMNS[coarser]
+    )
+
+
+def assert_sums(rows):
+    """
+    Every supplier equals the sum of its brands and every brand the sum of
+    its families, per month.
+    """
+    for (supplier, brand, family, month, level), value in rows.items():
+        if level == 0:
+            continue
+        child_level = 1 if level == 3 else 0
+        children = [
+            child_value for child, child_value in rows.items()
+            if child[4] == child_level and child[0] == supplier and child[3] == month
+            and (level == 3 or child[1] == brand)
+        ]
+        assert value == pytest.approx(sum(children), rel=1e-9, abs=1e-6)
+
+
+@hypothesis_settings(max_examples=40, deadline=None)
+@given(
+    product_rows=products,
+    sales_rows=sales,
+    pick=st.integers(0, 1000),
+    value=st.floats(0, 10000, allow_nan=False),
+    mode=st.sampled_from(["proportional", "equal"]),
+)
+def test_edit_keeps_hierarchy_sums(product_rows, sales_rows, pick, value, mode):
+    """
+    Property: after editing any node, the node holds the new value, every
+    parent is the sum of its children, and rows outside the node's subtree
+    and ancestor chain are untouched.
+    """
+    connection = build_database(product_rows, sales_rows)
+    try:
+        before = summary_rows(connection)
+        edited = sorted(before, key=repr)[pick % len(before)]
+        key = dict(zip(COLUMNS, edited))
+
+        DuckDBManager().edit_nodes("quantity", [key], value, mode)
+
+        after = summary_rows(connection)
+        assert after[edited] == pytest.approx(value)
+        assert_sums(after)
+        for row, old_value in before.items():
+            if not related(row, key):
+                assert after[row] == old_value
+        # The other measure is not edited
+        assert_sums(summary_rows(connection, "net_amount"))
+    finally:
+        connection.close()
+
+
+def test_edit_splits_equally_without_child_values():
+    """
+    Test that a proportional split falls back to an equal split when the
+    children sum to zero, and that rollup tiers follow the edit.
+    """
+    connection = build_database(
+        [("Acme", "Fizz", "Cola"), ("Acme", "Fizz", "Lime"), ("Acme", "Pop", "Root")],
+        [(0, "2024-01-05", 0), (1, "2024-01-05", 0), (2, "2024-01-05", 6)],
+    )
+    key = {"supplier": "Acme", "brand": "Fizz", "family": None,
+           "invoice_date_month": connection.execute("SELECT DATE '2024-01-01'").fetchone()[0],
+           "grouping_set_id": 1}
+
+    DuckDBManager().edit_nodes("quantity", [key], 9.0)
+
+    families = connection.execute(
+        f"SELECT family, quantity FROM {SUMMARY} WHERE grouping_set_id = 0 ORDER BY family;"
+    ).fetchall()
+    assert families == [("Cola", 4.5), ("Lime", 4.5), ("Root", 6.0)]
+    supplier = connection.execute(
+        f"SELECT quantity FROM {SUMMARY} WHERE grouping_set_id = 3;"
+    ).fetchall()
+    assert supplier == [(15.0,)]
+    quarter = connection.execute(
+        "SELECT quantity FROM sales_summary_by_product_family_quarter WHERE grouping_set_id = 3;"
+    ).fetchall()
+    assert quarter == [(15.0,)]
+    connection.close()
+
+
+def test_transaction_rolls_back_on_error():
+    """
+    Test that a failed edit leaves the summary unchanged.
+    """
+    connection = build_database([("Acme", "Fizz", "Cola")], [(0, "2024-01-05", 5)])
+    db_manager = DuckDBManager()
+    before = summary_rows(connection)
+
+    with pytest.raises(ValueError):
+        with db_manager.transaction():
+            db_manager.execute_query(f"UPDATE {SUMMARY} SET quantity = 99;")
+            db_manager.edit_nodes(
+                "quantity", [{"supplier": "Acme", "invoice_date_month": None, "grouping_set_id": 7}], 1.0
+            )
+
+    assert summary_rows(connection) == before
+    connection.close()
+
+
+def test_edits_refresh_unique_tier_keys_in_transaction(tmp_path):
+    """
+    Test that edits, undo and summary rebuilds of a file-backed workbook
+    with unique summary and tier indexes rewrite the rows they refresh
+    without violating the indexes inside their transaction.
+    """
+    connection = build_database(
+        [("Acme", "Fizz", "Cola"), ("Acme", "Fizz", "Lime")],
+        [(0, "2024-01-05", 10), (1, "2024-02-07", 5)],
+        path=str(tmp_path / "keyed.duckdb"), keys=True,
+    )
+    db_manager = DuckDBManager()
+    key = {"supplier": "Acme", "brand": "Fizz", "family": None,
+           "invoice_date_month": connection.execute("SELECT DATE '2024-01-01'").fetchone()[0],
+           "grouping_set_id": 1}
+    quarter = f"SELECT quantity FROM {ROLLUP_TIERS['quarter']['table']} WHERE grouping_set_id = 3;"
+
+    assert db_manager.edit_nodes("quantity", [key], 40.0)["edit_id"] == 1
+    assert connection.execute(quarter).fetchall() == [(45.0,)]
+    assert db_manager.undo_edit()["edit_id"] == 1
+    assert connection.execute(quarter).fetchall() == [(15.0,)]
+
+    connection.execute("UPDATE sales SET quantity = 20 WHERE product_id = 0;")
+    db_manager.recalculate_summary()
+    assert connection.execute(quarter).fetchall() == [(25.0,)]
+    connection.close()
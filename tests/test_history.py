@@ -0,0 +1,169 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+
+import duckdb
+import pytest
+from Challenge.DuckDBManager import DuckDBManager, settings
+from Challenge.schema import ROLLUP_TIERS
+
+SUMMARY = "sales_summary_by_product_family"
+
+
+@pytest.fixture
+def setup_history(summary_database):
+    """
+    Set up an in-memory DuckDB instance with a summary and rollup tiers.
+    """
+    connection = summary_database(
+        [(1, "Acme", "Fizz", "Cola"), (2, "Acme", "Fizz", "Lime"), (3, "Acme", "Pop", "Root")],
+        [
+            (1, 1, "2024-01-05", 10, 20.0), (2, 1, "2024-01-07", 30, 60.0),
+            (3, 2, "2024-01-09", 20, 40.0), (1, 2, "2024-02-11", 4, 8.0),
+        ],
+    )
+    DuckDBManager.set_instance_for_testing(connection)
+    return connection
+
+
+def snapshot(connection):
+    return connection.execute(
+        f"SELECT * FROM {SUMMARY} ORDER BY ALL;"
+    ).fetchall(), connection.execute(
+        f"SELECT * FROM {ROLLUP_TIERS['quarter']['table']} ORDER BY ALL;"
+    ).fetchall()
+
+
+def brand_key(connection, brand):
+    month = connection.execute("SELECT DATE '2024-01-01'").fetchone()[0]
+    return {"supplier": "Acme", "brand": brand, "family": None,
+            "invoice_date_month": month, "grouping_set_id": 1}
+
+
+@pytest.mark.asyncio
+async def test_cancelled_async_edit_rolls_back(setup_history):
+    """
+    Test that cancelling an async edit between two of its statements stops
+    the transaction in DuckDB and rolls the whole edit back.
+    """
+    db_manager = DuckDBManager()
+    before = snapshot(setup_history)
+    reached, resume = threading.Event(), threading.Event()
+    refresh = db_manager.refresh_rollup_tiers_for_keys
+
+    def paused_refresh(keys, handle=None):
+        reached.set()
+        resume.wait(5)
+        return refresh(keys, handle)
+
+    db_manager.refresh_rollup_tiers_for_keys = paused_refresh
+    try:
+        task = asyncio.ensure_future(
+            db_manager.edit_nodes_async("quantity", [brand_key(setup_history, "Fizz")], 80.0)
+        )
+        while not reached.is_set():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        resume.set()
+        # The executor thread finishes by rolling the transaction back
+        with db_manager.transaction():
+            pass
+    finally:
+        resume.set()
+        del db_manager.refresh_rollup_tiers_for_keys
+
+    assert snapshot(setup_history) == before
+    assert db_manager.undo_edit() is None
+
+
+def test_undo_and_redo_restore_cascaded_cells(setup_history):
+    """
+    Test that undo reverts an edit with its child and parent changes and
+    redo re-applies it, keeping the rollup tiers in step.
+    """
+    db_manager = DuckDBManager()
+    before = snapshot(setup_history)
+
+    edit_id = db_manager.edit_nodes("quantity", [brand_key(setup_history, "Fizz")], 80.0)["edit_id"]
+    after = snapshot(setup_history)
+    deltas = setup_history.execute(
+        "SELECT family, grouping_set_id, old_value, new_value FROM edit_history ORDER BY ALL;"
+    ).fetchall()
+    # The edited brand, its two families and its supplier; Pop is unchanged
+    assert deltas == [
+        ("Cola", 0, 10.0, 20.0), ("Lime", 0, 30.0, 60.0),
+        (None, 1, 40.0, 80.0), (None, 3, 60.0, 100.0),
+    ]
+
+    undone = db_manager.undo_edit()
+    assert undone["edit_id"] == edit_id
+    assert len(undone["affected_keys"]) == 4
+    assert snapshot(setup_history) == before
+
+    redone = db_manager.redo_edit()
+    assert redone["edit_id"] == edit_id
+    assert snapshot(setup_history) == after
+    assert db_manager.redo_edit() is None
+
+
+def test_new_edit_discards_redo_and_history_is_bounded(setup_history, monkeypatch):
+    """
+    Test that an edit after an undo drops the redo stack and that only the
+    configured number of edits is kept.
+    """
+    monkeypatch.setattr(settings, "EDIT_HISTORY_MAX_EDITS", 2)
+    db_manager = DuckDBManager()
+    key = brand_key(setup_history, "Pop")
+
+    for value in (21.0, 22.0, 23.0):
+        db_manager.edit_nodes("quantity", [key], value)
+    assert setup_history.execute(
+        "SELECT DISTINCT edit_id FROM edit_history ORDER BY edit_id;"
+    ).fetchall() == [(2,), (3,)]
+
+    db_manager.undo_edit()
+    db_manager.edit_nodes("quantity", [key], 30.0)
+    assert db_manager.redo_edit() is None
+
+    db_manager.undo_edit()
+    db_manager.undo_edit()
+    assert db_manager.undo_edit() is None
+    pop = setup_history.execute(
+        f"SELECT quantity FROM {SUMMARY} WHERE brand = 'Pop' AND grouping_set_id = 1 AND month(invoice_date_month) = 1;"
+    ).fetchall()
+    assert pop == [(21.0,)]
+
+
+def test_rebuilding_the_database_clears_the_undo_history(tmp_path):
+    """
+    Test that undo is a no-op after data.py rebuilt the summary, instead of
+    replaying deltas of the earlier rows into the new ones.
+    """
+    challenge = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Challenge")
+    path = str(tmp_path / "rebuilt.duckdb")
+
+    def rebuild():
+        subprocess.run([sys.executable, "data.py", path], cwd=challenge, check=True, capture_output=True)
+
+    rebuild()
+    connection = duckdb.connect(path)
+    DuckDBManager.set_instance_for_testing(connection)
+    key = connection.execute(
+        f"SELECT supplier, brand, family, invoice_date_month, grouping_set_id "
+        f"FROM {SUMMARY} WHERE grouping_set_id = 0 LIMIT 1;"
+    ).fetchone()
+    columns = ["supplier", "brand", "family", "invoice_date_month", "grouping_set_id"]
+    DuckDBManager().edit_nodes("quantity", [dict(zip(columns, key))], 999.0)
+    connection.close()
+
+    rebuild()
+    connection = duckdb.connect(path)
+    DuckDBManager.set_instance_for_testing(connection)
+    before = connection.execute(f"SELECT * FROM {SUMMARY} ORDER BY ALL;").fetchall()
+    assert DuckDBManager().undo_edit() is None
+    assert connection.execute(f"SELECT * FROM {SUMMARY} ORDER BY ALL;").fetchall() == before
+    connection.close()
@@ -1,7 +1,7 @@
 import pytest
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from fastapi.testclient import TestClient
-from Challenge.mainapi import app
+from Challenge.mainapi import QueryTimeoutError, app
 
 client = TestClient(app)
 
@@ -31,6 +31,8 @@ def duckdb_mock():
     with patch("Challenge.mainapi.DuckDBManager", autospec=True) as mock_duckdb:
         instance = mock_duckdb.return_value
         instance.execute_query_async = AsyncMock(return_value=None)
+        instance.edit_nodes_async = AsyncMock(return_value=None)
+        instance.edit_nodes_where_async = AsyncMock(return_value={"keys": []})
         yield instance
 
 
@@ -52,16 +54,16 @@ async def test_update_cell_success(valid_update_request, redis_mock, duckdb_mock
         assert response.status_code == 200
         assert response.json()["status"] == "success"
 
-        assert duckdb_mock.execute_query_async.call_count == 2
-
+        # Summary measure edits are written by the hierarchy engine
+        assert duckdb_mock.execute_query_async.call_count == 1
         calls = [call.args[0] for call in duckdb_mock.execute_query_async.call_args_list]
         assert any("SELECT 1;" in query for query in calls), "Connection check query missing."
-        assert any(
-            f"UPDATE {valid_update_request['table']}" in query and
-            f"SET {valid_update_request['column']} = '{valid_update_request['value']}'" in query and
-            f"WHERE {valid_update_request['condition']}" in query
-            for query in calls
-        ), f"Update query missing or malformed. Actual calls: {calls}"
+        duckdb_mock.edit_nodes_where_async.assert_awaited_once_with(
+            valid_update_request["column"],
+            valid_update_request["condition"],
+            14.0,
+            "proportional",
+        )
         redis_mock.xadd.assert_called_once()
 
 
@@ -82,3 +84,162 @@ def test_get_updates(redis_mock):
     assert response.status_code == 200
     assert response.json()["status"] == "success"
     redis_mock.xrange.assert_called_once()
+
+
+def test_update_cell_timeout(valid_update_request, redis_mock, duckdb_mock):
+    """
+    Test that an update interrupted by its timeout returns 504.
+    """
+    duckdb_mock.edit_nodes_where_async.side_effect = QueryTimeoutError("too slow")
+    with patch("Challenge.mainapi.db_manager", duckdb_mock):
+        response = client.post("/update_cell", json=valid_update_request)
+    assert response.status_code == 504
+    redis_mock.xadd.assert_not_called()
+
+
+def test_update_cell_structured_condition(redis_mock, duckdb_mock):
+    """
+    Test that structured conditions compile to parameterized SQL and drive
+    a targeted hierarchy edit of the affected keys.
+    """
+    keys = [
+        {"supplier": "Smith Ltd", "brand": None, "family": None,
+         "invoice_date_month": "2024-01-01", "grouping_set_id": 3}
+    ]
+    duckdb_mock.update_where_async = AsyncMock(return_value={"keys": list(keys), "edit_id": 1})
+    payload = {
+        "table": "sales_summary_by_product_family",
+        "column": "quantity",
+        "value": "14",
+        "where": {"all_of": [
+            {"column": "supplier", "value": "Smith Ltd"},
+            {"column": "grouping_set_id", "value": 3},
+        ]},
+        "level": 3,
+    }
+    with patch("Challenge.mainapi.db_manager", duckdb_mock):
+        response = client.post("/update_cell", json=payload)
+
+    assert response.status_code == 200
+    assert response.json()["affected_rows"] == 1
+    # The key lookup and the hierarchy edit of those keys share a transaction
+    column, lookup, update, value, split = duckdb_mock.update_where_async.call_args.args
+    assert (column, value, split) == ("quantity", 14.0, "proportional")
+    assert lookup[1] == ["Smith Ltd", 3]
+    duckdb_mock.edit_nodes_async.assert_not_awaited()
+
+
+def test_update_cell_structured_condition_rejects_non_key(redis_mock, duckdb_mock):
+    """
+    Test that structured conditions on non-key columns are rejected.
+    """
+    payload = {
+        "table": "sales_summary_by_product_family",
+        "column": "quantity",
+        "value": "14",
+        "where": {"all_of": [{"column": "net_amount", "value": 1}]},
+    }
+    response = client.post("/update_cell", json=payload)
+    assert response.status_code == 400
+
+
+def test_update_cell_worker_mode_forwards_to_writer(valid_update_request, redis_mock):
+    """
+    Test that worker mode forwards writes to the writer and relays its reply.
+    """
+    writer_mock = MagicMock()
+    writer_mock.submit = AsyncMock(side_effect=[
+        {"status_code": 200, "body": {"status": "success", "message": "Updated sales_summary_by_product_family"}},
+        {"status_code": 504, "detail": "Update timed out."},
+    ])
+    with patch("Challenge.mainapi.writer_client", writer_mock):
+        response = client.post("/update_cell", json=valid_update_request)
+        assert response.status_code == 200
+        assert response.json()["status"] == "success"
+        forwarded = writer_mock.submit.call_args.args[0]
+        assert forwarded["condition"] == valid_update_request["condition"]
+
+        response = client.post("/update_cell", json=valid_update_request)
+        assert response.status_code == 504
+    redis_mock.xadd.assert_not_called()
+
+
+def test_undo_and_redo_endpoints(redis_mock, duckdb_mock):
+    """
+    Test that undo replays the edit history and broadcasts the changed
+    cells, and that an empty redo stack returns 409.
+    """
+    duckdb_mock.undo_edit_async = AsyncMock(return_value={
+        "edit_id": 4,
+        "affected_keys": [
+            {"supplier": "Smith Ltd", "brand": None, "family": None,
+             "invoice_date_month": "2024-01-01", "grouping_set_id": 3}
+        ],
+    })
+    duckdb_mock.redo_edit_async = AsyncMock(return_value=None)
+    with patch("Challenge.mainapi.db_manager", duckdb_mock):
+        response = client.post("/undo")
+        assert response.status_code == 200
+        assert response.json()["edit_id"] == 4
+        assert response.json()["affected_rows"] == 1
+        broadcast = redis_mock.xadd.call_args.args[1]
+        assert broadcast["action"] == "undo"
+
+        response = client.post("/redo")
+        assert response.status_code == 409
+
+
+def test_slow_query_admin_endpoints():
+    """
+    Test that the admin endpoints configure and report the profiler in
+    embedded mode and are forwarded to the writer in worker mode.
+    """
+    from Challenge.mainapi import profiler_command
+
+    mode = client.get("/admin/slow_queries").json()["profiling"]
+    with patch("Challenge.mainapi.profiler_command", wraps=profiler_command) as command:
+        response = client.post("/admin/profiling", json={"threshold_ms": 250})
+        assert response.status_code == 200
+        assert response.json()["profiling"]["threshold_ms"] == 250
+        assert command.call_args.args[0] == {"command": "profiling", "threshold_ms": 250}
+
+        response = client.delete("/admin/slow_queries")
+        assert response.status_code == 200
+        assert response.json()["slow_queries"] == []
+    client.post("/admin/profiling", json=mode)
+
+    response = client.post("/admin/profiling", json={"top_n": 0})
+    assert response.status_code == 422
+
+    writer_mock = MagicMock()
+    writer_mock.submit = AsyncMock(return_value={
+        "status_code": 200,
+        "body": {"status": "success", "profiling": {}, "slow_queries": []},
+    })
+    with patch("Challenge.mainapi.writer_client", writer_mock):
+        response = client.get("/admin/slow_queries")
+        assert response.status_code == 200
+        writer_mock.submit.assert_awaited_once_with({"command": "slow_queries"})
+
+
+def test_app_starts_services_in_lifespan(monkeypatch):
+    """
+    Test that building the app opens nothing and that its lifespan creates
+    the Redis client and DuckDB handle, then releases them on shutdown.
+    """
+    import duckdb
+    from Challenge import mainapi
+    from Challenge.redisclient import create_redis_client
+
+    application = mainapi.create_app()
+    assert mainapi.redis_client is None
+    assert mainapi.db_manager is None
+
+    mainapi.DuckDBManager.set_instance_for_testing(duckdb.connect(":memory:"))
+    monkeypatch.setattr(mainapi, "get_redis_client", lambda: create_redis_client("memory://"))
+    with TestClient(application) as lifespan_client:
+        assert mainapi.db_manager is not None
+        assert mainapi.redis_client is not None
+        assert lifespan_client.get("/").status_code == 200
+    assert mainapi.redis_client is None
+    assert mainapi.db_manager is None
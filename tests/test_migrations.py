@@ -0,0 +1,102 @@
+import duckdb
+import pytest
+from Challenge.DuckDBManager import DuckDBManager, settings
+from Challenge.migrations import migrate
+from Challenge.schema import SUMMARY_TABLE
+
+
+@pytest.fixture
+def legacy_workbook(tmp_path, monkeypatch):
+    """
+    Write a workbook file in the layout of the original data.py: text dates,
+    a text summary month, no rollup tiers and no keys or indexes.
+    """
+    monkeypatch.setattr(settings, "WORKBOOK_DIR", str(tmp_path))
+    monkeypatch.setattr(DuckDBManager, "_connect", classmethod(lambda cls, path: duckdb.connect(path)))
+    connection = duckdb.connect(str(tmp_path / "legacy.duckdb"))
+    connection.execute(
+        "CREATE TABLE product AS SELECT * FROM (VALUES (1, 'Cola', 'Acme', 'Fizz', 'Soda'), (2, 'Lime', 'Acme', 'Pop', 'Soda')) t(product_id, name, supplier, brand, family);"
+    )
+    connection.execute(
+        "CREATE TABLE sales AS SELECT * FROM (VALUES (1, 1, '2024-01-05', 10, 20.0), (2, 1, '2024-02-07', 5, 10.0)) t(product_id, customer_id, invoice_date, quantity, net_price);"
+    )
+    connection.execute(
+        f"""
+        CREATE TABLE {SUMMARY_TABLE} AS
+        SELECT p.supplier, p.brand, p.family,
+            STRFTIME(CAST(s.invoice_date AS DATE), '%Y-%m') AS invoice_date_month,
+            SUM(s.quantity) AS quantity, SUM(s.net_price) AS net_amount,
+            GROUPING_ID(p.supplier, p.brand, p.family) AS grouping_set_id
+        FROM sales s JOIN product p ON s.product_id = p.product_id
+        GROUP BY GROUPING SETS (
+            (p.supplier, p.brand, p.family, invoice_date_month),
+            (p.supplier, p.brand, invoice_date_month),
+            (p.supplier, invoice_date_month)
+        );
+        """
+    )
+    connection.close()
+    yield
+    DuckDBManager.close_all()
+
+
+def test_migrate_legacy_workbook(legacy_workbook):
+    """
+    Test that opening a legacy file types its dates, adds keys and indexes
+    and materializes the formula cells.
+    """
+    db_manager = DuckDBManager.for_workbook("legacy")
+    conn = db_manager.conn
+
+    types = conn.execute(
+        f"""
+        SELECT table_name, data_type FROM information_schema.columns
+        WHERE column_name IN ('invoice_date', 'invoice_date_month', 'invoice_date_quarter')
+        ORDER BY table_name;
+        """
+    ).fetchall()
+    assert types == [
+        ("sales", "DATE"),
+        (SUMMARY_TABLE, "DATE"),
+        (f"{SUMMARY_TABLE}_quarter", "DATE"),
+        ("sales_summary_formulas", "DATE"),
+        ("sales_summary_with_formulas", "DATE"),
+    ]
+    primary_keys = conn.execute(
+        "SELECT table_name FROM duckdb_constraints() WHERE constraint_type = 'PRIMARY KEY' ORDER BY table_name;"
+    ).fetchall()
+    assert ("product",) in primary_keys
+    indexes = {row[0] for row in conn.execute("SELECT index_name FROM duckdb_indexes();").fetchall()}
+    assert {"idx_summary_key", "idx_summary_family", "idx_sales_product_id"} <= indexes
+
+    # The summary key is enforced and family lookups use the ART index
+    with pytest.raises(duckdb.ConstraintException):
+        conn.execute(f"INSERT INTO {SUMMARY_TABLE} SELECT * FROM {SUMMARY_TABLE} WHERE grouping_set_id = 0 LIMIT 1;")
+    plan = conn.execute(f"EXPLAIN ANALYZE UPDATE {SUMMARY_TABLE} SET quantity = 1 WHERE family = 'Soda';").fetchall()[0][1]
+    assert "Index Scan" in plan
+
+    # Applied migrations are recorded and not run again
+    assert migrate(db_manager) == []
+
+
+def test_failed_migration_is_rolled_back(legacy_workbook, monkeypatch):
+    """
+    Test that a migration failing halfway leaves neither its changes nor its
+    record behind, so it runs again on the next open.
+    """
+    from Challenge import migrations
+
+    db_manager = DuckDBManager.for_workbook("legacy")
+
+    def half_done(manager):
+        manager.execute_query("CREATE TABLE half_done (id INT);")
+        raise RuntimeError("interrupted")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [(99, "half_done", half_done)])
+    with pytest.raises(RuntimeError):
+        migrations.migrate(db_manager)
+
+    tables = {row[0] for row in db_manager.conn.execute("SELECT table_name FROM duckdb_tables();").fetchall()}
+    assert "half_done" not in tables
+    versions = db_manager.conn.execute("SELECT version FROM schema_migrations;").fetchall()
+    assert (99,) not in versions
@@ -0,0 +1,157 @@
+import pytest
+import duckdb
+from Challenge.DuckDBManager import DuckDBManager
+from Challenge.parquet_exporter import (
+    ParquetExporter,
+    ReadOnlyQueryEngine,
+    SnapshotUnavailableError,
+)
+
+
+@pytest.fixture
+def setup_duckdb():
+    """
+    Set up an in-memory DuckDB instance with a small sales hierarchy.
+    """
+    connection = duckdb.connect(":memory:")
+    connection.execute(
+        "CREATE TABLE product (product_id INT, supplier VARCHAR, brand VARCHAR, family VARCHAR);"
+    )
+    connection.execute(
+        "INSERT INTO product VALUES (1, 'Acme', 'Fizz', 'Cola'), (2, 'Zenith', 'Pop', 'Lime');"
+    )
+    connection.execute(
+        "CREATE TABLE sales (product_id INT, customer_id INT, invoice_date VARCHAR, quantity INT, net_price DOUBLE);"
+    )
+    connection.execute(
+        "INSERT INTO sales VALUES (1, 1, '2024-01-05', 10, 20.0), (1, 2, '2024-02-07', 5, 10.0), (2, 1, '2024-01-09', 7, 14.0);"
+    )
+    connection.execute(
+        """
+        CREATE TABLE sales_summary_by_product_family AS
+        SELECT p.supplier, p.brand, p.family,
+            STRFTIME(CAST(s.invoice_date AS DATE), '%Y-%m') AS invoice_date_month,
+            SUM(s.quantity) AS quantity, SUM(s.net_price) AS net_amount,
+            GROUPING_ID(p.supplier, p.brand, p.family) AS grouping_set_id
+        FROM sales s JOIN product p ON s.product_id = p.product_id
+        GROUP BY GROUPING SETS (
+            (p.supplier, p.brand, p.family, STRFTIME(CAST(s.invoice_date AS DATE), '%Y-%m')),
+            (p.supplier, STRFTIME(CAST(s.invoice_date AS DATE), '%Y-%m'))
+        );
+        """
+    )
+    connection.execute(
+        "CREATE VIEW supplier_totals AS SELECT supplier, SUM(quantity) AS quantity "
+        "FROM sales_summary_by_product_family WHERE grouping_set_id = 3 GROUP BY supplier;"
+    )
+    yield connection
+    connection.close()
+
+
+def test_export_and_read_only_query(setup_duckdb, tmp_path):
+    """
+    Test that exported snapshots answer queries like the writer database.
+    """
+    DuckDBManager.set_instance_for_testing(setup_duckdb)
+    exporter = ParquetExporter(DuckDBManager(), export_dir=str(tmp_path))
+    exporter.export_snapshot()
+
+    summary_dirs = list((tmp_path).glob("snapshot-*/sales_summary_by_product_family/supplier=*"))
+    assert {path.name for path in summary_dirs} == {"supplier=Acme", "supplier=Zenith"}
+
+    reader = ReadOnlyQueryEngine(export_dir=str(tmp_path))
+    result = reader.execute_query(
+        "SELECT supplier, quantity FROM supplier_totals ORDER BY supplier;"
+    )
+    expected = setup_duckdb.execute(
+        "SELECT supplier, quantity FROM supplier_totals ORDER BY supplier;"
+    ).fetchall()
+    assert [tuple(row.values()) for row in result.to_pylist()] == expected
+
+    sales = reader.execute_query("SELECT SUM(quantity) AS quantity FROM sales;")
+    assert sales.column("quantity")[0].as_py() == 22
+
+    # The reader only reaches the snapshot's own files
+    outside = tmp_path / "outside.txt"
+    outside.write_text("secret")
+    with pytest.raises(duckdb.PermissionException):
+        reader.execute_query(f"SELECT * FROM read_text('{outside}');")
+
+
+def test_reader_follows_new_snapshots(setup_duckdb, tmp_path):
+    """
+    Test that the reader rebinds after a newer snapshot is published.
+    """
+    DuckDBManager.set_instance_for_testing(setup_duckdb)
+    exporter = ParquetExporter(DuckDBManager(), export_dir=str(tmp_path), keep_snapshots=1)
+    reader = ReadOnlyQueryEngine(export_dir=str(tmp_path))
+
+    with pytest.raises(SnapshotUnavailableError):
+        reader.execute_query("SELECT 1;")
+
+    exporter.export_snapshot()
+    first = reader.execute_query("SELECT COUNT(*) AS n FROM product;")
+    assert first.column("n")[0].as_py() == 2
+
+    setup_duckdb.execute("INSERT INTO product VALUES (3, 'Acme', 'Fizz', 'Cherry');")
+    exporter.export_snapshot()
+    second = reader.execute_query("SELECT COUNT(*) AS n FROM product;")
+    assert second.column("n")[0].as_py() == 3
+    assert len(list(tmp_path.glob("snapshot-*"))) == 1
+
+
+def test_export_reads_one_snapshot_while_edits_land(setup_duckdb, tmp_path):
+    """
+    Test that an edit committed midway through an export does not reach the
+    tables exported after it, and does not wait for the export to finish.
+    """
+    DuckDBManager.set_instance_for_testing(setup_duckdb)
+    db_manager = DuckDBManager()
+    exporter = ParquetExporter(db_manager, export_dir=str(tmp_path))
+    export_table = exporter._export_table
+
+    def export_then_edit(*args):
+        entry = export_table(*args)
+        if args[2] == "sales_summary_by_product_family":
+            db_manager.execute_query("UPDATE sales SET quantity = quantity + 100;")
+        return entry
+
+    exporter._export_table = export_then_edit
+    exporter.export_snapshot()
+
+    reader = ReadOnlyQueryEngine(export_dir=str(tmp_path))
+    sales = reader.execute_query("SELECT SUM(quantity) AS quantity FROM sales;")
+    assert sales.column("quantity")[0].as_py() == 22
+    assert setup_duckdb.execute("SELECT SUM(quantity) FROM sales;").fetchone()[0] == 322
+
+
+def test_read_only_engine_rejects_writes(tmp_path):
+    """
+    Test that the read-only mode refuses data-modifying statements.
+    """
+    reader = ReadOnlyQueryEngine(export_dir=str(tmp_path))
+    with pytest.raises(ValueError):
+        reader.execute_query("DELETE FROM sales;")
+    with pytest.raises(ValueError):
+        reader.execute_query(f"SELECT 1; COPY (SELECT 42 AS x) TO '{tmp_path / 'out.csv'}';")
+    with pytest.raises(ValueError):
+        reader.execute_query("EXPLAIN ANALYZE DELETE FROM sales;")
+    assert not (tmp_path / "out.csv").exists()
+
+
+@pytest.mark.asyncio
+async def test_export_after_n_edits(setup_duckdb, tmp_path):
+    """
+    Test that recording edits triggers a background export.
+    """
+    DuckDBManager.set_instance_for_testing(setup_duckdb)
+    exporter = ParquetExporter(DuckDBManager(), export_dir=str(tmp_path), every_n_edits=2)
+
+    exporter.record_edit()
+    assert exporter._export_task is None
+    exporter.record_edit()
+    snapshot_dir = await exporter._export_task
+
+    assert snapshot_dir is not None
+    assert exporter.edits_since_export == 0
+    assert (tmp_path / "CURRENT").read_text() in snapshot_dir
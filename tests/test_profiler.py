@@ -0,0 +1,124 @@
+import os
+
+import duckdb
+import pytest
+from Challenge.backends import get_backend
+from Challenge.DuckDBManager import DuckDBManager, get_profiler
+from Challenge.profiler import QueryProfiler, fingerprint, normalize_query
+
+
+@pytest.fixture
+def profiler():
+    """
+    Profile every statement of the shared profiler, restoring it afterwards.
+    """
+    shared = get_profiler()
+    mode = shared.status()
+    shared.reset()
+    shared.configure(enabled=True, threshold_ms=0, top_n=5, explain=True)
+    yield shared
+    shared.reset()
+    shared.configure(**mode)
+
+
+def test_fingerprint_groups_queries_by_shape():
+    """
+    Test that literals, parameters, value lists and OR-ed key groups do not
+    change a query's fingerprint while its structure does.
+    """
+    one_key = "UPDATE t SET quantity = 14 WHERE (supplier = 'Smith Ltd' AND brand IS NULL)"
+    two_keys = (
+        "update t set quantity = $1 -- edit\n"
+        "WHERE (supplier = 'O''Brien' AND brand IS NULL) OR (supplier = 'Acme' AND brand IS NULL);"
+    )
+    assert fingerprint(one_key) == fingerprint(two_keys)
+    assert fingerprint("SELECT * FROM t WHERE id IN (1, 2, 3)") == fingerprint(
+        "SELECT * FROM t WHERE id IN ($1, $2)"
+    )
+    assert fingerprint("SELECT a FROM t") != fingerprint("SELECT b FROM t")
+    assert normalize_query(one_key) == (
+        "update t set quantity = ? where (supplier = ? and brand is null)"
+    )
+
+
+def test_profiler_keeps_slowest_shapes():
+    """
+    Test that the profiler aggregates calls per shape and evicts the fastest
+    shape beyond its top N.
+    """
+    profiler = QueryProfiler(enabled=True, threshold_ms=10, top_n=2)
+    assert not profiler.is_slow(5)
+    profiler.record("SELECT 1", 20)
+    profiler.record("SELECT 2", 40, plan="plan")
+    profiler.record("SELECT a FROM t", 30)
+    profiler.record("SELECT a FROM u", 15)
+
+    report = profiler.report()
+    assert [entry["shape"] for entry in report] == ["select ?", "select a from t"]
+    assert report[0]["calls"] == 2
+    assert report[0]["max_ms"] == 40
+    assert report[0]["mean_ms"] == 30
+    assert report[0]["plan"] == "plan"
+    assert profiler.has_plan("SELECT a FROM t;")
+    assert not profiler.has_plan("SELECT 1; SELECT 2;")
+
+
+def test_execute_query_records_the_profile_of_the_run(profiler):
+    """
+    Test that execute_query records DuckDB's profile of slow reads and
+    writes from the run itself, so writes are applied once and nothing runs
+    again on the connection afterwards.
+    """
+    connection = duckdb.connect(":memory:")
+    connection.execute("CREATE TABLE t (id INT, quantity INT);")
+    DuckDBManager.set_instance_for_testing(connection)
+    db_manager = DuckDBManager()
+
+    db_manager.execute_query("INSERT INTO t VALUES ($1, $2);", [1, 10])
+    db_manager.execute_query("UPDATE t SET quantity = quantity + $1 WHERE id = $2;", [0, 1])
+    db_manager.execute_query("SELECT sum(quantity) FROM t WHERE id = $1;", [1])
+    db_manager.execute_query("INSERT INTO t VALUES (2, 20); INSERT INTO t VALUES (3, 30);")
+    db_manager.execute_query(
+        "WITH changed AS (SELECT 1 AS id) UPDATE t SET quantity = quantity + 1 "
+        "WHERE id IN (SELECT id FROM changed);"
+    )
+
+    assert connection.execute("SELECT count(*), sum(quantity) FROM t").fetchone() == (3, 61)
+    plans = {entry["shape"]: entry for entry in profiler.report()}
+    write = plans["update t set quantity = quantity + ? where id = ?"]
+    assert write["plan_kind"] == "profile"
+    assert "UPDATE" in write["plan"]
+    read = plans["select sum(quantity) from t where id = ?"]
+    assert read["plan_kind"] == "profile"
+    assert "Query Profiling Information" in read["plan"]
+    assert "sum(quantity) FROM t WHERE id" in read["plan"]
+    script = plans["insert into t values (?, ...); insert into t values (?, ...)"]
+    assert script["plan"] is None
+    cte_write = next(entry for shape, entry in plans.items() if shape.startswith("with changed"))
+    assert "UPDATE" in cte_write["plan"]
+    connection.close()
+
+
+@pytest.mark.parametrize("backend", ["native", "adbc"])
+def test_profiling_leaves_no_trace_on_the_connection(profiler, backend):
+    """
+    Test that both backends return the profile of a statement run in a
+    transaction and switch profiling off again afterwards.
+    """
+    driver = get_backend(backend)
+    conn = driver.connect(":memory:")
+    driver.execute(conn, "CREATE TABLE t (id INT);")
+    cursor = driver.begin(conn)
+    profile = {}
+    driver.execute(conn, "INSERT INTO t SELECT range FROM range(10);",
+                   cursor=cursor, profile=profile)
+
+    assert "INSERT" in profile["plan"]
+    assert not os.path.exists(driver._profiling_output())
+    result = driver.execute(
+        conn, "SELECT current_setting('enable_profiling') AS mode;", cursor=cursor
+    )
+    assert result.column("mode")[0].as_py() is None
+    driver.commit(conn, cursor)
+    cursor.close()
+    conn.close()
@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+import redis
+from Challenge.redisclient import (
+    CircuitBreaker,
+    InMemoryRedis,
+    RedisClient,
+    RedisUnavailableError,
+    _stream_pairs,
+    create_redis_client,
+    settings,
+)
+
+
+@pytest.mark.asyncio
+async def test_in_memory_streams():
+    """
+    Test XADD, XRANGE and blocking XREAD on the in-process stand-in.
+    """
+    client = create_redis_client("memory://")
+    first = await client.xadd("response_duck", {"table": "sales", "level": 1})
+    assert await client.xrange("response_duck") == [(first, {"table": "sales", "level": "1"})]
+
+    # "$" only returns entries added while the read is blocked
+    reader = asyncio.ensure_future(client.xread({"response_duck": "$"}, block=1000))
+    await asyncio.sleep(0.02)
+    second = await client.xadd("response_duck", {"table": "product"})
+    assert await reader == [["response_duck", [(second, {"table": "product"})]]]
+    assert await client.xread({"response_duck": second}, block=10) == []
+
+
+@pytest.mark.asyncio
+async def test_concurrent_xadds_share_one_pipeline():
+    """
+    Test that XADDs issued together are sent in a single pipeline.
+    """
+    stand_in = InMemoryRedis()
+    pipelines = []
+    original = stand_in.pipeline
+
+    def counting_pipeline(transaction=True):
+        pipelines.append(transaction)
+        return original(transaction)
+
+    stand_in.pipeline = counting_pipeline
+    client = RedisClient(stand_in)
+
+    entry_ids = await asyncio.gather(
+        *(client.xadd(f"response_duck:{i % 2}", {"n": i}) for i in range(10))
+    )
+    assert pipelines == [False]
+    assert len(set(entry_ids)) == 10
+    assert len(await client.xrange("response_duck:0")) == 5
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_fails_fast_and_recovers():
+    """
+    Test that repeated connection errors open the breaker, which rejects
+    calls without contacting Redis until a trial call succeeds.
+    """
+    now = [0.0]
+    stand_in = InMemoryRedis()
+    calls = []
+
+    async def flaky_ping():
+        calls.append(now[0])
+        if len(calls) <= 2:
+            raise redis.exceptions.ConnectionError("connection refused")
+        return True
+
+    stand_in.ping = flaky_ping
+    client = RedisClient(stand_in, CircuitBreaker(2, 10, clock=lambda: now[0]))
+
+    for _ in range(2):
+        with pytest.raises(redis.exceptions.ConnectionError):
+            await client.ping()
+    assert client.breaker.state == "open"
+    with pytest.raises(RedisUnavailableError):
+        await client.ping()
+    assert len(calls) == 2
+
+    now[0] = 11.0
+    assert client.breaker.state == "half_open"
+    assert await client.ping() is True
+    assert client.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_half_open_trial_is_released_by_other_errors():
+    """
+    Test that a trial call failing with a non-connection error or cancelled
+    lets the next call through instead of wedging the breaker open.
+    """
+    now = [0.0]
+    breaker = CircuitBreaker(1, 10, clock=lambda: now[0])
+    breaker.record_failure()
+    now[0] = 11.0
+    stand_in = InMemoryRedis()
+    client = RedisClient(stand_in, breaker)
+    started = asyncio.Event()
+
+    async def bad_reply():
+        raise redis.exceptions.ResponseError("WRONGTYPE")
+
+    async def hanging_ping():
+        started.set()
+        await asyncio.sleep(60)
+
+    stand_in.ping = bad_reply
+    with pytest.raises(redis.exceptions.ResponseError):
+        await client.ping()
+    stand_in.ping = hanging_ping
+    trial = asyncio.create_task(client.ping())
+    await started.wait()
+    trial.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await trial
+
+    async def ping():
+        return True
+
+    stand_in.ping = ping
+    assert await client.ping() is True
+    assert breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_idle_blocking_reads_do_not_open_the_breaker():
+    """
+    Test that a blocking read timing out on an idle stream returns no
+    entries without counting against the breaker, unlike other timeouts,
+    and that the socket timeout outlasts the longest block.
+    """
+    stand_in = InMemoryRedis()
+    client = RedisClient(stand_in, CircuitBreaker(1, 10))
+
+    async def timed_out(*args, **kwargs):
+        raise redis.exceptions.TimeoutError("Timeout reading from socket")
+
+    stand_in.xreadgroup = stand_in.xread = timed_out
+    assert await client.xreadgroup("writer", "writer", {"request_duck": ">"}, block=5000) == []
+    assert await client.xread({"reply_duck:1": "$"}, block=1000) == []
+    assert client.breaker.state == "closed"
+    with pytest.raises(redis.exceptions.TimeoutError):
+        await client.xread({"reply_duck:1": "$"})
+    assert client.breaker.state == "open"
+
+    pooled = create_redis_client("redis://localhost:6379")
+    socket_timeout = pooled.client.connection_pool.connection_kwargs["socket_timeout"]
+    assert socket_timeout > settings.REDIS_MAX_BLOCK_MS / 1000
+    await pooled.close()
+
+
+def test_stream_pairs_normalizes_resp3_replies():
+    """
+    Test that RESP3 mapping replies are returned as [stream, entries] pairs.
+    """
+    entries = [("1-0", {"data": "{}"})]
+    assert _stream_pairs({"request_duck": [entries]}) == [["request_duck", entries]]
+    assert _stream_pairs({"request_duck": entries}) == [["request_duck", entries]]
+    assert _stream_pairs([["request_duck", entries]]) == [["request_duck", entries]]
+    assert _stream_pairs(None) == []
@@ -0,0 +1,159 @@
+import asyncio
+import json
+
+import duckdb
+import pytest
+from Challenge import redislistener
+from Challenge.redislistener import DuckDBManager
+from Challenge.redisclient import create_redis_client
+from Challenge.streams import REQUEST_CONSUMER, REQUEST_GROUP, REQUEST_STREAM, response_stream
+from Challenge.writerclient import WriterClient, WriterUnavailableError
+
+
+@pytest.fixture
+def writer_setup(monkeypatch):
+    """
+    Wire a writer and an API worker to the same in-process Redis stand-in.
+    """
+    client = create_redis_client("memory://")
+    monkeypatch.setattr(redislistener, "redis_client", client)
+    connection = duckdb.connect(":memory:")
+    connection.execute(
+        "CREATE TABLE product (product_id INT PRIMARY KEY, name VARCHAR, supplier VARCHAR, brand VARCHAR, family VARCHAR);"
+    )
+    connection.execute("INSERT INTO product VALUES (1, 'Cola', 'Acme', 'Fizz', 'Soda');")
+    DuckDBManager.set_instance_for_testing(connection)
+    yield client, connection
+    connection.close()
+
+
+async def run_writer_once(client):
+    """
+    Apply the requests currently queued on the default request stream.
+    """
+    for _, entries in await client.xread({REQUEST_STREAM: "0"}, block=1000):
+        await redislistener.process_messages("default", entries)
+
+
+@pytest.mark.asyncio
+async def test_worker_forwards_update_to_writer(writer_setup):
+    """
+    Test that a forwarded update is applied by the writer, broadcast, and
+    answered on the worker's reply stream.
+    """
+    client, connection = writer_setup
+    worker = WriterClient(client, worker_id="worker-1")
+    writer = asyncio.ensure_future(run_writer_once(client))
+    reply = await worker.submit(
+        {
+            "table": "product",
+            "column": "brand",
+            "value": "Pop",
+            "where": {"all_of": [{"column": "product_id", "value": 1}]},
+        },
+        timeout=5
+    )
+    await writer
+
+    assert reply == {
+        "status_code": 200,
+        "body": {"status": "success", "message": "Updated product", "affected_rows": 1},
+    }
+    assert connection.execute("SELECT brand FROM product;").fetchall() == [("Pop",)]
+    broadcast = await client.xrange(response_stream())
+    assert broadcast[0][1]["table"] == "product"
+    await worker.close()
+
+
+@pytest.mark.asyncio
+async def test_worker_receives_writer_errors(writer_setup):
+    """
+    Test that rejected requests come back with their status code, and that a
+    missing writer surfaces as unavailable.
+    """
+    client, _ = writer_setup
+    worker = WriterClient(client, worker_id="worker-2")
+    writer = asyncio.ensure_future(run_writer_once(client))
+    reply = await worker.submit(
+        {
+            "table": "product",
+            "column": "brand",
+            "value": "Pop",
+            "where": {"all_of": [{"column": "name", "value": "Cola"}]},
+        },
+        timeout=5
+    )
+    await writer
+    assert reply["status_code"] == 400
+
+    with pytest.raises(WriterUnavailableError):
+        await worker.submit({"command": "export"}, timeout=0.05)
+    await worker.close()
+
+
+@pytest.mark.asyncio
+async def test_writer_replays_requests_sent_while_it_was_down(writer_setup):
+    """
+    Test that a restarted writer first applies the request it had read but
+    not answered, then the requests queued while it was down, in order.
+    """
+    client, connection = writer_setup
+
+    def request(column, value):
+        return {"data": json.dumps({
+            "table": "product", "column": column, "value": value,
+            "where": {"all_of": [{"column": "product_id", "value": 1}]},
+        })}
+
+    # A previous writer read the first request and stopped before answering
+    await client.ensure_group(REQUEST_STREAM, REQUEST_GROUP)
+    await client.xadd(REQUEST_STREAM, request("brand", "Pop"))
+    await client.xreadgroup(REQUEST_GROUP, REQUEST_CONSUMER, {REQUEST_STREAM: ">"})
+    await client.xadd(REQUEST_STREAM, request("brand", "Zing"))
+    await client.xadd(REQUEST_STREAM, request("family", "Cola"))
+
+    writer = asyncio.ensure_future(redislistener.listen_to_requests(export=False))
+    try:
+        for _ in range(200):
+            if connection.execute("SELECT family FROM product;").fetchone() == ("Cola",):
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        writer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await writer
+
+    assert connection.execute("SELECT brand, family FROM product;").fetchall() == [("Zing", "Cola")]
+    broadcast = await client.xrange(response_stream())
+    assert [fields["value"] for _, fields in broadcast] == ["Pop", "Zing", "Cola"]
+    pending = await client.xreadgroup(REQUEST_GROUP, REQUEST_CONSUMER, {REQUEST_STREAM: "0"})
+    assert pending == [[REQUEST_STREAM, []]]
+
+
+@pytest.mark.asyncio
+async def test_writer_with_workbooks_still_reads_the_default_stream(writer_setup):
+    """
+    Test that a writer started for explicit workbooks still answers the
+    requests workers forward on the default stream.
+    """
+    client, connection = writer_setup
+    worker = WriterClient(client, worker_id="worker-3")
+    writer = asyncio.ensure_future(redislistener.listen_to_requests(["north"], export=False))
+    try:
+        reply = await worker.submit(
+            {
+                "table": "product",
+                "column": "brand",
+                "value": "Pop",
+                "where": {"all_of": [{"column": "product_id", "value": 1}]},
+            },
+            timeout=5
+        )
+    finally:
+        writer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await writer
+        await worker.close()
+
+    assert reply["status_code"] == 200
+    assert connection.execute("SELECT brand FROM product;").fetchall() == [("Pop",)]